@@ -0,0 +1,543 @@
+import argparse
+import asyncio
+import itertools
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import discord
+
+from audio_node.protocol import (
+    CREDIT, EQ, EQ_BAND_NAMES, EQ_RESET, ERROR, FLAG, INPUT, INPUT_ID, LOAD, MIX, OPEN, STATUS, VOLUME,
+    OP_CLOSE, OP_CLOSE_INPUT, OP_CREDIT, OP_END, OP_EQ, OP_ERROR, OP_INPUT_ENDED, OP_LIMITER, OP_LOAD, OP_MIX,
+    OP_OK, OP_OPEN, OP_OPEN_INPUT, OP_PACKET, OP_SEEK, OP_START_STREAM, OP_STATUS, OP_UNMIX, OP_VOLUME,
+    encode, read_message
+)
+from utils.audio_format import EQ_BANDS, EQ_MAX_GAIN_DB, FRAME_DURATION
+from utils.errors import AudioNodeError, SessionRejectedError
+from utils.mixer_input import MixerInput
+
+OPUS_SILENCE = b'\xf8\xff\xfe'  # One frame of Opus silence
+STREAM_WINDOW = 10  # Packets a node may send ahead of playback
+
+
+class NodeConnection:
+    """The connection to one audio node, shared by every session placed on it."""
+
+    def __init__(self, path: str, timeout: float = 10.0):
+        """
+        Initializes the connection. It is opened by connect().
+
+        Args:
+            path: The path of the node's Unix socket.
+            timeout: Seconds to wait for the node to answer a request.
+        """
+        self.path = path
+        self.timeout = timeout
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.receiver: Optional[asyncio.Task] = None
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.requests = itertools.count(1)
+        self.sessions: Dict[int, 'RemoteSession'] = {}
+        # As last reported by the node, which may also serve other bots.
+        self.load = {'sessions': 0, 'pressure': 0.0, 'ffmpeg': 0}
+        self.lock = asyncio.Lock()
+
+    @property
+    def connected(self) -> bool:
+        return self.writer is not None and not self.writer.is_closing()
+
+    async def connect(self):
+        """
+        Connects to the node unless already connected.
+
+        Raises:
+            OSError: If the node is not listening.
+        """
+        async with self.lock:
+            if self.connected:
+                return
+            self.reader, self.writer = await asyncio.open_unix_connection(self.path)
+            self.receiver = asyncio.ensure_future(self._receive(self.reader, self.writer))
+
+    def send(self, op: int, guild_id: int, payload: bytes = b''):
+        """Sends a message without waiting for a reply. Messages to a lost node are dropped."""
+        if self.connected:
+            self.writer.write(encode(op, guild_id, 0, payload))
+
+    async def request(self, op: int, guild_id: int, payload: bytes = b''):
+        """
+        Sends a message and waits for the node to apply it.
+
+        Raises:
+            SessionRejectedError: If the node has no capacity for another session.
+            AudioNodeError: If the node is not connected, failed the request or did not answer in time.
+        """
+        if not self.connected:
+            raise AudioNodeError(f"Audio node {self.path} is not connected.")
+        request = next(self.requests)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request] = future
+        self.writer.write(encode(op, guild_id, request, payload))
+        try:
+            await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            raise AudioNodeError(f"Audio node {self.path} did not answer within {self.timeout:g} seconds.")
+        finally:
+            self.pending.pop(request, None)
+
+    async def _receive(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Routes replies to their requests and everything else to the session it is about."""
+        try:
+            while True:
+                op, guild_id, request, payload = await read_message(reader)
+                if op in (OP_OK, OP_ERROR):
+                    future = self.pending.get(request)
+                    if future is None or future.done():
+                        continue
+                    if op == OP_OK:
+                        future.set_result(None)
+                    else:
+                        rejected, = ERROR.unpack_from(payload)
+                        message = payload[ERROR.size:].decode(errors='replace')
+                        future.set_exception((SessionRejectedError if rejected else AudioNodeError)(message))
+                elif op == OP_LOAD:
+                    sessions, pressure, ffmpeg = LOAD.unpack(payload)
+                    self.load = {'sessions': sessions, 'pressure': pressure, 'ffmpeg': ffmpeg}
+                else:
+                    session = self.sessions.get(guild_id)
+                    if session is not None:
+                        session.dispatch(op, payload)
+        except asyncio.IncompleteReadError:
+            print(f"Audio node {self.path} closed the connection.")
+        except (ConnectionError, ValueError) as e:
+            print(f"Lost the connection to audio node {self.path}: {e}")
+        finally:
+            writer.close()
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(AudioNodeError(f"Lost the connection to audio node {self.path}."))
+            sessions, self.sessions = self.sessions, {}
+            for session in sessions.values():
+                session.lost()
+
+    async def close(self):
+        """Closes the connection. The node then closes every session of this bot."""
+        if self.receiver is not None:
+            self.receiver.cancel()
+            await asyncio.gather(self.receiver, return_exceptions=True)
+            self.receiver = None
+
+
+class NodePool:
+    """
+    Places guild sessions on a set of audio nodes.
+
+    Nodes are connected on first use. A new session goes to the reachable
+    node with the lowest encoder pressure and, among nodes under similar
+    pressure, the fewest sessions. It stays there until it is closed. A node
+    that rejects the session for lack of capacity passes it on to the next.
+    """
+
+    def __init__(self, paths: List[str]):
+        """
+        Initializes the pool.
+
+        Args:
+            paths: The Unix socket paths of the nodes.
+        """
+        self.nodes = [NodeConnection(path) for path in paths]
+        self.stats = {'placed': 0, 'rejected': 0, 'unreachable': 0}
+
+    async def open(self, guild_id: int, channel_bitrate: int, read_ahead: float, prebuffer: float) -> 'RemoteSession':
+        """
+        Opens a guild's session on the least loaded node that admits it.
+
+        Args:
+            guild_id: The ID of the guild.
+            channel_bitrate: The bitrate of the voice channel in bits per second.
+            read_ahead: Seconds of audio each player decodes ahead.
+            prebuffer: Seconds of audio each player buffers before playing.
+
+        Returns:
+            The open session.
+
+        Raises:
+            SessionRejectedError: If every reachable node is at capacity.
+            AudioNodeError: If no node is reachable.
+        """
+        reachable = []
+        for node in self.nodes:
+            try:
+                await node.connect()
+                reachable.append(node)
+            except OSError as e:
+                self.stats['unreachable'] += 1
+                print(f"Audio node {node.path} is unreachable: {e}")
+        if not reachable:
+            raise AudioNodeError("No audio node is reachable right now. Please try again later.")
+        # Pressure is noisy, so nodes within a tenth of each other are ranked by their sessions.
+        reachable.sort(key=lambda node: (round(node.load['pressure'], 1), node.load['sessions']))
+        for node in reachable:
+            session = RemoteSession(node, guild_id, read_ahead)
+            try:
+                await session.open(channel_bitrate, read_ahead, prebuffer)
+            except SessionRejectedError:
+                self.stats['rejected'] += 1
+                continue
+            # Counted until the node's next load report.
+            node.load['sessions'] += 1
+            self.stats['placed'] += 1
+            return session
+        raise SessionRejectedError("Every audio node is at capacity right now. Please try again later.")
+
+    async def close(self):
+        """Closes the connection to every node."""
+        for node in self.nodes:
+            await node.close()
+
+    def report(self) -> str:
+        """Formats the load of every node and the placement counters."""
+        lines = [
+            f"{len(self.nodes)} audio nodes; {self.stats['placed']} sessions placed, "
+            f"{self.stats['rejected']} rejected by a full node, {self.stats['unreachable']} failed connects"
+        ]
+        for node in self.nodes:
+            if node.connected:
+                lines.append(
+                    f"{node.path}: {node.load['sessions']} sessions ({len(node.sessions)} of this bot), "
+                    f"pressure {node.load['pressure']:.2f}, {node.load['ffmpeg']} FFmpeg processes"
+                )
+            else:
+                lines.append(f"{node.path}: not connected")
+        return '\n'.join(lines)
+
+
+class RemoteSession:
+    """
+    A guild's audio running on a node.
+
+    It offers the parts of the mixer, DSP chain and player interface the cog
+    uses, so a GuildSession can switch to it without the commands noticing.
+    """
+
+    def __init__(self, node: NodeConnection, guild_id: int, read_ahead: float):
+        """
+        Initializes the session. It is opened by open().
+
+        Args:
+            node: The connection to the node the session runs on.
+            guild_id: The ID of the guild.
+            read_ahead: Seconds of audio each player decodes ahead.
+        """
+        self.node = node
+        self.guild_id = guild_id
+        self.high_water = max(1, round(read_ahead / FRAME_DURATION))
+        self.mixer = RemoteMixer(self)
+        self.dsp = RemoteDSP(self)
+        self.players: Dict[int, RemotePlayer] = {}
+        self.stream: Optional[NodeSource] = None
+        self.inputs = itertools.count(1)
+        self.connected = False
+
+    def send(self, op: int, payload: bytes = b''):
+        self.node.send(op, self.guild_id, payload)
+
+    async def request(self, op: int, payload: bytes = b''):
+        await self.node.request(op, self.guild_id, payload)
+
+    async def open(self, channel_bitrate: int, read_ahead: float, prebuffer: float):
+        """
+        Creates the session on the node.
+
+        Raises:
+            SessionRejectedError: If the node has no capacity for it.
+            AudioNodeError: If the node failed to open it.
+        """
+        self.node.sessions[self.guild_id] = self
+        try:
+            await self.request(OP_OPEN, OPEN.pack(channel_bitrate, read_ahead, prebuffer))
+        except Exception:
+            if self.node.sessions.get(self.guild_id) is self:
+                del self.node.sessions[self.guild_id]
+            raise
+        self.connected = True
+
+    def create_player(self, source: str) -> 'RemotePlayer':
+        """Creates a player that decodes a source on the node."""
+        return RemotePlayer(self, next(self.inputs), source)
+
+    def start_stream(self, loop: asyncio.AbstractEventLoop) -> 'NodeSource':
+        """Asks the node to stream the mixer and returns the audio source that plays the packets."""
+        if self.stream is not None:
+            self.stream.finish()
+        self.stream = NodeSource(self, loop)
+        self.send(OP_START_STREAM, CREDIT.pack(STREAM_WINDOW))
+        return self.stream
+
+    def dispatch(self, op: int, payload: bytes):
+        """Handles a message the node sent about this session."""
+        if op == OP_PACKET:
+            if self.stream is not None:
+                self.stream.packets.put(payload)
+        elif op == OP_END:
+            if self.stream is not None:
+                self.stream.finish()
+        elif op == OP_INPUT_ENDED:
+            self.mixer.input_ended(INPUT_ID.unpack(payload)[0])
+        elif op == OP_STATUS:
+            input_id, *status = STATUS.unpack(payload)
+            player = self.players.get(input_id)
+            if player is not None:
+                player.update(*status)
+
+    def lost(self):
+        """Ends the stream after the connection to the node dropped, taking every input with it."""
+        self.connected = False
+        self.mixer.inputs = []
+        self.players.clear()
+        if self.stream is not None:
+            self.stream.finish()
+
+    async def close(self):
+        """Closes the session on the node, which stops its players and frees its encoder."""
+        if self.node.sessions.get(self.guild_id) is self:
+            del self.node.sessions[self.guild_id]
+        if self.connected:
+            self.connected = False
+            try:
+                await self.request(OP_CLOSE)
+            except AudioNodeError as e:
+                print(f"Closing the session of guild {self.guild_id} on {self.node.path} failed: {e}")
+        if self.stream is not None:
+            self.stream.finish()
+
+
+class RemoteMixer:
+    """Controls the mixer of a node session through the interface of a local Mixer."""
+
+    def __init__(self, session: RemoteSession):
+        self.session = session
+        self.inputs: List[MixerInput] = []
+
+    def add(self, player: 'RemotePlayer', gain: float = 1.0, ducks: bool = False,
+            on_end: Optional[Callable[[MixerInput], None]] = None) -> MixerInput:
+        """
+        Adds a started player to the node's mixer.
+
+        Returns:
+            The input, which can be passed to remove().
+        """
+        mixer_input = MixerInput(player, gain, ducks, on_end)
+        self.inputs = self.inputs + [mixer_input]
+        self.session.send(OP_MIX, MIX.pack(player.input_id, gain, ducks))
+        return mixer_input
+
+    def remove(self, mixer_input: MixerInput):
+        """Removes an input without calling its on_end callback."""
+        self.inputs = [other for other in self.inputs if other is not mixer_input]
+        self.session.send(OP_UNMIX, INPUT_ID.pack(mixer_input.player.input_id))
+
+    def input_ended(self, input_id: int):
+        """Removes an input the node ran out of frames for and calls its on_end callback."""
+        for mixer_input in self.inputs:
+            if mixer_input.player.input_id == input_id:
+                self.inputs = [other for other in self.inputs if other is not mixer_input]
+                if mixer_input.on_end is not None:
+                    mixer_input.on_end(mixer_input)
+                return
+
+    async def stop(self):
+        """Stops and removes every input."""
+        inputs, self.inputs = self.inputs, []
+        for mixer_input in inputs:
+            await mixer_input.player.stop()
+
+
+class RemoteDSP:
+    """Mirrors the settings of a node session's DSP chain and forwards every change to it."""
+
+    def __init__(self, session: RemoteSession):
+        self.session = session
+        self.target_volume = 1.0
+        self.eq_gains: Dict[str, float] = {band: 0.0 for band in EQ_BANDS}
+        self._limiter_enabled = True
+
+    @property
+    def limiter_enabled(self) -> bool:
+        return self._limiter_enabled
+
+    @limiter_enabled.setter
+    def limiter_enabled(self, enabled: bool):
+        self._limiter_enabled = enabled
+        self.session.send(OP_LIMITER, FLAG.pack(enabled))
+
+    def set_volume(self, volume: float):
+        """Sets the volume, where 1.0 leaves the signal unchanged."""
+        self.target_volume = max(0.0, volume)
+        self.session.send(OP_VOLUME, VOLUME.pack(self.target_volume))
+
+    def set_eq(self, band: str, gain_db: float):
+        """Sets the gain of an EQ band in dB, clamped to ±EQ_MAX_GAIN_DB."""
+        self.eq_gains[band] = max(-EQ_MAX_GAIN_DB, min(EQ_MAX_GAIN_DB, gain_db))
+        self.session.send(OP_EQ, EQ.pack(EQ_BAND_NAMES.index(band), self.eq_gains[band]))
+
+    def reset_eq(self):
+        """Sets every EQ band back to 0 dB."""
+        self.eq_gains = {band: 0.0 for band in EQ_BANDS}
+        self.session.send(OP_EQ, EQ.pack(EQ_RESET, 0.0))
+
+
+class RemotePlayer:
+    """
+    A source decoding on a node, with the interface of a local MusicPlayer.
+
+    Position, buffer fill and underruns are the values last reported by the
+    node, so they lag playback by up to one status interval.
+    """
+
+    def __init__(self, session: RemoteSession, input_id: int, source: str):
+        self.session = session
+        self.input_id = input_id
+        self.source = source
+        self.position = 0.0
+        self.buffered = 0.0
+        self.underruns = 0
+        self.buffering = True
+        self.high_water = session.high_water
+
+    async def play_song(self, position: float = 0.0):
+        """
+        Starts decoding the source on the node.
+
+        Raises:
+            AudioNodeError: If the node could not start FFmpeg.
+        """
+        self.session.players[self.input_id] = self
+        try:
+            await self.session.request(OP_OPEN_INPUT, INPUT.pack(self.input_id, position) + self.source.encode())
+        except Exception:
+            self.session.players.pop(self.input_id, None)
+            raise
+        self.position = position
+
+    async def seek(self, position: float):
+        """Restarts decoding on the node at another position."""
+        await self.session.request(OP_SEEK, INPUT.pack(self.input_id, position))
+        self.position = position
+
+    async def stop(self):
+        """Stops the player's FFmpeg process on the node."""
+        self.session.players.pop(self.input_id, None)
+        self.session.send(OP_CLOSE_INPUT, INPUT_ID.pack(self.input_id))
+
+    def update(self, position: float, buffered: float, underruns: int, buffering: bool, high_water: int):
+        """Applies a status report from the node."""
+        self.position = position
+        self.buffered = buffered
+        self.underruns = underruns
+        self.buffering = buffering
+        self.high_water = high_water
+
+
+class NodeSource(discord.AudioSource):
+    """Plays the Opus packets a node streams for a guild, granting it credit as they are played."""
+
+    def __init__(self, session: RemoteSession, loop: asyncio.AbstractEventLoop):
+        """
+        Initializes the source.
+
+        Args:
+            session: The session whose stream is played.
+            loop: The event loop the session's connection belongs to.
+        """
+        self.session = session
+        self.loop = loop
+        # Filled on the event loop, drained by the voice client's audio thread.
+        self.packets = queue.Queue()
+        self.done = False
+        self.played = 0
+        self.late = 0
+
+    def finish(self):
+        """Ends the stream once the packets received so far have been played."""
+        self.packets.put(b'')
+
+    def read(self) -> bytes:
+        # Called from the voice client's audio thread.
+        if self.done:
+            return b''
+        try:
+            packet = self.packets.get(timeout=FRAME_DURATION / 2)
+        except queue.Empty:
+            # The node fell behind; keep the voice connection fed rather than ending the stream.
+            self.late += 1
+            return OPUS_SILENCE
+        if not packet:
+            self.done = True
+            return b''
+        self.played += 1
+        if self.played % (STREAM_WINDOW // 2) == 0:
+            self.loop.call_soon_threadsafe(self.session.send, OP_CREDIT, CREDIT.pack(STREAM_WINDOW // 2))
+        return packet
+
+    def is_opus(self) -> bool:
+        return True
+
+
+async def demo(paths: List[str], source: str, guilds: int, seconds: float):
+    """
+    Plays a source for several guilds through a pool of running nodes and reports where they were placed.
+
+    Each stream is consumed in real time by a thread, like a voice client would.
+    """
+    pool = NodePool(paths)
+    loop = asyncio.get_running_loop()
+    streams = []
+    for guild_id in range(1, guilds + 1):
+        session = await pool.open(guild_id, 96000, 2.0, 0.5)
+        player = session.create_player(source)
+        await player.play_song()
+        session.mixer.add(player)
+        streams.append((session, session.start_stream(loop)))
+
+    def consume(stream: NodeSource, results: list):
+        packets = 0
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            packet = stream.read()
+            if not packet:
+                break
+            packets += packet != OPUS_SILENCE
+            time.sleep(FRAME_DURATION)
+        results.append(packets)
+
+    results = []
+    threads = [threading.Thread(target=consume, args=(stream, results)) for _, stream in streams]
+    for thread in threads:
+        thread.start()
+    await asyncio.sleep(seconds / 2)
+    print(pool.report())
+    for session, _ in streams:
+        player = next(iter(session.players.values()), None)
+        if player is not None:
+            print(f"Guild {session.guild_id} on {session.node.path}: at {player.position:.1f} s, "
+                  f"{player.buffered:.2f} s buffered, {player.underruns} underruns")
+    await loop.run_in_executor(None, lambda: [thread.join() for thread in threads])
+    late = sum(stream.late for _, stream in streams)
+    print(f"{sum(results)} packets played by {guilds} guilds in {seconds:g} s, {late} late")
+    for session, _ in streams:
+        await session.close()
+    await pool.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Plays a source through running audio nodes.")
+    parser.add_argument('paths', nargs='+', help="The Unix sockets of the nodes.")
+    parser.add_argument('--source', required=True, help="A URL or file FFmpeg can read.")
+    parser.add_argument('--guilds', type=int, default=4, help="How many guild sessions to open.")
+    parser.add_argument('--seconds', type=float, default=5.0, help="How long to play.")
+    arguments = parser.parse_args()
+    asyncio.run(demo(arguments.paths, arguments.source, arguments.guilds, arguments.seconds))
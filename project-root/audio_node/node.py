@@ -0,0 +1,372 @@
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from audio_node.protocol import (
+    CREDIT, EQ, EQ_BAND_NAMES, EQ_RESET, ERROR, FLAG, INPUT, INPUT_ID, LOAD, MIX, OPEN, STATUS, VOLUME,
+    OP_CLOSE, OP_CLOSE_INPUT, OP_CREDIT, OP_END, OP_EQ, OP_ERROR, OP_INPUT_ENDED, OP_LIMITER, OP_LOAD, OP_MIX,
+    OP_OK, OP_OPEN, OP_OPEN_INPUT, OP_PACKET, OP_SEEK, OP_START_STREAM, OP_STATUS, OP_UNMIX, OP_VOLUME,
+    encode, read_message
+)
+from utils.dsp import DSPChain
+from utils.encoder_scheduler import EncoderScheduler, EncoderSession
+from utils.errors import AudioNodeError, SessionRejectedError
+from utils.ffmpeg_supervisor import FFmpegSupervisor
+from utils.mixer import Mixer, MixerInput
+from utils.music_player import MusicPlayer
+
+
+class NodeSession:
+    """The audio of one guild on a node: its players, mixer, DSP chain and Opus encoder."""
+
+    def __init__(self, guild_id: int, writer: asyncio.StreamWriter, encoder: EncoderSession,
+                 read_ahead: float, prebuffer: float):
+        """
+        Initializes the session.
+
+        Args:
+            guild_id: The ID of the guild the session belongs to.
+            writer: The connection of the bot that opened the session.
+            encoder: The encoder session admitted by the node's scheduler.
+            read_ahead: Seconds of audio each player decodes ahead.
+            prebuffer: Seconds of audio each player buffers before playing.
+        """
+        self.guild_id = guild_id
+        self.writer = writer
+        self.encoder = encoder
+        self.read_ahead = read_ahead
+        self.prebuffer = prebuffer
+        self.dsp = DSPChain()
+        self.mixer = Mixer(self.dsp)
+        self.players: Dict[int, MusicPlayer] = {}
+        self.inputs: Dict[int, MixerInput] = {}
+        self.streamer: Optional[asyncio.Task] = None
+        self.credits = 0
+        self.credit = asyncio.Event()
+        self.closed = False
+
+    def send(self, op: int, payload: bytes = b''):
+        """Sends a message about this session to the bot."""
+        if not self.writer.is_closing():
+            self.writer.write(encode(op, self.guild_id, 0, payload))
+
+    def grant(self, credits: int):
+        """Allows the streamer to send more packets."""
+        self.credits += credits
+        self.credit.set()
+
+
+class AudioNode:
+    """
+    A standalone process that decodes, mixes and encodes audio for bots.
+
+    Bots connect over a Unix socket and open one session per guild. The node
+    runs FFmpeg, the mixer, the DSP chain and the Opus encoder of every
+    session and streams finished Opus packets back, so the bot's event loop
+    only forwards packets to the voice connection. Packets are sent against
+    credit granted by the bot as it plays them, which paces decoding to
+    playback. Sessions are admitted by the node's own encoder scheduler, and
+    every session of a bot is closed when its connection drops.
+
+    The messages of each guild are applied one after another in the order
+    they arrived, while different guilds proceed independently, so one
+    guild waiting on FFmpeg never holds up another.
+    """
+
+    def __init__(self, path: str, supervisor: Optional[FFmpegSupervisor] = None,
+                 scheduler: Optional[EncoderScheduler] = None, status_interval: float = 0.5):
+        """
+        Initializes the node.
+
+        Args:
+            path: The path of the Unix socket to listen on.
+            supervisor: The supervisor that runs the FFmpeg processes.
+            scheduler: The scheduler that admits sessions and tunes their encoders.
+                Defaults to a budget of one core, since the node encodes on its event loop's thread.
+            status_interval: How often player status and node load are reported, in seconds.
+        """
+        self.path = path
+        self.supervisor = supervisor or FFmpegSupervisor()
+        self.scheduler = scheduler or EncoderScheduler(cores=1)
+        self.status_interval = status_interval
+        self.connections: Dict[asyncio.StreamWriter, Dict[int, NodeSession]] = {}
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.heartbeat: Optional[asyncio.Task] = None
+
+    @property
+    def sessions(self) -> int:
+        """The number of open sessions across all connections."""
+        return sum(len(sessions) for sessions in self.connections.values())
+
+    async def start(self):
+        """
+        Starts listening on the socket.
+
+        The socket is only accessible to the user running the node, since
+        anyone who can connect can make the node open any source.
+
+        Raises:
+            OSError: If another node is already listening on the path.
+        """
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except OSError:
+                os.unlink(self.path)  # Left behind by a node that did not shut down cleanly
+            else:
+                raise OSError(f"Another audio node is listening on {self.path}.")
+            finally:
+                probe.close()
+        # Create the socket with mode 0600 rather than chmod it afterwards, which would leave a window.
+        umask = os.umask(0o177)
+        try:
+            self.server = await asyncio.start_unix_server(self.handle, self.path)
+        finally:
+            os.umask(umask)
+        self.heartbeat = asyncio.ensure_future(self._heartbeat())
+        print(f"Audio node listening on {self.path}")
+
+    async def close(self):
+        """Stops listening, closes every session and stops every FFmpeg process."""
+        if self.heartbeat is not None:
+            self.heartbeat.cancel()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for writer in list(self.connections):
+            writer.close()
+        # Each connection's handler closes its sessions once it sees the connection close.
+        while self.connections:
+            await asyncio.sleep(0.05)
+        await self.supervisor.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serves one bot connection until it closes."""
+        sessions: Dict[int, NodeSession] = {}
+        # Messages of each guild waiting to be applied, drained in order by one task per guild
+        pending: Dict[int, Deque[Tuple[int, int, bytes]]] = {}
+        self.connections[writer] = sessions
+        try:
+            while True:
+                op, guild_id, request, payload = await read_message(reader)
+                if op == OP_CREDIT and guild_id in sessions:
+                    # Credit only adds up, so it can skip ahead of a guild's slow requests
+                    # instead of starving its stream while a seek waits on FFmpeg.
+                    sessions[guild_id].grant(CREDIT.unpack(payload)[0])
+                    continue
+                queue = pending.get(guild_id)
+                if queue is None:
+                    queue = pending[guild_id] = deque()
+                    asyncio.ensure_future(self._drain(sessions, pending, writer, guild_id))
+                queue.append((op, request, payload))
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            del self.connections[writer]
+            writer.close()
+            for queue in pending.values():
+                queue.clear()
+            if sessions:
+                print(f"Bot disconnected; closing {len(sessions)} sessions.")
+            for session in list(sessions.values()):
+                await self._close_session(sessions, session)
+
+    async def _drain(self, sessions: Dict[int, NodeSession], pending: Dict[int, Deque[Tuple[int, int, bytes]]],
+                     writer: asyncio.StreamWriter, guild_id: int):
+        """Applies the queued messages of a guild in order until none are left."""
+        queue = pending[guild_id]
+        try:
+            while queue:
+                op, request, payload = queue.popleft()
+                await self._serve(sessions, writer, op, guild_id, request, payload)
+        finally:
+            del pending[guild_id]
+
+    async def _serve(self, sessions: Dict[int, NodeSession], writer: asyncio.StreamWriter,
+                     op: int, guild_id: int, request: int, payload: bytes):
+        """Applies a message and replies to it if the bot asked for a reply."""
+        try:
+            await self._apply(sessions, writer, op, guild_id, payload)
+        except Exception as e:
+            if request and not writer.is_closing():
+                rejected = isinstance(e, SessionRejectedError)
+                writer.write(encode(OP_ERROR, guild_id, request, ERROR.pack(rejected) + str(e).encode()))
+            else:
+                print(f"Message {op} for guild {guild_id} failed: {e}")
+        else:
+            if request and not writer.is_closing():
+                writer.write(encode(OP_OK, guild_id, request))
+
+    async def _apply(self, sessions: Dict[int, NodeSession], writer: asyncio.StreamWriter,
+                     op: int, guild_id: int, payload: bytes):
+        if op == OP_OPEN:
+            channel_bitrate, read_ahead, prebuffer = OPEN.unpack(payload)
+            existing = sessions.pop(guild_id, None)
+            if existing is not None:
+                await self._close_session(sessions, existing)
+            encoder = self.scheduler.admit(guild_id, channel_bitrate)
+            sessions[guild_id] = NodeSession(guild_id, writer, encoder, read_ahead, prebuffer)
+            return
+
+        session = sessions.get(guild_id)
+        if session is None:
+            raise AudioNodeError(f"The node has no session for guild {guild_id}.")
+        if op == OP_CLOSE:
+            await self._close_session(sessions, session)
+        elif op == OP_OPEN_INPUT:
+            input_id, position = INPUT.unpack_from(payload)
+            source = payload[INPUT.size:].decode()
+            player = MusicPlayer(source, self.supervisor, high_water=session.read_ahead, low_water=session.prebuffer)
+            await player.play_song(position)
+            if session.closed:
+                # The connection dropped while FFmpeg was starting.
+                await player.stop()
+                raise AudioNodeError(f"The session of guild {guild_id} was closed.")
+            previous = session.players.pop(input_id, None)
+            session.players[input_id] = player
+            if previous is not None:
+                await previous.stop()
+        elif op == OP_MIX:
+            input_id, gain, ducks = MIX.unpack(payload)
+            session.inputs[input_id] = session.mixer.add(
+                session.players[input_id], gain=gain, ducks=ducks,
+                on_end=lambda mixer_input: self._input_ended(session, input_id)
+            )
+        elif op == OP_UNMIX:
+            mixer_input = session.inputs.pop(INPUT_ID.unpack(payload)[0], None)
+            if mixer_input is not None:
+                session.mixer.remove(mixer_input)
+        elif op == OP_CLOSE_INPUT:
+            input_id, = INPUT_ID.unpack(payload)
+            mixer_input = session.inputs.pop(input_id, None)
+            if mixer_input is not None:
+                session.mixer.remove(mixer_input)
+            player = session.players.pop(input_id, None)
+            if player is not None:
+                await player.stop()
+        elif op == OP_SEEK:
+            input_id, position = INPUT.unpack(payload)
+            await session.players[input_id].seek(position)
+        elif op == OP_VOLUME:
+            session.dsp.set_volume(VOLUME.unpack(payload)[0])
+        elif op == OP_EQ:
+            band, gain_db = EQ.unpack(payload)
+            if band == EQ_RESET:
+                session.dsp.reset_eq()
+            else:
+                session.dsp.set_eq(EQ_BAND_NAMES[band], gain_db)
+        elif op == OP_LIMITER:
+            session.dsp.limiter_enabled = FLAG.unpack(payload)[0]
+        elif op == OP_START_STREAM:
+            if session.streamer is not None:
+                session.streamer.cancel()
+            session.credits = 0
+            session.grant(CREDIT.unpack(payload)[0])
+            session.streamer = asyncio.ensure_future(self._stream(session))
+        elif op == OP_CREDIT:
+            session.grant(CREDIT.unpack(payload)[0])
+        else:
+            raise AudioNodeError(f"Unknown opcode {op}.")
+
+    def _input_ended(self, session: NodeSession, input_id: int):
+        """Stops the player of an input that has no more frames and tells the bot."""
+        session.inputs.pop(input_id, None)
+        player = session.players.pop(input_id, None)
+        if player is not None:
+            asyncio.ensure_future(player.stop())
+        session.send(OP_INPUT_ENDED, INPUT_ID.pack(input_id))
+
+    async def _stream(self, session: NodeSession):
+        """Mixes, encodes and sends packets while the bot has credit left, until the mixer ends."""
+        try:
+            while True:
+                while session.credits <= 0:
+                    session.credit.clear()
+                    await session.credit.wait()
+                start_wall = time.perf_counter()
+                pcm = await session.mixer.read_frame()
+                if not pcm:
+                    session.send(OP_END)
+                    return
+                start_cpu = time.thread_time()
+                packet = session.encoder.encode(pcm)
+                cpu = time.thread_time() - start_cpu + session.mixer.last_cpu
+                self.scheduler.record(session.encoder, cpu, time.perf_counter() - start_wall)
+                session.credits -= 1
+                session.send(OP_PACKET, packet)
+                await session.writer.drain()
+                # Give the other sessions a turn between frames.
+                await asyncio.sleep(0)
+        except ConnectionError:
+            pass
+
+    async def _close_session(self, sessions: Dict[int, NodeSession], session: NodeSession):
+        """Stops a session's stream and players and returns its encoder's share of the CPU."""
+        session.closed = True
+        if sessions.get(session.guild_id) is session:
+            del sessions[session.guild_id]
+        if session.streamer is not None:
+            session.streamer.cancel()
+            session.streamer = None
+        session.inputs.clear()
+        await session.mixer.stop()
+        players, session.players = session.players, {}
+        for player in players.values():
+            await player.stop()
+        self.scheduler.release(session.guild_id, session.encoder)
+
+    async def _heartbeat(self):
+        """Reports the node's load and the position and buffer of every player."""
+        while True:
+            await asyncio.sleep(self.status_interval)
+            load = encode(OP_LOAD, payload=LOAD.pack(self.sessions, self.scheduler.pressure(), self.supervisor.live))
+            for writer, sessions in list(self.connections.items()):
+                if writer.is_closing():
+                    continue
+                writer.write(load)
+                for session in sessions.values():
+                    for input_id, player in session.players.items():
+                        session.send(OP_STATUS, STATUS.pack(
+                            input_id, player.position, player.buffered, player.underruns,
+                            player.buffering, player.high_water
+                        ))
+
+    def report(self) -> str:
+        """Formats the node's sessions, encoder load and FFmpeg processes."""
+        return f"{self.sessions} sessions on {len(self.connections)} connections\n" \
+               f"{self.scheduler.report()}\n{self.supervisor.report()}"
+
+
+async def main(path: str, cores: int, niceness: int):
+    """Runs a node until it is interrupted or terminated."""
+    node = AudioNode(path, FFmpegSupervisor(niceness=niceness), EncoderScheduler(cores))
+    await node.start()
+    stopped = asyncio.Event()
+    # Stop cleanly on SIGTERM too, so no FFmpeg process outlives the node.
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stopped.set)
+    try:
+        await stopped.wait()
+    finally:
+        print(node.report())
+        await node.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Runs an audio node that Melody offloads playback to.")
+    parser.add_argument('--socket', default='/tmp/melody-audio.sock', help="The Unix socket to listen on.")
+    parser.add_argument('--cores', type=int, default=1,
+                        help="Cores the encoder budget is based on. A node encodes on one thread, so this defaults to 1.")
+    parser.add_argument('--niceness', type=int, default=0, help="How much to lower the priority of FFmpeg.")
+    arguments = parser.parse_args()
+    try:
+        asyncio.run(main(arguments.socket, arguments.cores, arguments.niceness))
+    except KeyboardInterrupt:
+        pass
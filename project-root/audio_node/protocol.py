@@ -0,0 +1,72 @@
+import asyncio
+import struct
+from typing import Tuple
+
+from utils.audio_format import EQ_BANDS
+
+# Every message starts with this header: payload length, opcode, guild ID and
+# request ID. Requests that expect a reply carry a non-zero request ID, which
+# the OK or ERROR reply repeats. Numbers are big-endian.
+HEADER = struct.Struct('!IBQI')
+MAX_PAYLOAD = 1024 * 1024
+
+# Bot -> node
+OP_OPEN = 1  # OPEN: create the guild's session
+OP_CLOSE = 2  # (empty): close the guild's session and free its encoder
+OP_OPEN_INPUT = 3  # INPUT + UTF-8 source: start decoding a source
+OP_MIX = 4  # MIX: add a started input to the mixer
+OP_UNMIX = 5  # INPUT_ID: take an input out of the mixer
+OP_CLOSE_INPUT = 6  # INPUT_ID: stop an input's FFmpeg process
+OP_SEEK = 7  # INPUT: restart an input at another position
+OP_VOLUME = 8  # VOLUME
+OP_EQ = 9  # EQ
+OP_LIMITER = 10  # FLAG
+OP_START_STREAM = 11  # CREDIT: start streaming Opus packets, allowing this many in flight
+OP_CREDIT = 12  # CREDIT: allow more packets in flight
+
+# Node -> bot
+OP_OK = 64  # (empty): the request succeeded
+OP_ERROR = 65  # ERROR + UTF-8 message: the request failed
+OP_PACKET = 66  # Opus packet: the next 20 ms of the guild's stream
+OP_END = 67  # (empty): the guild's mixer ran out of inputs and the stream ended
+OP_INPUT_ENDED = 68  # INPUT_ID: an input has no more frames
+OP_STATUS = 69  # STATUS: position and buffer of an input
+OP_LOAD = 70  # LOAD: the node's load, sent periodically with guild ID 0
+
+OPEN = struct.Struct('!Iff')  # Channel bitrate, read-ahead seconds, prebuffer seconds
+INPUT = struct.Struct('!Id')  # Input ID, position in seconds
+INPUT_ID = struct.Struct('!I')  # Input ID
+MIX = struct.Struct('!If?')  # Input ID, gain, ducks
+VOLUME = struct.Struct('!f')  # Volume
+EQ = struct.Struct('!Bf')  # Band index (EQ_RESET resets every band), gain in dB
+FLAG = struct.Struct('!?')
+CREDIT = struct.Struct('!I')  # Packets
+STATUS = struct.Struct('!IdfI?I')  # Input ID, position, seconds buffered, underruns, buffering, read-ahead frames
+LOAD = struct.Struct('!IfI')  # Sessions, encoder pressure, live FFmpeg processes
+ERROR = struct.Struct('!?')  # Whether the node rejected a session for lack of capacity
+
+EQ_RESET = 255
+EQ_BAND_NAMES = tuple(EQ_BANDS)  # EQ band indices refer to this order
+
+
+def encode(op: int, guild_id: int = 0, request: int = 0, payload: bytes = b'') -> bytes:
+    """Builds a message."""
+    return HEADER.pack(len(payload), op, guild_id, request) + payload
+
+
+async def read_message(reader: asyncio.StreamReader) -> Tuple[int, int, int, bytes]:
+    """
+    Reads the next message.
+
+    Returns:
+        A tuple of opcode, guild ID, request ID and payload.
+
+    Raises:
+        asyncio.IncompleteReadError: If the connection closed.
+        ValueError: If the message is larger than MAX_PAYLOAD.
+    """
+    length, op, guild_id, request = HEADER.unpack(await reader.readexactly(HEADER.size))
+    if length > MAX_PAYLOAD:
+        raise ValueError(f"Message of {length} bytes exceeds the protocol limit.")
+    payload = await reader.readexactly(length) if length else b''
+    return op, guild_id, request, payload
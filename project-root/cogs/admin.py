@@ -1,10 +1,11 @@
 import discord
 from discord.ext import commands
-import requests
 from utils.database import Database
 from utils.errors import CommandError
 from utils.helper import get_prefix
 from utils.embeds import Embeds
+from utils.message_scheduler import PRIORITY_HIGH
+from utils.startup import startup
 
 class AdminCog(commands.Cog):
     """Cog for handling administrative commands."""
@@ -15,6 +16,7 @@ class AdminCog(commands.Cog):
         self.database = Database(self.config.get('database_path'))
         self.database.connect()  # Connect to the database
         self.embeds = Embeds()  # Initialize embed class
+        self.messages = bot.messages
 
     @commands.command(name='load', hidden=True)
     @commands.is_owner()
@@ -22,9 +24,9 @@ class AdminCog(commands.Cog):
         """Loads a cog."""
         try:
             self.bot.load_extension(f'cogs.{cog}')
-            await ctx.send(embed=self.embeds.success_embed(f'Loaded cog: {cog}'))
+            self.messages.post(ctx, embed=self.embeds.success_embed(f'Loaded cog: {cog}'))
         except Exception as e:
-            await ctx.send(embed=self.embeds.error_embed(f'Failed to load cog: {cog}\n{e}'))
+            self.messages.post(ctx, embed=self.embeds.error_embed(f'Failed to load cog: {cog}\n{e}'), priority=PRIORITY_HIGH)
 
     @commands.command(name='unload', hidden=True)
     @commands.is_owner()
@@ -32,19 +34,47 @@ class AdminCog(commands.Cog):
         """Unloads a cog."""
         try:
             self.bot.unload_extension(f'cogs.{cog}')
-            await ctx.send(embed=self.embeds.success_embed(f'Unloaded cog: {cog}'))
+            self.messages.post(ctx, embed=self.embeds.success_embed(f'Unloaded cog: {cog}'))
         except Exception as e:
-            await ctx.send(embed=self.embeds.error_embed(f'Failed to unload cog: {cog}\n{e}'))
+            self.messages.post(ctx, embed=self.embeds.error_embed(f'Failed to unload cog: {cog}\n{e}'), priority=PRIORITY_HIGH)
 
     @commands.command(name='reload', hidden=True)
     @commands.is_owner()
     async def reload(self, ctx, cog: str):
-        """Reloads a cog."""
+        """Reloads a cog, handing live state such as playing music sessions to the new instance."""
+        extension = f'cogs.{cog}'
+        exported = []
         try:
-            self.bot.reload_extension(f'cogs.{cog}')
-            await ctx.send(embed=self.embeds.success_embed(f'Reloaded cog: {cog}'))
+            for instance in list(self.bot.cogs.values()):
+                export_state = getattr(instance, 'export_state', None)
+                if type(instance).__module__ == extension and export_state is not None:
+                    self.bot.handoff[instance.qualified_name] = export_state()
+                    exported.append(instance.qualified_name)
+            self.bot.reload_extension(extension)
+            self.messages.post(ctx, embed=self.embeds.success_embed(f'Reloaded cog: {cog}'))
         except Exception as e:
-            await ctx.send(embed=self.embeds.error_embed(f'Failed to reload cog: {cog}\n{e}'))
+            # State nobody adopted must not be picked up by a later, unrelated load.
+            for name in exported:
+                self.bot.handoff.pop(name, None)
+            self.messages.post(ctx, embed=self.embeds.error_embed(f'Failed to reload cog: {cog}\n{e}'), priority=PRIORITY_HIGH)
+
+    @commands.command(name='startup', hidden=True)
+    @commands.is_owner()
+    async def startup_report(self, ctx):
+        """Shows how long imports and initialization took, including lazily loaded backends."""
+        self.messages.post(ctx, embed=self.embeds.info_embed(f"```\n{startup.render()}\n```"))
+
+    @commands.command(name='encoders', hidden=True)
+    @commands.is_owner()
+    async def encoders(self, ctx):
+        """Shows the CPU cost, deadline misses and encoder settings of every voice session."""
+        self.messages.post(ctx, embed=self.embeds.info_embed(f"```\n{self.bot.encoders.report()}\n```"))
+
+    @commands.command(name='ffmpeg', hidden=True)
+    @commands.is_owner()
+    async def ffmpeg(self, ctx):
+        """Shows the live FFmpeg processes and how often streams were restarted or killed."""
+        self.messages.post(ctx, embed=self.embeds.info_embed(f"```\n{self.bot.ffmpeg.report()}\n```"))
 
     @commands.command(name='blacklist')
     @commands.has_permissions(administrator=True)
@@ -55,9 +85,9 @@ class AdminCog(commands.Cog):
 
         try:
             self.database.add_blacklist(user.id)
-            await ctx.send(embed=self.embeds.success_embed(f"Blacklisted {user.mention} from using the bot."))
+            self.messages.post(ctx, embed=self.embeds.success_embed(f"Blacklisted {user.mention} from using the bot."))
         except Exception as e:
-            await ctx.send(embed=self.embeds.error_embed(f"Failed to blacklist {user.mention}:\n{e}"))
+            self.messages.post(ctx, embed=self.embeds.error_embed(f"Failed to blacklist {user.mention}:\n{e}"), priority=PRIORITY_HIGH)
 
     @commands.command(name='unblacklist')
     @commands.has_permissions(administrator=True)
@@ -65,9 +95,9 @@ class AdminCog(commands.Cog):
         """Removes a user from the blacklist."""
         try:
             self.database.remove_blacklist(user.id)
-            await ctx.send(embed=self.embeds.success_embed(f"Unblacklisted {user.mention}."))
+            self.messages.post(ctx, embed=self.embeds.success_embed(f"Unblacklisted {user.mention}."))
         except Exception as e:
-            await ctx.send(embed=self.embeds.error_embed(f"Failed to unblacklist {user.mention}:\n{e}"))
+            self.messages.post(ctx, embed=self.embeds.error_embed(f"Failed to unblacklist {user.mention}:\n{e}"), priority=PRIORITY_HIGH)
 
     @commands.command(name='whitelist')
     @commands.has_permissions(administrator=True)
@@ -78,9 +108,9 @@ class AdminCog(commands.Cog):
 
         try:
             self.database.add_whitelist(user.id)
-            await ctx.send(embed=self.embeds.success_embed(f"Whitelisted {user.mention} to use the bot."))
+            self.messages.post(ctx, embed=self.embeds.success_embed(f"Whitelisted {user.mention} to use the bot."))
         except Exception as e:
-            await ctx.send(embed=self.embeds.error_embed(f"Failed to whitelist {user.mention}:\n{e}"))
+            self.messages.post(ctx, embed=self.embeds.error_embed(f"Failed to whitelist {user.mention}:\n{e}"), priority=PRIORITY_HIGH)
 
     @commands.command(name='unwhitelist')
     @commands.has_permissions(administrator=True)
@@ -88,9 +118,9 @@ class AdminCog(commands.Cog):
         """Removes a user from the whitelist."""
         try:
             self.database.remove_whitelist(user.id)
-            await ctx.send(embed=self.embeds.success_embed(f"Unwhitelisted {user.mention}."))
+            self.messages.post(ctx, embed=self.embeds.success_embed(f"Unwhitelisted {user.mention}."))
         except Exception as e:
-            await ctx.send(embed=self.embeds.error_embed(f"Failed to unwhitelist {user.mention}:\n{e}"))
+            self.messages.post(ctx, embed=self.embeds.error_embed(f"Failed to unwhitelist {user.mention}:\n{e}"), priority=PRIORITY_HIGH)
 
     @commands.command(name='set_prefix')
     @commands.has_permissions(administrator=True)
@@ -104,9 +134,9 @@ class AdminCog(commands.Cog):
         try:
             self.config.set('guild_prefixes', {str(ctx.guild.id): prefix})
             self.config.save()
-            await ctx.send(embed=self.embeds.success_embed(f'Prefix set to: `{prefix}`'))
+            self.messages.post(ctx, embed=self.embeds.success_embed(f'Prefix set to: `{prefix}`'))
         except Exception as e:
-            await ctx.send(embed=self.embeds.error_embed(f'Failed to set prefix:\n{e}'))
+            self.messages.post(ctx, embed=self.embeds.error_embed(f'Failed to set prefix:\n{e}'), priority=PRIORITY_HIGH)
 
     @commands.Cog.listener()
     async def on_ready(self):
@@ -1,251 +1,588 @@
 import discord
 from discord.ext import commands
 import asyncio
-import youtube_dl
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
-import soundcloud
-from soundcloud.client import Client
-import requests
-from utils.music_player import MusicPlayer
-from utils.errors import MusicError
-from utils.helper import format_duration
-
-# Suppress noisy YouTube DL logging
-youtube_dl.utils.bug_reports_message = lambda: ''
+from typing import Dict, List
+from utils.audio_format import EQ_BANDS, EQ_MAX_GAIN_DB, FRAME_DURATION
+from utils.mixer_input import MixerInput
+from utils.music_player import MusicPlayer, PlayerSource
+from utils.errors import DatabaseError, MusicError
+from utils.helper import format_duration, format_time, parse_time
+from utils.idle import IdleTimers
+from utils.loudness import LoudnessAnalyzer
+from utils.message_scheduler import PRIORITY_HIGH
+from utils.queue_view import QueuePages, QueueView
+from utils.search_index import SearchIndex
+from utils.session import GuildSession
+from utils.resolvers import DirectResolver, ResolverRegistry, SoundCloudResolver, SpotifyResolver, YouTubeResolver
+
+# Seconds an idle session is kept before it is reclaimed, unless configured otherwise
+IDLE_TIMEOUTS = {
+    'alone': 60,  # Nobody but bots left in the voice channel
+    'paused': 600,  # Paused without being resumed
+    'finished': 120,  # The queue ran out
+}
 
 class MusicCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.queue = asyncio.Queue()
-        self.current_song = None
-        self.voice_client = None
-        self.music_player = None
+        self.sessions: Dict[int, GuildSession] = {}
+        self.loudness = LoudnessAnalyzer(bot.database, bot.ffmpeg)
         self.config = bot.config
+        self.messages = bot.messages
 
-        # Configure Spotify API
-        self.spotify_client_id = self.config.get('spotify_client_id')
-        self.spotify_client_secret = self.config.get('spotify_client_secret')
-        self.spotify = self.get_spotify_client()
+        # One timer task reclaims the voice connection, processes and queue of idle sessions.
+        self.idle = IdleTimers(self.reclaim_idle)
+        self.idle_timeouts = {}
+        for policy, default in IDLE_TIMEOUTS.items():
+            configured = self.config.get(f'idle_{policy}_timeout')
+            self.idle_timeouts[policy] = float(configured) if configured is not None else default
+        self.reclaimed = {'sessions': 0, 'ffmpeg_processes': 0, 'queued_songs': 0}
+        self.reclaimed.update({policy: 0 for policy in IDLE_TIMEOUTS})
 
-        # Configure SoundCloud API
-        self.soundcloud_client_id = self.config.get('soundcloud_client_id')
-        self.soundcloud_client_secret = self.config.get('soundcloud_client_secret')
-        self.soundcloud = Client(client_id=self.soundcloud_client_id, client_secret=self.soundcloud_client_secret)
+        # Seconds of audio each player decodes ahead, and buffers before playing or after an underrun
+        self.read_ahead = float(self.config.get('read_ahead_seconds') or 2.0)
+        self.prebuffer = float(self.config.get('prebuffer_seconds') or 0.5)
+        self.underruns = 0  # Of players that have finished
 
-    def get_spotify_client(self):
-        client_credentials_manager = SpotifyClientCredentials(
-            client_id=self.spotify_client_id,
-            client_secret=self.spotify_client_secret
-        )
-        return spotipy.Spotify(client_credentials_manager=client_credentials_manager)
+        # Sessions handed over by the previous instance when the extension is reloaded
+        self.exported = False
+        state = bot.handoff.pop(self.qualified_name, None)
+        if state is not None:
+            self.adopt_state(state)
+
+        # Configure the music backends (provider clients are created on first use)
+        self.resolvers = ResolverRegistry()
+        allow_local_files = str(self.config.get('allow_local_files') or '').lower() in ('1', 'true', 'yes')
+        self.resolvers.register(DirectResolver(allow_local_files), max_concurrency=8)
+        self.search_index = SearchIndex(bot.database, allow_local_files)
+        self.resolvers.register(SpotifyResolver(
+            bot.http_pool,
+            self.config.get('spotify_client_id'),
+            self.config.get('spotify_client_secret')
+        ))
+        self.resolvers.register(SoundCloudResolver(
+            bot.http_pool,
+            self.config.get('soundcloud_client_id'),
+            self.config.get('soundcloud_client_secret')
+        ), fallback='youtube')
+        self.resolvers.register(YouTubeResolver(), default=True, fallback='soundcloud')
+
+    def get_session(self, guild_id: int) -> GuildSession:
+        """Returns the playback session of a guild, creating it on first use."""
+        session = self.sessions.get(guild_id)
+        if session is None:
+            session = self.sessions[guild_id] = GuildSession(guild_id)
+            self.bind(session)
+        return session
+
+    def bind(self, session: GuildSession):
+        """Points the callbacks of a session's voice stream and mixer at this cog."""
+        session.on_stream_end = self.on_playback_end
+        session.on_song_end = self.on_song_end
+
+    def export_state(self) -> dict:
+        """
+        Hands the live sessions over to the cog that replaces this one on reload.
+
+        The sessions keep their voice connections, players and queues, so audio
+        continues while the extension is reloaded. Once exported, unloading this
+        cog no longer ends them.
 
-    async def play_song(self, ctx, song: dict):
-        """Plays a song from the queue."""
-        self.current_song = song
+        Returns:
+            The state to pass to the next cog's adopt_state().
+        """
+        self.exported = True
+        return {'sessions': self.sessions, 'idle': self.idle.export(), 'reclaimed': self.reclaimed,
+                'underruns': self.underruns}
+
+    def adopt_state(self, state: dict):
+        """Takes over the sessions exported by the previous instance of the cog."""
+        self.sessions = state['sessions']
+        for session in self.sessions.values():
+            self.bind(session)
+        for key, remaining in state['idle'].items():
+            self.idle.schedule(key, remaining)
+        for key, value in state['reclaimed'].items():
+            self.reclaimed[key] = self.reclaimed.get(key, 0) + value
+        self.underruns += state['underruns']
+        print(f"Adopted {len(self.sessions)} music sessions.")
+
+    async def play_song(self, ctx, session: GuildSession, song: dict):
+        """Plays a song from the queue, replacing the current song but not other mixer inputs."""
+        session.current_song = song
+        # play_next passes the text channel itself when the previous song ended on its own.
+        session.channel = getattr(ctx, 'channel', ctx)
+        self.idle.cancel((session.guild_id, 'finished'))
         try:
-            if self.music_player is None:
-                self.music_player = MusicPlayer(song['source'])
-                await self.music_player.play_song()
-            else:
-                await self.music_player.stop()
-                self.music_player = MusicPlayer(song['source'])
-                await self.music_player.play_song()
-            await ctx.send(f"Now playing: **{song['title']}** by **{song['artist']}** ({format_duration(song['duration'])})")
-        except subprocess.CalledProcessError as e:
+            await self.stop_main_input(session)
+            player = self.create_player(session, song['source'])
+            await player.play_song()
+            session.music_player = player
+            session.main_input = session.mixer.add(
+                player,
+                gain=self.normalization_gain(song),
+                # Looked up on the session at call time so a reloaded cog takes over.
+                on_end=lambda mixer_input: session.on_song_end(session, mixer_input)
+            )
+            self.start_playback(session)
+            try:
+                self.bot.database.add_history(song['url'], song['title'], song['artist'], song['duration'])
+            except DatabaseError as e:
+                # The song is already playing; a missed history entry only affects suggestions.
+                print(f"Could not record {song['url']} in the history: {e}")
+            self.messages.post(ctx, f"Now playing: **{song['title']}** by **{song['artist']}** ({format_duration(song['duration'])})", priority=PRIORITY_HIGH)
+        except (OSError, discord.ClientException) as e:
             raise MusicError(f"Error playing song: {e}")
 
-    async def search_music(self, query: str) -> dict:
-        """Searches for music using the appropriate API."""
-        if 'youtube.com' in query:
-            return await self.search_youtube(query)
-        elif 'spotify.com' in query:
-            return await self.search_spotify(query)
-        elif 'soundcloud.com' in query:
-            return await self.search_soundcloud(query)
+    def create_player(self, session: GuildSession, source: str):
+        """Creates a player with the configured read-ahead buffer, on the session's audio node if it has one."""
+        if session.node is not None:
+            return session.node.create_player(source)
+        return MusicPlayer(source, self.bot.ffmpeg, high_water=self.read_ahead, low_water=self.prebuffer)
+
+    async def stop_main_input(self, session: GuildSession):
+        """Takes the current song out of the mixer and stops its FFmpeg process."""
+        if session.main_input is not None:
+            session.mixer.remove(session.main_input)
+            session.main_input = None
+        if session.music_player is not None:
+            player, session.music_player = session.music_player, None
+            self.underruns += player.underruns
+            await player.stop()
+
+    def normalization_gain(self, song: dict) -> float:
+        """Returns the song's precomputed loudness gain, queueing it for analysis if it has none yet."""
+        gain = self.loudness.gain_for(song)
+        if gain is None:
+            self.loudness.submit(song)
+            return 1.0
+        return gain
+
+    def start_playback(self, session: GuildSession):
+        """Streams the session's mixer to its voice client unless it is streaming already."""
+        if session.player_source is not None:
+            return
+        if session.node is not None:
+            source = session.node.start_stream(self.bot.loop)
         else:
-            return await self.search_youtube(query)
+            source = PlayerSource(session.mixer, self.bot.loop, self.bot.encoders, session.encoder_session)
+        session.player_source = source
+        session.voice_client.play(
+            source, after=lambda error: self.bot.loop.call_soon_threadsafe(session.on_stream_end, session, source)
+        )
 
-    async def search_youtube(self, query: str) -> dict:
-        """Searches for music on YouTube."""
-        try:
-            ydl_opts = {'format': 'bestaudio/best'}
-            with youtube_dl.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(query, download=False)
-                if 'entries' in info:
-                    # Playlist
-                    info = info['entries'][0]
-                return {
-                    'source': info['url'],
-                    'title': info['title'],
-                    'artist': info['uploader'],
-                    'duration': int(info['duration']),
-                }
-        except Exception as e:
-            raise MusicError(f"Error searching YouTube: {e}")
+    def on_playback_end(self, session: GuildSession, source: discord.AudioSource):
+        """Called once the mixer has run out of inputs and the voice client stopped streaming it."""
+        if source is not session.player_source:
+            return
+        session.player_source = None
+        if session.node is not None and not session.node.connected and self.sessions.get(session.guild_id) is session:
+            # The audio node went away and took the session's players with it.
+            asyncio.ensure_future(self.end_session(session))
+            if session.channel is not None:
+                self.messages.post(session.channel, "Lost the connection to the audio node. Please start playback again.", priority=PRIORITY_HIGH)
+            return
+        # An input may have been added while the stream was winding down.
+        if session.mixer.inputs and session.connected:
+            self.start_playback(session)
 
-    async def search_spotify(self, query: str) -> dict:
-        """Searches for music on Spotify."""
-        try:
-            results = self.spotify.search(q=query, type='track')
-            if results['tracks']['items']:
-                track = results['tracks']['items'][0]
-                return {
-                    'source': track['external_urls']['spotify'],
-                    'title': track['name'],
-                    'artist': track['artists'][0]['name'],
-                    'duration': int(track['duration_ms'] / 1000),
-                }
-            else:
-                raise MusicError("No results found on Spotify.")
-        except Exception as e:
-            raise MusicError(f"Error searching Spotify: {e}")
+    def on_song_end(self, session: GuildSession, mixer_input: MixerInput):
+        """Called by the mixer when the current song has no more frames."""
+        if mixer_input is session.main_input:
+            session.main_input = None
+            asyncio.ensure_future(self.play_next(session.channel, session))
 
-    async def search_soundcloud(self, query: str) -> dict:
-        """Searches for music on SoundCloud."""
-        try:
-            results = self.soundcloud.get('/tracks', q=query)
-            if results:
-                track = results[0]
-                return {
-                    'source': track['permalink_url'],
-                    'title': track['title'],
-                    'artist': track['user']['username'],
-                    'duration': int(track['duration'] / 1000),
-                }
-            else:
-                raise MusicError("No results found on SoundCloud.")
-        except Exception as e:
-            raise MusicError(f"Error searching SoundCloud: {e}")
+    async def search_music(self, query: str) -> dict:
+        """
+        Searches for music, answering from the local index when the query strongly matches a known track.
+
+        Known tracks whose stream URL has expired are resolved again by their
+        stable URL, which skips the provider's search.
+        """
+        song = self.search_index.lookup(query)
+        if song is not None and self.search_index.is_fresh(song):
+            return song
+        song = await self.resolvers.resolve(song['url'] if song else query)
+        self.search_index.add(song)
+        return song
+
+    def complete_query(self, ctx: discord.AutocompleteContext) -> List[discord.OptionChoice]:
+        """Suggests previously played tracks for what the user has typed so far, answered from the local index."""
+        return [
+            discord.OptionChoice(name=f"{song['title']} - {song['artist']}"[:100], value=song['url'])
+            for song in self.search_index.suggest(ctx.value or '')
+            if len(song['url']) <= 100
+        ]
+
+    @discord.slash_command(name='play', description='Plays a song from a URL or search query.')
+    async def play_slash(
+        self,
+        ctx: discord.ApplicationContext,
+        query: discord.Option(str, 'A URL or search query', autocomplete=lambda ctx: ctx.command.cog.complete_query(ctx))
+    ):
+        """Plays a song from a URL or search query, suggesting previously played tracks while typing."""
+        await ctx.respond(f"Searching for `{query}`...", ephemeral=True)
+        await self.play(ctx, query=query)
 
     @commands.command(name='play', aliases=['p'])
     async def play(self, ctx, *, query: str):
         """Plays a song from a URL or search query."""
+        session = self.get_session(ctx.guild.id)
         try:
             song = await self.search_music(query)
-            await self.queue.put(song)
-            if self.voice_client is None:
-                await self.join_voice_channel(ctx)
-            if self.voice_client.is_playing():
-                await ctx.send(f"Added **{song['title']}** to the queue.")
+            if session.voice_client is None:
+                await self.join_voice_channel(ctx, session)
+            if session.main_input is not None:
+                await session.queue.put(song)
+                self.messages.post(ctx, f"Added **{song['title']}** to the queue.", coalesce=True)
             else:
-                await self.play_song(ctx, song)
+                await self.play_song(ctx, session, song)
+        except MusicError as e:
+            self.messages.post(ctx, embed=self.bot.embeds.error_embed(str(e)), priority=PRIORITY_HIGH)
+        except Exception as e:
+            self.messages.post(ctx, embed=self.bot.embeds.error_embed(f"An unexpected error occurred: {e}"), priority=PRIORITY_HIGH)
+
+    @commands.command(name='sfx')
+    async def sfx(self, ctx, *, query: str):
+        """Plays a short clip over the current song, which is turned down while the clip plays."""
+        session = self.get_session(ctx.guild.id)
+        try:
+            clip = await self.search_music(query)
+            if session.voice_client is None:
+                await self.join_voice_channel(ctx, session)
+            if session.voice_client is None:
+                return
+            player = self.create_player(session, clip['source'])
+            await player.play_song()
+            session.mixer.add(
+                player,
+                gain=self.normalization_gain(clip),
+                ducks=True,
+                on_end=lambda mixer_input: asyncio.ensure_future(mixer_input.player.stop())
+            )
+            self.start_playback(session)
         except MusicError as e:
-            await ctx.send(embed=self.bot.embeds.error_embed(str(e)))
+            self.messages.post(ctx, embed=self.bot.embeds.error_embed(str(e)), priority=PRIORITY_HIGH)
         except Exception as e:
-            await ctx.send(embed=self.bot.embeds.error_embed(f"An unexpected error occurred: {e}"))
+            self.messages.post(ctx, embed=self.bot.embeds.error_embed(f"An unexpected error occurred: {e}"), priority=PRIORITY_HIGH)
 
     @commands.command(name='pause')
     async def pause(self, ctx):
         """Pauses the current song."""
-        if self.voice_client and self.voice_client.is_playing():
-            self.voice_client.pause()
-            await ctx.send("Paused.")
+        session = self.get_session(ctx.guild.id)
+        if session.voice_client and session.voice_client.is_playing():
+            session.voice_client.pause()
+            self.idle.schedule((session.guild_id, 'paused'), self.idle_timeouts['paused'])
+            self.messages.post(ctx, "Paused.")
         else:
-            await ctx.send("Nothing is playing.")
+            self.messages.post(ctx, "Nothing is playing.")
 
     @commands.command(name='resume')
     async def resume(self, ctx):
         """Resumes the paused song."""
-        if self.voice_client and self.voice_client.is_paused():
-            self.voice_client.resume()
-            await ctx.send("Resumed.")
+        session = self.get_session(ctx.guild.id)
+        if session.voice_client and session.voice_client.is_paused():
+            session.voice_client.resume()
+            self.idle.cancel((session.guild_id, 'paused'))
+            self.messages.post(ctx, "Resumed.")
         else:
-            await ctx.send("Nothing is paused.")
+            self.messages.post(ctx, "Nothing is paused.")
 
     @commands.command(name='skip', aliases=['s'])
     async def skip(self, ctx):
         """Skips to the next song in the queue."""
-        if self.voice_client and self.voice_client.is_playing():
-            self.voice_client.stop()
-            await self.play_next(ctx)
+        session = self.get_session(ctx.guild.id)
+        if session.main_input is not None:
+            await self.stop_main_input(session)
+            await self.play_next(ctx, session)
         else:
-            await ctx.send("Nothing is playing.")
+            self.messages.post(ctx, "Nothing is playing.")
 
     @commands.command(name='stop')
     async def stop(self, ctx):
         """Stops the music and disconnects from the voice channel."""
-        if self.voice_client:
-            await self.voice_client.disconnect()
-            self.music_player = None
-            self.voice_client = None
-            self.current_song = None
-            await ctx.send("Stopped.")
+        session = self.sessions.get(ctx.guild.id)
+        if session is not None and session.voice_client:
+            await self.end_session(session)
+            self.messages.post(ctx, "Stopped.")
         else:
-            await ctx.send("Not connected to any voice channel.")
+            self.messages.post(ctx, "Not connected to any voice channel.")
 
     @commands.command(name='queue', aliases=['q'])
     async def queue(self, ctx, *, query: str = None):
         """Adds a song to the queue."""
+        session = self.get_session(ctx.guild.id)
         try:
             if query is None:
                 # Show queue if no query is provided
-                if self.queue.empty():
-                    await ctx.send("The queue is empty.")
+                if session.queue.empty():
+                    self.messages.post(ctx, "The queue is empty.")
                 else:
-                    queue_list = [f"**{song['title']}** by **{song['artist']}** ({format_duration(song['duration'])})" for song in list(self.queue._queue)]
-                    await ctx.send(f"**Queue:**\n{'\n'.join(queue_list)}")
+                    view = QueueView(QueuePages(session.queue))
+                    self.messages.post(ctx, view.pages.render(0), view=view)
                 return
             song = await self.search_music(query)
-            await self.queue.put(song)
-            await ctx.send(f"Added **{song['title']}** to the queue.")
+            await session.queue.put(song)
+            self.messages.post(ctx, f"Added **{song['title']}** to the queue.", coalesce=True)
         except MusicError as e:
-            await ctx.send(embed=self.bot.embeds.error_embed(str(e)))
+            self.messages.post(ctx, embed=self.bot.embeds.error_embed(str(e)), priority=PRIORITY_HIGH)
         except Exception as e:
-            await ctx.send(embed=self.bot.embeds.error_embed(f"An unexpected error occurred: {e}"))
+            self.messages.post(ctx, embed=self.bot.embeds.error_embed(f"An unexpected error occurred: {e}"), priority=PRIORITY_HIGH)
 
     @commands.command(name='clear_queue')
     async def clear_queue(self, ctx):
         """Clears the current queue."""
-        if not self.queue.empty():
-            self.queue = asyncio.Queue()
-            await ctx.send("Queue cleared.")
+        session = self.get_session(ctx.guild.id)
+        if not session.queue.empty():
+            session.queue.clear()
+            self.messages.post(ctx, "Queue cleared.")
         else:
-            await ctx.send("The queue is already empty.")
+            self.messages.post(ctx, "The queue is already empty.")
 
     @commands.command(name='now_playing', aliases=['np'])
     async def now_playing(self, ctx):
         """Displays information about the currently playing song."""
-        if self.current_song:
-            await ctx.send(f"Now playing: **{self.current_song['title']}** by **{self.current_song['artist']}** ({format_duration(self.current_song['duration'])})")
+        session = self.get_session(ctx.guild.id)
+        song = session.current_song
+        if song:
+            position = format_time(int(session.music_player.position)) if session.music_player else format_time(0)
+            self.messages.post(ctx, f"Now playing: **{song['title']}** by **{song['artist']}** [{position} / {format_time(song['duration'])}]", priority=PRIORITY_HIGH)
+        else:
+            self.messages.post(ctx, "Nothing is playing.")
+
+    async def seek_to(self, ctx, session: GuildSession, position: float):
+        """Moves playback of the current song to another position."""
+        if session.music_player is None or session.current_song is None:
+            self.messages.post(ctx, "Nothing is playing.")
+            return
+        duration = session.current_song['duration']
+        position = max(0.0, min(position, duration) if duration else position)
+        try:
+            await session.music_player.seek(position)
+        except OSError as e:
+            self.messages.post(ctx, embed=self.bot.embeds.error_embed(f"Error seeking: {e}"), priority=PRIORITY_HIGH)
+            return
+        self.messages.post(ctx, f"Seeked to {format_time(int(position))}.")
+
+    @commands.command(name='seek')
+    async def seek(self, ctx, position: str):
+        """Jumps to a position in the current song (seconds, MM:SS or HH:MM:SS)."""
+        try:
+            seconds = parse_time(position)
+        except ValueError as e:
+            self.messages.post(ctx, embed=self.bot.embeds.error_embed(str(e)), priority=PRIORITY_HIGH)
+            return
+        await self.seek_to(ctx, self.get_session(ctx.guild.id), seconds)
+
+    @commands.command(name='forward', aliases=['ff'])
+    async def forward(self, ctx, seconds: int = 10):
+        """Skips forward in the current song by a number of seconds."""
+        session = self.get_session(ctx.guild.id)
+        if session.music_player is not None:
+            await self.seek_to(ctx, session, session.music_player.position + seconds)
+        else:
+            self.messages.post(ctx, "Nothing is playing.")
+
+    @commands.command(name='rewind', aliases=['rw'])
+    async def rewind(self, ctx, seconds: int = 10):
+        """Rewinds the current song by a number of seconds."""
+        session = self.get_session(ctx.guild.id)
+        if session.music_player is not None:
+            await self.seek_to(ctx, session, session.music_player.position - seconds)
+        else:
+            self.messages.post(ctx, "Nothing is playing.")
+
+    @commands.command(name='volume', aliases=['vol'])
+    async def volume(self, ctx, percent: int = None):
+        """Shows or sets the playback volume in percent (0-200)."""
+        dsp = self.get_session(ctx.guild.id).dsp
+        if percent is None:
+            self.messages.post(ctx, f"Volume: {round(dsp.target_volume * 100)}%")
+        elif not 0 <= percent <= 200:
+            self.messages.post(ctx, embed=self.bot.embeds.error_embed("Volume must be between 0 and 200."), priority=PRIORITY_HIGH)
         else:
-            await ctx.send("Nothing is playing.")
+            dsp.set_volume(percent / 100)
+            self.messages.post(ctx, f"Volume set to {percent}%.")
 
-    async def join_voice_channel(self, ctx):
+    @commands.command(name='eq')
+    async def eq(self, ctx, band: str = None, gain: float = None):
+        """Shows the equalizer, sets a band (bass, mid, treble) in dB, or resets it with `eq reset`."""
+        dsp = self.get_session(ctx.guild.id).dsp
+        if band is None:
+            bands = ', '.join(f"{name} {value:+.1f} dB" for name, value in dsp.eq_gains.items())
+            self.messages.post(ctx, f"Equalizer: {bands}")
+        elif band == 'reset':
+            dsp.reset_eq()
+            self.messages.post(ctx, "Equalizer reset.")
+        elif band not in EQ_BANDS or gain is None:
+            self.messages.post(ctx, embed=self.bot.embeds.error_embed(f"Usage: eq <{'|'.join(EQ_BANDS)}> <gain in dB> or eq reset"), priority=PRIORITY_HIGH)
+        else:
+            dsp.set_eq(band, gain)
+            self.messages.post(ctx, f"Set {band} to {dsp.eq_gains[band]:+.1f} dB (limit ±{EQ_MAX_GAIN_DB:.0f} dB).")
+
+    @commands.command(name='limiter')
+    async def limiter(self, ctx, state: str):
+        """Turns the clipping limiter on or off."""
+        if state not in ('on', 'off'):
+            self.messages.post(ctx, embed=self.bot.embeds.error_embed("Usage: limiter <on|off>"), priority=PRIORITY_HIGH)
+            return
+        self.get_session(ctx.guild.id).dsp.limiter_enabled = state == 'on'
+        self.messages.post(ctx, f"Limiter turned {state}.")
+
+    async def join_voice_channel(self, ctx, session: GuildSession):
         """Joins the voice channel that the user is in."""
         if ctx.author.voice:
             channel = ctx.author.voice.channel
-            self.voice_client = await channel.connect()
-            await ctx.send(f"Joined {channel.name}.")
+            if self.bot.audio_nodes is not None:
+                # Decoding and encoding run on the least loaded audio node that admits the session.
+                session.use_node(await self.bot.audio_nodes.open(ctx.guild.id, channel.bitrate, self.read_ahead, self.prebuffer))
+            else:
+                # Only join when the host can still encode another session in time.
+                session.encoder_session = self.bot.encoders.admit(ctx.guild.id, channel.bitrate)
+            session.channel = ctx.channel
+            try:
+                session.voice_client = await channel.connect()
+            except Exception:
+                self.release_encoder(session)
+                if session.node is not None:
+                    await session.node.close()
+                raise
+            self.messages.post(ctx, f"Joined {channel.name}.", coalesce=True)
         else:
-            await ctx.send("You are not connected to a voice channel.")
+            self.messages.post(ctx, "You are not connected to a voice channel.")
 
-    async def play_next(self, ctx):
+    def release_encoder(self, session: GuildSession):
+        """Returns the encoder session's share of the CPU budget to the scheduler."""
+        if session.encoder_session is not None:
+            self.bot.encoders.release(session.encoder_session.key, session.encoder_session)
+            session.encoder_session = None
+
+    async def play_next(self, ctx, session: GuildSession):
         """Plays the next song in the queue."""
-        if not self.queue.empty():
-            song = await self.queue.get()
-            await self.play_song(ctx, song)
+        if not session.queue.empty():
+            song = await session.queue.get()
+            await self.play_song(ctx, session, song)
         else:
-            await ctx.send("Queue is empty.  Ending playback.")
-            await self.voice_client.disconnect()
-            self.music_player = None
-            self.voice_client = None
-            self.current_song = None
+            session.current_song = None
+            self.messages.post(ctx, "Queue is empty.")
+            self.idle.schedule((session.guild_id, 'finished'), self.idle_timeouts['finished'])
+
+    async def end_session(self, session: GuildSession):
+        """Disconnects a guild's session and stops every input of its mixer."""
+        self.sessions.pop(session.guild_id, None)
+        for policy in IDLE_TIMEOUTS:
+            self.idle.cancel((session.guild_id, policy))
+        session.player_source = None
+        session.main_input = None
+        if session.music_player is not None:
+            self.underruns += session.music_player.underruns
+            session.music_player = None
+        session.current_song = None
+        if session.voice_client is not None:
+            voice_client, session.voice_client = session.voice_client, None
+            if voice_client.is_connected():
+                await voice_client.disconnect()
+        await session.mixer.stop()
+        self.release_encoder(session)
+        if session.node is not None:
+            await session.node.close()
+
+    def is_idle(self, session: GuildSession, policy: str) -> bool:
+        """Checks whether an idle policy still applies to a session."""
+        if not session.connected:
+            return True
+        if policy == 'alone':
+            return not any(not member.bot for member in session.voice_client.channel.members)
+        if policy == 'paused':
+            return session.voice_client.is_paused()
+        return session.main_input is None
 
-    async def handle_voice_disconnect(self, ctx):
+    async def reclaim_idle(self, key: tuple):
+        """Ends a session whose idle timer expired, recording what was freed."""
+        guild_id, policy = key
+        session = self.sessions.get(guild_id)
+        if session is None or not self.is_idle(session, policy):
+            return
+        self.reclaimed['sessions'] += 1
+        self.reclaimed[policy] += 1
+        self.reclaimed['ffmpeg_processes'] += len(session.mixer.inputs)
+        self.reclaimed['queued_songs'] += session.queue.qsize()
+        await self.end_session(session)
+        if session.channel is not None:
+            reasons = {'alone': "everyone left", 'paused': "playback stayed paused", 'finished': "the queue finished"}
+            self.messages.post(session.channel, f"Left the voice channel because {reasons[policy]}.", coalesce=True)
+
+    def idle_report(self) -> str:
+        """Formats the active sessions, pending idle timers and what idle reclamation has freed."""
+        pending = sum(1 for guild_id in self.sessions for policy in IDLE_TIMEOUTS if self.idle.pending((guild_id, policy)))
+        timeouts = ', '.join(f"{policy} {timeout:g} s" for policy, timeout in self.idle_timeouts.items())
+        reclaimed = ', '.join(f"{key} {value}" for key, value in self.reclaimed.items())
+        return f"{len(self.sessions)} sessions, {pending} idle timers pending ({timeouts})\nReclaimed: {reclaimed}"
+
+    def buffer_report(self) -> str:
+        """Formats the read-ahead buffer fill and underruns of every playing session."""
+        players = [session.music_player for session in self.sessions.values() if session.music_player is not None]
+        underruns = self.underruns + sum(player.underruns for player in players)
+        lines = [f"Read-ahead {self.read_ahead:g} s, prebuffer {self.prebuffer:g} s, {underruns} underruns in total"]
+        for guild_id, session in self.sessions.items():
+            player = session.music_player
+            if player is not None:
+                lines.append(
+                    f"{guild_id}: {player.buffered:.2f} of {player.high_water * FRAME_DURATION:g} s buffered"
+                    f"{' (buffering)' if player.buffering else ''}, {player.underruns} underruns"
+                )
+        return '\n'.join(lines)
+
+    async def handle_voice_disconnect(self, session: GuildSession):
         """Handles the bot disconnecting from the voice channel."""
-        if self.voice_client and self.voice_client.is_connected():
-            await self.voice_client.disconnect()
-            self.music_player = None
-            self.voice_client = None
-            self.current_song = None
+        if session.voice_client is not None:
+            await self.end_session(session)
+
+    @commands.command(name='backends', hidden=True)
+    @commands.is_owner()
+    async def backends(self, ctx):
+        """Shows the health and latency of the music backends and the shared HTTP pool."""
+        self.messages.post(ctx, f"```\n{self.resolvers.report()}\n{self.search_index.report()}\n\n{self.bot.http_pool.report()}\n```")
+
+    @commands.command(name='analyze_library', hidden=True)
+    @commands.is_owner()
+    async def analyze_library(self, ctx):
+        """Measures the loudness of every previously played track that has not been analyzed yet."""
+        urls = self.bot.database.get_unanalyzed_history()
+        self.messages.post(ctx, f"Analyzing {len(urls)} tracks...")
+        analyzed = await self.loudness.analyze_batch(urls, self.search_music)
+        self.messages.post(ctx, f"Analyzed {analyzed} of {len(urls)} tracks.")
+
+    @commands.command(name='sessions', hidden=True)
+    @commands.is_owner()
+    async def sessions_report(self, ctx):
+        """Shows the active sessions, their read-ahead buffers, the resources freed from idle ones and the audio nodes."""
+        report = f"{self.idle_report()}\n\n{self.buffer_report()}"
+        if self.bot.audio_nodes is not None:
+            report += f"\n\n{self.bot.audio_nodes.report()}"
+        self.messages.post(ctx, f"```\n{report}\n```")
 
     @commands.Cog.listener()
     async def on_voice_state_update(self, member, before, after):
-        """Handles voice state updates to disconnect if the bot is alone in the channel."""
-        if member == self.bot.user:
-            if after.channel is None and self.voice_client is not None and self.voice_client.is_connected():
-                await self.handle_voice_disconnect(None)
+        """Ends the session when the bot is disconnected and starts the idle timer when it is left alone."""
+        session = self.sessions.get(member.guild.id)
+        if session is None:
+            return
+        if member == self.bot.user and after.channel is None:
+            await self.handle_voice_disconnect(session)
+        elif session.connected:
+            key = (session.guild_id, 'alone')
+            if not self.is_idle(session, 'alone'):
+                self.idle.cancel(key)
+            elif not self.idle.pending(key):
+                self.idle.schedule(key, self.idle_timeouts['alone'])
+
+    def cog_unload(self):
+        """Ends every session unless they were exported to the cog replacing this one."""
+        self.idle.close()
+        if not self.exported:
+            for session in list(self.sessions.values()):
+                asyncio.ensure_future(self.end_session(session))
 
 def setup(bot: commands.Bot):
-    bot.add_cog(MusicCog(bot))
\ No newline at end of file
+    bot.add_cog(MusicCog(bot))
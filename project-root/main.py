@@ -1,9 +1,26 @@
-import discord
-from discord.ext import commands
-from utils.config import Config
-from utils.database import Database
-from utils.errors import BotError
-from utils.helper import get_prefix
+from utils.startup import startup
+
+with startup.timed('import', 'discord'):
+    import discord
+    from discord.ext import commands
+with startup.timed('import', 'audio_node.client'):
+    from audio_node.client import NodePool
+with startup.timed('import', 'utils.config'):
+    from utils.config import Config
+with startup.timed('import', 'utils.database'):
+    from utils.database import Database
+with startup.timed('import', 'utils.errors'):
+    from utils.errors import BotError
+with startup.timed('import', 'utils.helper'):
+    from utils.helper import get_prefix
+with startup.timed('import', 'utils.encoder_scheduler'):
+    from utils.encoder_scheduler import EncoderScheduler
+with startup.timed('import', 'utils.ffmpeg_supervisor'):
+    from utils.ffmpeg_supervisor import FFmpegSupervisor
+with startup.timed('import', 'utils.http_pool'):
+    from utils.http_pool import HTTPPool
+with startup.timed('import', 'utils.message_scheduler'):
+    from utils.message_scheduler import MessageScheduler, PRIORITY_HIGH
 
 # Initialize the bot and set intents
 intents = discord.Intents.default()
@@ -13,34 +30,71 @@ intents.message_content = True  # Enable message content intents to access messa
 bot = commands.Bot(command_prefix=get_prefix, intents=intents)
 
 # Load the configuration from the config file (or environment variables)
-bot.config = Config(config_file='config.json')  # Replace 'config.json' with your config file name if you're using one
+with startup.timed('init', 'config'):
+    bot.config = Config(config_file='config.json')  # Replace 'config.json' with your config file name if you're using one
 
 # Connect to the database
-bot.database = Database(bot.config.get('database_path'))
-bot.database.connect()
+with startup.timed('init', 'database'):
+    bot.database = Database(bot.config.get('database_path'))
+    bot.database.connect()
+
+# Outgoing messages go through a per-channel scheduler that respects rate limits
+bot.messages = MessageScheduler()
+
+# All provider API calls share one pool of keep-alive connections
+bot.http_pool = HTTPPool()
+
+# Voice sessions share the host's CPU through one encoder scheduler
+bot.encoders = EncoderScheduler()
+
+# Every FFmpeg process is started, watched and torn down by one supervisor
+bot.ffmpeg = FFmpegSupervisor()
+
+# Playback can be offloaded to standalone audio nodes (python -m audio_node.node)
+audio_nodes = bot.config.get('audio_nodes')
+bot.audio_nodes = NodePool(audio_nodes.split(',')) if audio_nodes else None
+
+# State that cogs hand over to their next instance when an extension is reloaded
+bot.handoff = {}
 
 # Load cogs (modules)
-bot.load_extension('cogs.music')
-bot.load_extension('cogs.admin')
+with startup.timed('init', 'cogs.music'):
+    bot.load_extension('cogs.music')
+with startup.timed('init', 'cogs.admin'):
+    bot.load_extension('cogs.admin')
 
 # Error handler
 @bot.event
 async def on_command_error(ctx, error):
     if isinstance(error, commands.CommandNotFound):
-        await ctx.send(f"Invalid command. Use `{get_prefix(bot, ctx.message)}help` for a list of commands.")
+        bot.messages.post(ctx, f"Invalid command. Use `{get_prefix(bot, ctx.message)}help` for a list of commands.", priority=PRIORITY_HIGH)
     elif isinstance(error, commands.MissingRequiredArgument):
-        await ctx.send(f"Missing required argument. Use `{get_prefix(bot, ctx.message)}help <command>` for usage details.")
+        bot.messages.post(ctx, f"Missing required argument. Use `{get_prefix(bot, ctx.message)}help <command>` for usage details.", priority=PRIORITY_HIGH)
     elif isinstance(error, commands.CheckFailure):
-        await ctx.send(f"You do not have the required permissions to use this command.")
+        bot.messages.post(ctx, f"You do not have the required permissions to use this command.", priority=PRIORITY_HIGH)
     elif isinstance(error, BotError):
-        await ctx.send(embed=bot.embeds.error_embed(str(error)))
+        bot.messages.post(ctx, embed=bot.embeds.error_embed(str(error)), priority=PRIORITY_HIGH)
     else:
-        await ctx.send(embed=bot.embeds.error_embed(f"An unexpected error occurred: {error}"))
+        bot.messages.post(ctx, embed=bot.embeds.error_embed(f"An unexpected error occurred: {error}"), priority=PRIORITY_HIGH)
 
 # On ready event
 @bot.event
 async def on_ready():
+    startup.mark_ready()
     print(f'Melody is online! {bot.user}')
+    print(startup.render())
+
+# Release shared resources once the bot has disconnected and unloaded its cogs
+disconnect = bot.close
+
+async def close():
+    await disconnect()
+    await bot.ffmpeg.close()
+    if bot.audio_nodes is not None:
+        await bot.audio_nodes.close()
+    await bot.http_pool.close()
+
+bot.close = close
 
 # Run the bot
 if __name__ == "__main__":
@@ -0,0 +1,65 @@
+import asyncio
+
+
+class FakeProcess:
+    def __init__(self, position: float, frames: int):
+        self.position = position
+        self.remaining = frames
+        self.stopping = False
+
+
+class FakeSupervisor:
+    """Decodes a fixed number of frames per process and takes a while to stop one, like a real FFmpeg."""
+
+    grace = 0.1
+
+    def __init__(self, frames: int = 100000, stop_delay: float = 0.05, spawn_delay: float = 0.0):
+        self.frames = frames
+        self.stop_delay = stop_delay
+        self.spawn_delay = spawn_delay
+        self.spawned = []
+        self.stats = {'restarts': 0}
+
+    @property
+    def live(self) -> int:
+        return sum(1 for ffmpeg in self.spawned if not ffmpeg.stopping)
+
+    async def spawn(self, *args, owner=None, label=''):
+        await asyncio.sleep(self.spawn_delay)
+        position = float(args[args.index('-ss') + 1]) if '-ss' in args else 0.0
+        ffmpeg = FakeProcess(position, self.frames)
+        self.spawned.append(ffmpeg)
+        return ffmpeg
+
+    async def read(self, ffmpeg, size):
+        await asyncio.sleep(0)
+        if ffmpeg.stopping or not ffmpeg.remaining:
+            return b''
+        ffmpeg.remaining -= 1
+        return b'\x01' * size
+
+    async def wait(self, ffmpeg, timeout=None):
+        return 0
+
+    async def stop(self, ffmpeg):
+        ffmpeg.stopping = True
+        await asyncio.sleep(self.stop_delay)
+
+    async def close(self):
+        for ffmpeg in self.spawned:
+            ffmpeg.stopping = True
+
+    def report(self) -> str:
+        return f"{self.live} live FFmpeg processes"
+
+
+class FakeEncoder:
+    """Stands in for discord.opus.Encoder, which needs libopus."""
+
+    SAMPLES_PER_FRAME = 960
+
+    def set_bitrate(self, kbps: int) -> int:
+        return kbps
+
+    def encode(self, pcm: bytes, frame_size: int) -> bytes:
+        return b'opus'
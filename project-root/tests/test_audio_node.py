@@ -0,0 +1,154 @@
+import asyncio
+import os
+import shutil
+import tempfile
+
+import discord
+import pytest
+
+from audio_node.client import STREAM_WINDOW, NodePool
+from audio_node.node import AudioNode
+from audio_node.protocol import (
+    CREDIT, HEADER, MAX_PAYLOAD, OP_CREDIT, OP_OPEN_INPUT, OPEN, encode, read_message
+)
+from fakes import FakeEncoder, FakeSupervisor
+from utils.encoder_scheduler import EncoderScheduler
+from utils.errors import SessionRejectedError
+
+
+@pytest.fixture(autouse=True)
+def fake_encoder(monkeypatch):
+    monkeypatch.setattr(discord.opus, 'Encoder', FakeEncoder)
+
+
+@pytest.fixture
+def socket_path():
+    # Unix socket paths are limited to about 100 bytes, which pytest's tmp_path can exceed.
+    directory = tempfile.mkdtemp(prefix='melody-')
+    yield os.path.join(directory, 'node.sock')
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def run_node(socket_path, body, scheduler=None, supervisor=None):
+    """Runs a test body against a node listening on a temporary socket and a pool connected to it."""
+    async def run():
+        node = AudioNode(socket_path, supervisor or FakeSupervisor(), scheduler, status_interval=0.05)
+        await node.start()
+        pool = NodePool([socket_path])
+        try:
+            return await body(node, pool)
+        finally:
+            await pool.close()
+            await node.close()
+
+    return asyncio.run(run())
+
+
+async def wait_until(condition, timeout: float = 2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def read_all(data: bytes):
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await read_message(reader)
+
+    return asyncio.run(run())
+
+
+def test_messages_round_trip():
+    payload = OPEN.pack(96000, 2.0, 0.5)
+    assert read_all(encode(OP_OPEN_INPUT, 42, 7, payload)) == (OP_OPEN_INPUT, 42, 7, payload)
+    assert read_all(encode(OP_CREDIT, 42)) == (OP_CREDIT, 42, 0, b'')
+
+
+def test_oversized_messages_are_rejected():
+    with pytest.raises(ValueError):
+        read_all(HEADER.pack(MAX_PAYLOAD + 1, OP_CREDIT, 42, 0))
+
+
+def test_truncated_messages_are_rejected():
+    with pytest.raises(asyncio.IncompleteReadError):
+        read_all(encode(OP_CREDIT, 42, 0, CREDIT.pack(5))[:-2])
+
+
+def test_open_and_close_a_session(socket_path):
+    async def body(node, pool):
+        session = await pool.open(42, 96000, 0.2, 0.1)
+        opened = node.sessions, list(node.scheduler.sessions)
+        await session.close()
+        await wait_until(lambda: node.sessions == 0)
+        return opened, node.scheduler.sessions
+
+    opened, encoders = run_node(socket_path, body)
+    assert opened == (1, [42])
+    assert encoders == {}
+
+
+def test_full_node_rejects_sessions(socket_path):
+    # Room for exactly one session at the default cost estimate.
+    scheduler = EncoderScheduler(cores=1, utilization=0.06)
+
+    async def body(node, pool):
+        await pool.open(1, 96000, 0.2, 0.1)
+        with pytest.raises(SessionRejectedError):
+            await pool.open(2, 96000, 0.2, 0.1)
+        return node.sessions, pool.stats['rejected']
+
+    assert run_node(socket_path, body, scheduler) == (1, 1)
+
+
+def test_stream_stops_when_credit_runs_out(socket_path):
+    async def body(node, pool):
+        session = await pool.open(42, 96000, 0.2, 0.1)
+        player = session.create_player('song.mp3')
+        await player.play_song()
+        session.mixer.add(player)
+        stream = session.start_stream(asyncio.get_running_loop())
+        # Nothing plays the packets, so the node stops after the initial window.
+        await wait_until(lambda: stream.packets.qsize() >= STREAM_WINDOW)
+        await asyncio.sleep(0.1)
+        window = stream.packets.qsize()
+        session.send(OP_CREDIT, CREDIT.pack(5))
+        await wait_until(lambda: stream.packets.qsize() >= STREAM_WINDOW + 5)
+        await asyncio.sleep(0.1)
+        return window, stream.packets.qsize()
+
+    assert run_node(socket_path, body) == (STREAM_WINDOW, STREAM_WINDOW + 5)
+
+
+def test_closing_an_input_while_ffmpeg_starts(socket_path):
+    supervisor = FakeSupervisor(spawn_delay=0.1)
+
+    async def body(node, pool):
+        session = await pool.open(42, 96000, 0.2, 0.1)
+        player = session.create_player('song.mp3')
+        starting = asyncio.ensure_future(player.play_song())
+        await asyncio.sleep(0.02)
+        # A skip while FFmpeg is still starting sends the close without waiting.
+        await player.stop()
+        await starting
+        node_session = next(iter(node.connections.values()))[42]
+        await wait_until(lambda: supervisor.live == 0)
+        return node_session.players
+
+    assert run_node(socket_path, body, supervisor=supervisor) == {}
+    assert len(supervisor.spawned) == 1
+
+
+def test_sessions_are_lost_when_the_node_goes_away(socket_path):
+    async def body(node, pool):
+        session = await pool.open(42, 96000, 0.2, 0.1)
+        stream = session.start_stream(asyncio.get_running_loop())
+        await node.close()
+        await wait_until(lambda: not session.connected)
+        return session, stream, pool.nodes[0]
+
+    session, stream, connection = run_node(socket_path, body)
+    assert connection.sessions == {}
+    assert stream.read() == b''
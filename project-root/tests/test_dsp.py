@@ -0,0 +1,40 @@
+import numpy as np
+
+from utils.audio_format import CHANNELS, FRAME_SAMPLES, FRAME_SIZE
+from utils.dsp import DSPChain
+
+SILENCE = bytes(FRAME_SIZE)
+
+
+def loud_frame() -> bytes:
+    rng = np.random.default_rng(0)
+    return rng.integers(-20000, 20000, FRAME_SAMPLES * CHANNELS, dtype=np.int16).tobytes()
+
+
+def test_flat_chain_leaves_the_signal_unchanged():
+    dsp = DSPChain()
+    dsp.limiter_enabled = False
+    frame = loud_frame()
+    assert dsp.process(frame) == frame
+
+
+def test_short_frames_are_padded():
+    assert len(DSPChain().process(b'\x01\x00' * 10)) == FRAME_SIZE
+
+
+def test_eq_starts_from_silence_when_turned_back_on():
+    dsp = DSPChain()
+    dsp.set_eq('bass', 6.0)
+    for _ in range(5):
+        dsp.process(loud_frame())
+    dsp.reset_eq()
+    dsp.process(SILENCE)
+    dsp.set_eq('bass', 6.0)
+    # Audio from before the EQ was turned off must not leak into the first frame after it.
+    assert dsp.process(SILENCE) == SILENCE
+
+
+def test_limiter_keeps_peaks_below_the_threshold():
+    dsp = DSPChain(volume=4.0, smoothing=1.0)
+    output = np.frombuffer(dsp.process(loud_frame()), dtype=np.int16)
+    assert np.abs(output.astype(np.int32)).max() <= dsp.limiter_threshold + 1
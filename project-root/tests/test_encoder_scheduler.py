@@ -0,0 +1,54 @@
+import threading
+
+import discord
+import pytest
+
+from utils.encoder_scheduler import EncoderScheduler
+
+
+class FakeEncoder:
+    SAMPLES_PER_FRAME = 960
+
+    def __init__(self):
+        self.threads = set()
+        self.bitrates = []
+
+    def set_bitrate(self, kbps: int) -> int:
+        self.threads.add(threading.get_ident())
+        self.bitrates.append(kbps)
+        return kbps
+
+    def encode(self, pcm: bytes, frame_size: int) -> bytes:
+        self.threads.add(threading.get_ident())
+        return b'opus'
+
+
+@pytest.fixture(autouse=True)
+def fake_encoder(monkeypatch):
+    monkeypatch.setattr(discord.opus, 'Encoder', FakeEncoder)
+
+
+def test_settings_are_applied_by_the_encoding_thread():
+    scheduler = EncoderScheduler(cores=1)
+    session = scheduler.admit(1, 96000)
+    # Rebalancing from another thread only records the request.
+    rebalancer = threading.Thread(target=session.configure, args=(64, 3))
+    rebalancer.start()
+    rebalancer.join()
+    assert session.encoder.bitrates == []
+
+    encoder_thread = threading.Thread(target=session.encode, args=(b'\0' * 3840,))
+    encoder_thread.start()
+    encoder_thread.join()
+    assert session.encoder.bitrates == [64]
+    assert session.encoder.threads == {encoder_thread.ident}
+    assert session.bitrate == 64
+
+
+def test_unchanged_settings_are_not_applied_again():
+    scheduler = EncoderScheduler(cores=1)
+    session = scheduler.admit(1, 96000)
+    for _ in range(3):
+        session.configure(64, 3)
+        session.encode(b'\0' * 3840)
+    assert session.encoder.bitrates == [64]
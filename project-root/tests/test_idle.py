@@ -0,0 +1,60 @@
+import asyncio
+
+from utils.idle import IdleTimers
+
+
+def run_timers(body):
+    """Runs a test body with timers that record which keys expired."""
+    async def run():
+        expired = []
+
+        async def on_expire(key):
+            expired.append(key)
+
+        timers = IdleTimers(on_expire)
+        try:
+            await body(timers)
+        finally:
+            timers.close()
+        return expired
+
+    return asyncio.run(run())
+
+
+def test_timers_expire_in_deadline_order():
+    async def body(timers):
+        timers.schedule('late', 0.06)
+        timers.schedule('early', 0.02)
+        await asyncio.sleep(0.1)
+
+    assert run_timers(body) == ['early', 'late']
+
+
+def test_cancelled_timers_do_not_expire():
+    async def body(timers):
+        timers.schedule('guild', 0.02)
+        timers.cancel('guild')
+        assert not timers.pending('guild')
+        await asyncio.sleep(0.05)
+
+    assert run_timers(body) == []
+
+
+def test_rescheduling_moves_the_deadline():
+    async def body(timers):
+        timers.schedule('guild', 0.02)
+        timers.schedule('guild', 0.08)
+        await asyncio.sleep(0.05)
+        assert timers.pending('guild')
+        await asyncio.sleep(0.06)
+
+    assert run_timers(body) == ['guild']
+
+
+def test_export_reports_the_time_left():
+    async def body(timers):
+        timers.schedule('guild', 10)
+        remaining = timers.export()['guild']
+        assert 9 < remaining <= 10
+
+    assert run_timers(body) == []
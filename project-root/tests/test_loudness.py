@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+from utils.loudness import ANALYSIS_MIN_TIMEOUT, ANALYSIS_TIMEOUT, analysis_timeout, measure_loudness
+
+
+class FakeProcess:
+    def __init__(self):
+        self.log = []
+        self.stopped = False
+
+
+class StalledSupervisor:
+    """Runs an FFmpeg process that never finishes."""
+
+    def __init__(self):
+        self.timeouts = []
+        self.process = FakeProcess()
+
+    async def spawn(self, *args, **kwargs):
+        return self.process
+
+    async def wait(self, ffmpeg, timeout=None):
+        self.timeouts.append(timeout)
+        return None
+
+    async def stop(self, ffmpeg):
+        ffmpeg.stopped = True
+
+
+def test_timeout_scales_with_the_duration():
+    assert analysis_timeout(0) == ANALYSIS_TIMEOUT
+    assert analysis_timeout(10) == ANALYSIS_MIN_TIMEOUT
+    assert analysis_timeout(3600) > ANALYSIS_MIN_TIMEOUT
+
+
+def test_stalled_analysis_times_out_and_stops_ffmpeg():
+    supervisor = StalledSupervisor()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(measure_loudness(supervisor, 'song.mp3', duration=3600))
+    assert supervisor.timeouts == [analysis_timeout(3600)]
+    assert supervisor.process.stopped
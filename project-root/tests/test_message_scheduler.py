@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from utils.message_scheduler import MessageScheduler
+
+
+class FakeMessage:
+    def __init__(self, content):
+        self.content = content
+
+    async def edit(self, content=None):
+        self.content = content
+
+
+class FakeChannel:
+    """Records delivered messages and fails the ones whose text starts with "fail"."""
+
+    def __init__(self, channel_id: int = 1):
+        self.id = channel_id
+        self.sent = []
+
+    async def send(self, content=None, embed=None, view=None):
+        if content and content.startswith('fail'):
+            raise TypeError("bad message")
+        self.sent.append(content)
+        return FakeMessage(content)
+
+
+def make_scheduler():
+    return MessageScheduler(channel_rate=100, channel_per=0.05, global_rate=100, coalesce_window=0.05, linger=0)
+
+
+def test_a_failing_message_does_not_stop_the_queue():
+    async def run():
+        scheduler = make_scheduler()
+        channel = FakeChannel()
+        futures = [scheduler.post(channel, text) for text in ('one', 'fail', 'three')]
+        results = await asyncio.wait_for(asyncio.gather(*futures, return_exceptions=True), 1)
+        return scheduler, channel, results
+
+    scheduler, channel, results = asyncio.run(run())
+    assert channel.sent == ['one', 'three']
+    assert isinstance(results[1], TypeError)
+    assert scheduler.stats['failed'] == 1
+
+
+def test_a_failing_status_batch_fails_every_sender():
+    async def run():
+        scheduler = make_scheduler()
+        channel = FakeChannel()
+        futures = [scheduler.post(channel, text, coalesce=True) for text in ('fail', 'two')]
+        return await asyncio.wait_for(asyncio.gather(*futures, return_exceptions=True), 1)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, TypeError) for result in results)
+
+
+def test_send_raises_the_delivery_error():
+    async def run():
+        await make_scheduler().send(FakeChannel(), 'fail')
+
+    with pytest.raises(TypeError):
+        asyncio.run(run())
+
+
+def test_idle_channels_are_forgotten():
+    async def run():
+        scheduler = make_scheduler()
+        await scheduler.send(FakeChannel(1), 'one')
+        await scheduler.send(FakeChannel(2), 'two')
+        tracked = len(scheduler.queues)
+        await asyncio.sleep(0.1)
+        return tracked, scheduler.queues
+
+    tracked, queues = asyncio.run(run())
+    assert tracked == 2
+    assert queues == {}
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+
+import numpy as np
+
+from utils.audio_format import FRAME_SIZE
+from utils.mixer import Mixer
+
+
+class ConstantPlayer:
+    """Returns the same frame a number of times."""
+
+    def __init__(self, value: int, frames: int = 1000):
+        self.frame = np.full(FRAME_SIZE // 2, value, dtype=np.int16).tobytes()
+        self.frames = frames
+
+    async def read_frame(self) -> bytes:
+        if not self.frames:
+            return b''
+        self.frames -= 1
+        return self.frame
+
+
+def samples(pcm: bytes) -> np.ndarray:
+    return np.frombuffer(pcm, dtype=np.int16)
+
+
+def test_inputs_are_summed():
+    async def run():
+        mixer = Mixer()
+        mixer.add(ConstantPlayer(100))
+        mixer.add(ConstantPlayer(200))
+        return await mixer.read_frame()
+
+    assert (samples(asyncio.run(run())) == 300).all()
+
+
+def test_mixing_can_run_on_another_thread():
+    async def run():
+        mixer = Mixer()
+        mixer.add(ConstantPlayer(100))
+        parts = await mixer.collect()
+        result = []
+        thread = threading.Thread(target=lambda: result.append(mixer.mix(parts)))
+        thread.start()
+        thread.join()
+        return result[0]
+
+    assert (samples(asyncio.run(run())) == 100).all()
+
+
+def test_ended_inputs_are_removed_and_the_mixer_lingers():
+    async def run():
+        mixer = Mixer(linger=0.04)
+        ended = []
+        mixer.add(ConstantPlayer(100, frames=1), on_end=ended.append)
+        frames = [await mixer.read_frame() for _ in range(4)]
+        return mixer, ended, frames
+
+    mixer, ended, frames = asyncio.run(run())
+    assert len(ended) == 1 and not mixer.inputs
+    assert (samples(frames[0]) == 100).all()
+    assert frames[1] == frames[2] == bytes(FRAME_SIZE)
+    assert frames[3] == b''
+
+
+def test_ducking_turns_down_the_other_inputs():
+    async def run():
+        mixer = Mixer(duck_gain=0.5, smoothing=1.0)
+        mixer.add(ConstantPlayer(1000))
+        mixer.add(ConstantPlayer(0), ducks=True)
+        await mixer.read_frame()
+        return await mixer.read_frame()
+
+    assert (samples(asyncio.run(run())) == 500).all()
@@ -0,0 +1,142 @@
+import asyncio
+import threading
+import time
+
+from fakes import FakeSupervisor
+from utils.audio_format import FRAME_DURATION, FRAME_SIZE
+from utils.music_player import MusicPlayer, PlayerSource
+
+
+def test_plays_until_the_source_ends():
+    async def run():
+        player = MusicPlayer('song.mp3', FakeSupervisor(frames=30), high_water=0.2, low_water=0.1)
+        await player.play_song()
+        frames = []
+        while True:
+            frame = await player.read_frame()
+            if not frame:
+                break
+            frames.append(frame)
+            await asyncio.sleep(0)
+        await player.stop()
+        return player, frames
+
+    player, frames = asyncio.run(run())
+    audio = [frame for frame in frames if frame != player.silence]
+    assert len(audio) == 30
+    assert all(len(frame) == FRAME_SIZE for frame in frames)
+
+
+def test_seek_while_reading_does_not_end_the_song():
+    async def run():
+        supervisor = FakeSupervisor()
+        player = MusicPlayer('song.mp3', supervisor, high_water=0.2, low_water=0.1)
+        await player.play_song()
+        results = []
+        seeked = asyncio.Event()
+
+        async def pull():
+            # Pulls frames the way the audio thread does while the seek is running.
+            while not (seeked.is_set() and player.frames >= 10):
+                results.append(await player.read_frame())
+                await asyncio.sleep(0)
+
+        puller = asyncio.ensure_future(pull())
+        await asyncio.sleep(0.01)
+        await player.seek(30.0)
+        seeked.set()
+        await asyncio.wait_for(puller, 5)
+        await player.stop()
+        return supervisor, player, results
+
+    supervisor, player, results = asyncio.run(run())
+    assert b'' not in results
+    assert [ffmpeg.position for ffmpeg in supervisor.spawned] == [0.0, 30.0]
+    assert player.position >= 30.0 + 10 * FRAME_DURATION
+
+
+def test_reading_pauses_at_the_high_water_mark():
+    async def run():
+        player = MusicPlayer('song.mp3', FakeSupervisor(), high_water=0.2, low_water=0.1)
+        await player.play_song()
+        await asyncio.sleep(0.05)
+        buffered = len(player.buffer)
+        decoded = player.decoded
+        await player.stop()
+        return player, buffered, decoded
+
+    player, buffered, decoded = asyncio.run(run())
+    assert buffered == decoded == player.high_water
+
+
+def test_underrun_plays_silence_until_the_low_water_mark():
+    async def run():
+        player = MusicPlayer('song.mp3', FakeSupervisor(), high_water=0.2, low_water=0.1)
+        await player.play_song()
+        await asyncio.sleep(0.05)
+        # Stop the reader so the buffer drains, as if the network stalled.
+        player.reader.cancel()
+        await asyncio.gather(player.reader, return_exceptions=True)
+        frames = [await player.read_frame() for _ in range(player.high_water + 3)]
+        buffering = player.buffering
+        player.buffer.extend([b'\x01' * FRAME_SIZE] * (player.low_water - 1))
+        still_buffering = await player.read_frame()
+        player.buffer.append(b'\x01' * FRAME_SIZE)
+        resumed = await player.read_frame()
+        await player.stop()
+        return player, frames, buffering, still_buffering, resumed
+
+    player, frames, buffering, still_buffering, resumed = asyncio.run(run())
+    assert frames[:player.high_water] == [b'\x01' * FRAME_SIZE] * player.high_water
+    assert frames[player.high_water:] == [player.silence] * 3
+    assert player.underruns == 1
+    assert buffering
+    assert still_buffering == player.silence
+    assert resumed == b'\x01' * FRAME_SIZE
+
+
+def test_stop_ends_the_song():
+    async def run():
+        player = MusicPlayer('song.mp3', FakeSupervisor(), high_water=0.2, low_water=0.1)
+        await player.play_song()
+        await asyncio.sleep(0.01)
+        await player.stop()
+        return await player.read_frame()
+
+    assert asyncio.run(run()) == b''
+
+
+class SlowMixer:
+    """Blocks the event loop for a while before handing out each frame."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.mixing_threads = set()
+
+    async def collect(self):
+        time.sleep(self.delay)
+        return [b'\x01' * FRAME_SIZE]
+
+    def mix(self, parts):
+        self.mixing_threads.add(threading.get_ident())
+        return parts[0]
+
+
+def test_source_returns_silence_while_the_event_loop_is_blocked():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        mixer = SlowMixer(delay=5 * FRAME_DURATION)
+        source = PlayerSource(mixer, loop)
+        assert source.read() == source.silence
+        assert source.late_frames == 1
+        time.sleep(10 * FRAME_DURATION)
+        # The late frame is delivered on the next read instead of being dropped.
+        assert source.read() == b'\x01' * FRAME_SIZE
+        assert source.pending is None
+        assert mixer.mixing_threads == {threading.get_ident()}
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
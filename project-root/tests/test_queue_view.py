@@ -0,0 +1,74 @@
+import asyncio
+
+import discord
+import pytest
+
+if not hasattr(discord, 'Bot'):
+    # utils.helper annotates with py-cord's discord.Bot.
+    pytest.skip("the queue view needs py-cord", allow_module_level=True)
+
+from utils.queue_view import QueuePages, QueueView
+from utils.song_queue import SongQueue
+
+
+def filled(count):
+    queue = SongQueue()
+    for number in range(1, count + 1):
+        queue.put_nowait({'title': f'Song {number}', 'artist': 'Artist', 'duration': 180})
+    return queue
+
+
+def test_pages_are_clamped_and_rerendered_after_changes():
+    queue = filled(25)
+    pages = QueuePages(queue, per_page=10)
+    assert pages.page_count() == 3
+    assert pages.render(0).startswith('**Queue:** 25 songs (page 1/3)')
+    assert '21. **Song 21**' in pages.render(2)
+    assert pages.render(-1) == pages.render(0)
+    assert pages.render(7) == pages.render(2)
+
+    for _ in range(20):
+        queue.get_nowait()
+    assert pages.page_count() == 1
+    assert pages.render(2).startswith('**Queue:** 5 songs (page 1/1)')
+    assert '1. **Song 21**' in pages.render(0)
+
+    queue.clear()
+    assert pages.page_count() == 1
+    assert pages.render(0) == "The queue is empty."
+
+
+class FakeResponse:
+    def __init__(self):
+        self.edits = []
+
+    async def edit_message(self, content, view):
+        self.edits.append(content)
+
+
+class FakeInteraction:
+    def __init__(self):
+        self.response = FakeResponse()
+
+
+def test_buttons_jump_between_pages():
+    async def body():
+        pages = QueuePages(filled(25), per_page=10)
+        view = QueueView(pages)
+        first, previous, following, last = view.children
+        interaction = FakeInteraction()
+
+        await following.callback(interaction)
+        assert view.page == 1
+        await last.callback(interaction)
+        assert view.page == 2
+        await following.callback(interaction)  # Already on the last page
+        assert view.page == 2
+        await previous.callback(interaction)
+        assert view.page == 1
+        await first.callback(interaction)
+        await previous.callback(interaction)  # Already on the first page
+        assert view.page == 0
+        assert interaction.response.edits[1].startswith('**Queue:** 25 songs (page 3/3)')
+
+    asyncio.run(body())
@@ -0,0 +1,194 @@
+import asyncio
+import threading
+
+import pytest
+
+from utils.errors import ResolverUnavailableError, TrackNotFoundError
+from utils.resolvers import Backend, CircuitBreaker, DirectResolver, Resolver, ResolverRegistry, normalize_query
+
+
+def test_direct_resolver_plays_http_audio_links():
+    resolver = DirectResolver()
+    assert resolver.matches('https://example.com/song.mp3')
+    song = asyncio.run(resolver.resolve('https://example.com/song.mp3'))
+    assert song['source'] == 'https://example.com/song.mp3'
+    assert song['title'] == 'song'
+
+
+def test_direct_resolver_rejects_local_files_by_default(tmp_path):
+    path = tmp_path / 'song.mp3'
+    path.write_bytes(b'')
+    resolver = DirectResolver()
+    # A bare path is left to the search backends instead of being probed.
+    assert not resolver.matches(str(path))
+    assert resolver.matches(path.as_uri())
+    with pytest.raises(TrackNotFoundError):
+        asyncio.run(resolver.resolve(path.as_uri()))
+
+
+def test_direct_resolver_plays_local_files_when_allowed(tmp_path):
+    path = tmp_path / 'song.mp3'
+    path.write_bytes(b'')
+    resolver = DirectResolver(allow_local_files=True)
+    assert resolver.matches(str(path))
+    assert asyncio.run(resolver.resolve(path.as_uri()))['source'] == str(path)
+
+
+class FakeResolver(Resolver):
+    def __init__(self, name: str, domain: str, available: bool = True):
+        self.name = name
+        self.domain = domain
+        self.available = available
+        self.calls = 0
+
+    def matches(self, query: str) -> bool:
+        return self.domain in query
+
+    async def resolve(self, query: str) -> dict:
+        self.calls += 1
+        if not self.available:
+            raise ConnectionError("backend is down")
+        return {'source': query, 'url': query, 'title': self.name, 'artist': 'Unknown', 'duration': 0}
+
+
+def make_registry():
+    registry = ResolverRegistry()
+    soundcloud = FakeResolver('soundcloud', 'soundcloud.com')
+    youtube = FakeResolver('youtube', 'youtube.com', available=False)
+    registry.register(soundcloud, fallback='youtube')
+    registry.register(youtube, default=True, fallback='soundcloud')
+    return registry, youtube, soundcloud
+
+
+def test_search_falls_back_while_the_default_backend_is_down():
+    registry, youtube, soundcloud = make_registry()
+    song = asyncio.run(registry.resolve('never gonna give you up'))
+    assert song['title'] == 'soundcloud'
+    assert youtube.calls == soundcloud.calls == 1
+
+
+@pytest.mark.parametrize('query', [
+    'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+    'youtube.com/watch?v=dQw4w9WgXcQ',
+])
+def test_links_do_not_fall_back(query):
+    registry, youtube, soundcloud = make_registry()
+    with pytest.raises(ResolverUnavailableError):
+        asyncio.run(registry.resolve(query))
+    assert soundcloud.calls == 0
+
+
+def test_circuit_opens_after_repeated_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_circuit_lets_one_trial_through(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('utils.resolvers.time.monotonic', lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    now[0] += 30
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+    # A failed trial opens the circuit again for another cool-down.
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    now[0] += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow() and breaker.allow()
+
+
+@pytest.mark.parametrize('query', [
+    'youtube.com/watch?v=AbC',
+    'https://www.youtube.com/watch?v=AbC&si=shared',
+    'YouTube.com/watch?v=AbC',
+    'youtu.be/AbC',
+])
+def test_links_with_and_without_scheme_share_a_key(query):
+    assert normalize_query(query) == 'youtube.com/watch?v=AbC'
+
+
+def test_link_case_is_kept_apart():
+    assert normalize_query('youtube.com/watch?v=AbC') != normalize_query('youtube.com/watch?v=abc')
+
+
+def test_search_text_is_normalized():
+    assert normalize_query('  Never Gonna   Give You Up ') == 'never gonna give you up'
+
+
+class SlowResolver(Resolver):
+    """Extracts in an executor thread, like youtube_dl, and blocks until released."""
+
+    name = 'slow'
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.running = 0
+        self.most_running = 0
+        self.lock = threading.Lock()
+
+    def _extract(self, query: str) -> dict:
+        with self.lock:
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+        self.release.wait(5)
+        with self.lock:
+            self.running -= 1
+        return {'source': query, 'url': query, 'title': query, 'artist': 'Unknown', 'duration': 0}
+
+    async def resolve(self, query: str) -> dict:
+        return await asyncio.get_running_loop().run_in_executor(None, self._extract, query)
+
+
+def test_cancelled_trial_does_not_jam_the_circuit():
+    async def run():
+        resolver = SlowResolver()
+        backend = Backend(resolver, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0))
+        backend.breaker.record_failure()
+        trial = asyncio.ensure_future(backend.resolve('song'))
+        await asyncio.sleep(0.05)
+        trial.cancel()
+        await asyncio.gather(trial, return_exceptions=True)
+        resolver.release.set()
+        return backend.breaker.allow()
+
+    assert asyncio.run(run())
+
+
+def test_timed_out_lookups_keep_their_slot():
+    async def run():
+        resolver = SlowResolver()
+        backend = Backend(resolver, max_concurrency=1, timeout=0.05)
+        results = []
+        for i in range(3):
+            # Each call starts after the previous one timed out while its thread kept extracting.
+            results += await asyncio.gather(backend.resolve(f'song {i}'), return_exceptions=True)
+        resolver.release.set()
+        await asyncio.sleep(0.05)
+        return resolver, results, backend.semaphore.locked()
+
+    resolver, results, locked = asyncio.run(run())
+    assert all(isinstance(result, ResolverUnavailableError) for result in results)
+    assert resolver.most_running == 1
+    assert not locked
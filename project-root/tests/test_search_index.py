@@ -0,0 +1,79 @@
+import time
+
+import pytest
+
+from utils.database import Database
+from utils.search_index import SearchIndex
+
+
+@pytest.fixture
+def database():
+    database = Database(':memory:')
+    database.connect()
+    return database
+
+
+def song(number, title, artist='Rick Astley', source=None):
+    return {'source': source or f'https://cdn.example.com/{number}.mp3', 'url': f'https://example.com/track/{number}',
+            'title': title, 'artist': artist, 'duration': 200}
+
+
+def test_strong_match_needs_enough_title_coverage(database):
+    index = SearchIndex(database, min_coverage=0.6)
+    # Bracketed parts and the artist's name do not count towards the title.
+    title, artist = 'Rick Astley - Never Gonna Give You Up (Official Video)', 'Rick Astley'
+    assert index._is_strong(['never', 'gonna', 'give'], title, artist)  # 3 of 5 words
+    assert not index._is_strong(['never', 'gonna'], title, artist)  # 2 of 5 words
+    assert index._is_strong(['never', 'gonna', 'g'], title, artist)  # The last word is a prefix
+    assert not index._is_strong(['gonna', 'never', 'x'], title, artist)
+
+
+def test_lookup_returns_only_strong_matches(database):
+    index = SearchIndex(database)
+    index.add(song(1, 'Rick Astley - Never Gonna Give You Up (Official Video)'))
+    assert index.lookup('never gonna give you')['url'] == 'https://example.com/track/1'
+    assert index.lookup('never') is None
+    assert index.lookup('https://example.com/track/1')['title'].startswith('Rick Astley')
+    assert index.stats['hits'] == 2
+    assert index.stats['misses'] == 1
+
+
+def test_is_fresh_reads_the_expire_parameter(database):
+    index = SearchIndex(database, expiry_margin=60)
+    now = int(time.time())
+    assert index.is_fresh(song(1, 'a'))
+    assert index.is_fresh(song(1, 'a', source=f'https://cdn.example.com/a?expire={now + 3600}'))
+    # Expired, about to expire within the margin, or unreadable.
+    assert not index.is_fresh(song(1, 'a', source=f'https://cdn.example.com/a?expire={now - 10}'))
+    assert not index.is_fresh(song(1, 'a', source=f'https://cdn.example.com/a?expire={now + 30}'))
+    assert not index.is_fresh(song(1, 'a', source='https://cdn.example.com/a?expire=soon'))
+    assert index.stats['expired'] == 3
+
+
+def test_suggest_matches_partially_typed_text(database):
+    index = SearchIndex(database)
+    index.add(song(1, 'Never Gonna Give You Up'))
+    index.add(song(2, 'Never Gonna Stop', artist='Someone Else'))
+    index.add(song(3, 'Together Forever'))
+    assert {found['url'] for found in index.suggest('never gon')} == {
+        'https://example.com/track/1', 'https://example.com/track/2'
+    }
+    assert [found['url'] for found in index.suggest('toge')] == ['https://example.com/track/3']
+    assert len(index.suggest('never', limit=1)) == 1
+    assert index.suggest('') == []
+
+
+def test_local_files_are_only_returned_when_allowed(database):
+    local = song(1, 'Never Gonna Give You Up', source='/music/never.mp3')
+    local['url'] = '/music/never.mp3'
+    SearchIndex(database).add(local)
+
+    index = SearchIndex(database, allow_local_files=False)
+    assert index.lookup('/music/never.mp3') is None
+    assert index.lookup('never gonna give you up') is None
+    assert index.suggest('never') == []
+
+    index = SearchIndex(database, allow_local_files=True)
+    assert index.lookup('/music/never.mp3')['source'] == '/music/never.mp3'
+    assert index.lookup('never gonna give you up') is not None
+    assert len(index.suggest('never')) == 1
@@ -0,0 +1,72 @@
+import asyncio
+
+from utils.single_flight import SingleFlight
+
+
+class CountingResolver:
+    """Resolves every query after a short delay and counts how often it was asked."""
+
+    def __init__(self, error: Exception = None):
+        self.error = error
+        self.calls = 0
+
+    async def resolve(self, query: str) -> dict:
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        if self.error is not None:
+            raise self.error
+        return {'title': query}
+
+
+def test_concurrent_calls_share_one_execution():
+    async def run():
+        flights = SingleFlight()
+        resolver = CountingResolver()
+        results = await asyncio.gather(*(flights.do('song', lambda: resolver.resolve('song')) for _ in range(1000)))
+        return flights, resolver, results
+
+    flights, resolver, results = asyncio.run(run())
+    assert resolver.calls == 1
+    assert all(result is results[0] for result in results)
+    assert flights.stats['collapsed'] == 999
+    assert not flights.flights
+
+
+def test_errors_reach_every_caller():
+    async def run():
+        flights = SingleFlight()
+        resolver = CountingResolver(LookupError('not found'))
+        errors = await asyncio.gather(*(flights.do('missing', lambda: resolver.resolve('missing')) for _ in range(1000)),
+                                      return_exceptions=True)
+        return flights, resolver, errors
+
+    flights, resolver, errors = asyncio.run(run())
+    assert resolver.calls == 1
+    assert all(isinstance(error, LookupError) for error in errors)
+    assert flights.stats['errors'] == 1
+
+
+def test_results_are_not_cached_after_the_call():
+    async def run():
+        flights = SingleFlight()
+        resolver = CountingResolver()
+        await flights.do('song', lambda: resolver.resolve('song'))
+        await flights.do('song', lambda: resolver.resolve('song'))
+        return resolver
+
+    assert asyncio.run(run()).calls == 2
+
+
+def test_a_cancelled_caller_does_not_cancel_the_others():
+    async def run():
+        flights = SingleFlight()
+        resolver = CountingResolver()
+        impatient = asyncio.ensure_future(flights.do('song', lambda: resolver.resolve('song')))
+        patient = asyncio.ensure_future(flights.do('song', lambda: resolver.resolve('song')))
+        await asyncio.sleep(0.01)
+        impatient.cancel()
+        return impatient, await patient
+
+    impatient, result = asyncio.run(run())
+    assert impatient.cancelled()
+    assert result == {'title': 'song'}
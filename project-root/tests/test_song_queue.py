@@ -0,0 +1,28 @@
+from utils.song_queue import SongQueue
+
+
+def song(number):
+    return {'title': f'Song {number}', 'artist': 'Artist', 'duration': 180}
+
+
+def filled(count):
+    queue = SongQueue()
+    for number in range(1, count + 1):
+        queue.put_nowait(song(number))
+    return queue
+
+
+def test_snapshot_is_reused_until_the_queue_changes():
+    queue = filled(2)
+    snapshot = queue.snapshot()
+    assert [entry['title'] for entry in snapshot] == ['Song 1', 'Song 2']
+    assert queue.snapshot() is snapshot
+
+    queue.put_nowait(song(3))
+    assert [entry['title'] for entry in queue.snapshot()] == ['Song 1', 'Song 2', 'Song 3']
+
+    queue.get_nowait()
+    assert [entry['title'] for entry in queue.snapshot()] == ['Song 2', 'Song 3']
+
+    queue.clear()
+    assert queue.snapshot() == []
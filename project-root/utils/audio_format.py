@@ -0,0 +1,13 @@
+# The PCM frame format and EQ bands shared by the players, the mixer and the DSP chain.
+# Kept free of NumPy so the bot can import it while starting; the modules that
+# process audio are only imported once the first session needs them.
+
+SAMPLE_RATE = 48000
+CHANNELS = 2
+FRAME_SAMPLES = 960  # 20 ms at 48 kHz
+FRAME_SIZE = FRAME_SAMPLES * CHANNELS * 2  # Bytes of s16le PCM per frame
+FRAME_DURATION = 0.02  # Seconds of audio per frame
+
+# Centre frequencies of the parametric EQ bands in Hz
+EQ_BANDS = {'bass': 100.0, 'mid': 1000.0, 'treble': 8000.0}
+EQ_MAX_GAIN_DB = 12.0
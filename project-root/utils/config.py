@@ -41,6 +41,13 @@ class Config:
             'spotify_client_secret': os.getenv('SPOTIFY_CLIENT_SECRET'),
             'soundcloud_client_id': os.getenv('SOUNDCLOUD_CLIENT_ID'),
             'soundcloud_client_secret': os.getenv('SOUNDCLOUD_CLIENT_SECRET'),
+            'idle_alone_timeout': os.getenv('IDLE_ALONE_TIMEOUT'),
+            'idle_paused_timeout': os.getenv('IDLE_PAUSED_TIMEOUT'),
+            'idle_finished_timeout': os.getenv('IDLE_FINISHED_TIMEOUT'),
+            'read_ahead_seconds': os.getenv('READ_AHEAD_SECONDS'),
+            'prebuffer_seconds': os.getenv('PREBUFFER_SECONDS'),
+            'audio_nodes': os.getenv('AUDIO_NODES'),
+            'allow_local_files': os.getenv('ALLOW_LOCAL_FILES'),
         }
 
     def save(self):
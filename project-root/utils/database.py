@@ -50,6 +50,59 @@ class Database:
                 )
                 """
             )
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS history (
+                    id INTEGER PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    title TEXT,
+                    artist TEXT,
+                    duration INTEGER,
+                    played_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+                """
+            )
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS loudness (
+                    url TEXT PRIMARY KEY,
+                    integrated_lufs REAL NOT NULL,
+                    peak_dbfs REAL NOT NULL,
+                    analyzed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+                """
+            )
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS tracks (
+                    id INTEGER PRIMARY KEY,
+                    url TEXT UNIQUE NOT NULL,
+                    source TEXT NOT NULL,
+                    title TEXT,
+                    artist TEXT,
+                    duration INTEGER,
+                    resolved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+                """
+            )
+            # Full-text index over the titles and artists of resolved tracks, kept in sync by triggers.
+            self.connection.executescript(
+                """
+                CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts USING fts5(
+                    title, artist, content='tracks', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+                );
+                CREATE TRIGGER IF NOT EXISTS tracks_ai AFTER INSERT ON tracks BEGIN
+                    INSERT INTO tracks_fts (rowid, title, artist) VALUES (new.id, new.title, new.artist);
+                END;
+                CREATE TRIGGER IF NOT EXISTS tracks_ad AFTER DELETE ON tracks BEGIN
+                    INSERT INTO tracks_fts (tracks_fts, rowid, title, artist) VALUES ('delete', old.id, old.title, old.artist);
+                END;
+                CREATE TRIGGER IF NOT EXISTS tracks_au AFTER UPDATE ON tracks BEGIN
+                    INSERT INTO tracks_fts (tracks_fts, rowid, title, artist) VALUES ('delete', old.id, old.title, old.artist);
+                    INSERT INTO tracks_fts (rowid, title, artist) VALUES (new.id, new.title, new.artist);
+                END;
+                """
+            )
             self.connection.commit()
         except Exception as e:
             raise DatabaseError(f"Error connecting to database: {e}")
@@ -324,6 +377,161 @@ class Database:
         except Exception as e:
             raise DatabaseError(f"Error removing user from whitelist: {e}")
 
+    def add_history(self, url: str, title: str, artist: str, duration: int) -> bool:
+        """
+        Records that a track was played.
+
+        Args:
+            url: The stable URL or path of the track.
+            title: The title of the track.
+            artist: The artist of the track.
+            duration: The duration of the track in seconds.
+
+        Returns:
+            True if the play was recorded successfully, False otherwise.
+        """
+        try:
+            self.connection.execute(
+                "INSERT INTO history (url, title, artist, duration) VALUES (?, ?, ?, ?)",
+                (url, title, artist, duration)
+            )
+            self.connection.commit()
+            return True
+        except Exception as e:
+            raise DatabaseError(f"Error adding history entry: {e}")
+
+    def get_unanalyzed_history(self) -> list:
+        """
+        Retrieves the distinct tracks in the history that have no loudness measurement yet.
+
+        Returns:
+            A list of track URLs.
+        """
+        try:
+            cursor = self.connection.execute(
+                """
+                SELECT DISTINCT history.url FROM history
+                LEFT JOIN loudness ON loudness.url = history.url
+                WHERE loudness.url IS NULL
+                """
+            )
+            return [row[0] for row in cursor.fetchall()]
+        except Exception as e:
+            raise DatabaseError(f"Error getting unanalyzed history: {e}")
+
+    def set_loudness(self, url: str, integrated_lufs: float, peak_dbfs: float) -> bool:
+        """
+        Stores the loudness measurement of a track.
+
+        Args:
+            url: The stable URL or path of the track.
+            integrated_lufs: The integrated loudness in LUFS.
+            peak_dbfs: The true peak in dBFS.
+
+        Returns:
+            True if the measurement was stored successfully, False otherwise.
+        """
+        try:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO loudness (url, integrated_lufs, peak_dbfs) VALUES (?, ?, ?)",
+                (url, integrated_lufs, peak_dbfs)
+            )
+            self.connection.commit()
+            return True
+        except Exception as e:
+            raise DatabaseError(f"Error storing loudness: {e}")
+
+    def get_loudness(self, url: str) -> Union[Tuple[float, float], None]:
+        """
+        Retrieves the loudness measurement of a track.
+
+        Args:
+            url: The stable URL or path of the track.
+
+        Returns:
+            A tuple of the integrated loudness in LUFS and the peak in dBFS if measured, None otherwise.
+        """
+        try:
+            cursor = self.connection.execute(
+                "SELECT integrated_lufs, peak_dbfs FROM loudness WHERE url = ?", (url,)
+            )
+            return cursor.fetchone()
+        except Exception as e:
+            raise DatabaseError(f"Error getting loudness: {e}")
+
+    def add_track(self, url: str, source: str, title: str, artist: str, duration: int) -> bool:
+        """
+        Stores a resolved track in the search index, replacing an earlier resolution of the same track.
+
+        Args:
+            url: The stable URL or path of the track.
+            source: The playable source the track was resolved to.
+            title: The title of the track.
+            artist: The artist of the track.
+            duration: The duration of the track in seconds.
+
+        Returns:
+            True if the track was stored successfully, False otherwise.
+        """
+        try:
+            self.connection.execute(
+                """
+                INSERT INTO tracks (url, source, title, artist, duration) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (url) DO UPDATE SET
+                    source = excluded.source, title = excluded.title, artist = excluded.artist,
+                    duration = excluded.duration, resolved_at = CURRENT_TIMESTAMP
+                """,
+                (url, source, title, artist, duration)
+            )
+            self.connection.commit()
+            return True
+        except Exception as e:
+            raise DatabaseError(f"Error adding track: {e}")
+
+    def get_track(self, url: str) -> Union[Tuple[str, str, str, str, int], None]:
+        """
+        Retrieves a resolved track by its stable URL.
+
+        Args:
+            url: The stable URL or path of the track.
+
+        Returns:
+            A tuple of url, source, title, artist and duration if found, None otherwise.
+        """
+        try:
+            cursor = self.connection.execute(
+                "SELECT url, source, title, artist, duration FROM tracks WHERE url = ?", (url,)
+            )
+            return cursor.fetchone()
+        except Exception as e:
+            raise DatabaseError(f"Error getting track: {e}")
+
+    def search_tracks(self, match: str, limit: int = 10) -> list:
+        """
+        Searches the titles and artists of resolved tracks.
+
+        Args:
+            match: An FTS5 match expression.
+            limit: The maximum number of results.
+
+        Returns:
+            A list of (url, source, title, artist, duration) tuples, best matches first.
+        """
+        try:
+            cursor = self.connection.execute(
+                """
+                SELECT tracks.url, tracks.source, tracks.title, tracks.artist, tracks.duration
+                FROM tracks_fts JOIN tracks ON tracks.id = tracks_fts.rowid
+                WHERE tracks_fts MATCH ?
+                ORDER BY bm25(tracks_fts, 2.0, 1.0)
+                LIMIT ?
+                """,
+                (match, limit)
+            )
+            return cursor.fetchall()
+        except Exception as e:
+            raise DatabaseError(f"Error searching tracks: {e}")
+
 class DatabaseError(Exception):
     """Custom exception class for database errors."""
     pass
\ No newline at end of file
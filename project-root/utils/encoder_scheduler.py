@@ -0,0 +1,230 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+import discord
+
+from utils.errors import SessionRejectedError
+
+FRAME_BUDGET = 0.02  # Seconds available to produce one 20 ms frame
+OPUS_SET_COMPLEXITY_REQUEST = 4010
+DEFAULT_FRAME_COST = 0.001  # Assumed CPU seconds per frame of a session without measurements
+
+# (pressure threshold, Opus complexity, maximum bitrate in kbps), checked in order
+ENCODER_TIERS = (
+    (0.5, 10, 512),
+    (0.75, 8, 128),
+    (0.9, 5, 96),
+    (float('inf'), 3, 64),
+)
+
+
+def set_complexity(encoder: discord.opus.Encoder, complexity: int) -> bool:
+    """
+    Sets the complexity of an Opus encoder.
+
+    The library has no API for this, so it goes through its private ctypes
+    bindings. This is the only place that touches them.
+
+    Args:
+        encoder: The encoder to change.
+        complexity: The Opus complexity from 0 to 10.
+
+    Returns:
+        False if the bindings of this library version do not expose what is needed.
+    """
+    ctl = getattr(getattr(discord.opus, '_lib', None), 'opus_encoder_ctl', None)
+    state = getattr(encoder, '_state', None)
+    if ctl is None or state is None:
+        return False
+    ctl(state, OPUS_SET_COMPLEXITY_REQUEST, complexity)
+    return True
+
+
+class EncoderSession:
+    """
+    The Opus encoder of a single voice session together with its measured cost.
+
+    The encoder is only used from the thread that encodes the session's
+    frames. Other threads request new settings through configure(), and the
+    encoding thread applies them before its next frame.
+    """
+
+    def __init__(self, key: int, channel_bitrate: int, window: int = 250):
+        """
+        Initializes the session.
+
+        Args:
+            key: The ID of the guild the session belongs to.
+            channel_bitrate: The bitrate of the voice channel in bits per second.
+            window: The number of recent frames the cost is averaged over.
+        """
+        self.key = key
+        self.channel_bitrate = channel_bitrate
+        self.encoder = discord.opus.Encoder()
+        self.bitrate = 0
+        self.complexity = 10
+        # The settings requested last and the request applied last; swapped whole, so no lock is needed.
+        self.target: Tuple[int, int] = (self.bitrate, self.complexity)
+        self.applied = self.target
+        self.costs = deque(maxlen=window)
+        self.frames = 0
+        self.cpu_time = 0.0
+        self.deadline_misses = 0
+
+    def encode(self, pcm: bytes) -> bytes:
+        """Encodes a frame of PCM into an Opus packet, applying requested settings first."""
+        target = self.target
+        if target is not self.applied:
+            self.applied = target
+            self._apply(*target)
+        return self.encoder.encode(pcm, self.encoder.SAMPLES_PER_FRAME)
+
+    def record(self, cpu: float, wall: float):
+        """
+        Records the cost of producing a frame.
+
+        Args:
+            cpu: The CPU time spent decoding, processing and encoding the frame.
+            wall: The wall time it took until the frame was ready.
+        """
+        self.costs.append(cpu)
+        self.frames += 1
+        self.cpu_time += cpu
+        if wall > FRAME_BUDGET:
+            self.deadline_misses += 1
+
+    @property
+    def frame_cost(self) -> float:
+        """The average CPU seconds per frame over the recent window."""
+        if not self.costs:
+            return DEFAULT_FRAME_COST
+        return sum(self.costs) / len(self.costs)
+
+    def configure(self, bitrate_kbps: int, complexity: int):
+        """Requests new encoder settings. Safe from any thread; they are used from the next frame on."""
+        if (bitrate_kbps, complexity) != self.target:
+            self.target = (bitrate_kbps, complexity)
+
+    def _apply(self, bitrate_kbps: int, complexity: int):
+        if bitrate_kbps != self.bitrate:
+            self.bitrate = self.encoder.set_bitrate(bitrate_kbps)
+        if complexity != self.complexity and set_complexity(self.encoder, complexity):
+            self.complexity = complexity
+
+
+class EncoderScheduler:
+    """
+    Shares the host's CPU between all voice sessions.
+
+    Every session reports how long its frames take. From that the scheduler
+    derives the load of the host, admits new sessions only while there is room
+    left in the 20 ms budget, and lowers Opus bitrate and complexity of all
+    sessions as the load rises.
+    """
+
+    def __init__(self, cores: Optional[int] = None, utilization: float = 0.75, interval: float = 5.0):
+        """
+        Initializes the scheduler.
+
+        Args:
+            cores: The number of cores available for audio. Defaults to all cores.
+            utilization: The share of the available CPU time sessions may use.
+            interval: How often encoder settings are re-evaluated, in seconds.
+        """
+        self.cores = cores or os.cpu_count() or 1
+        self.utilization = utilization
+        self.interval = interval
+        self.sessions: Dict[int, EncoderSession] = {}
+        self.rejected = 0
+        self.last_rebalance = 0.0
+        # Sessions report from their own audio threads.
+        self.lock = threading.Lock()
+
+    @property
+    def capacity(self) -> float:
+        """The CPU seconds that may be spent per 20 ms frame interval across all sessions."""
+        return self.cores * FRAME_BUDGET * self.utilization
+
+    def load(self) -> float:
+        """The CPU seconds currently spent per frame interval across all sessions."""
+        return sum(session.frame_cost for session in self.sessions.values())
+
+    def pressure(self) -> float:
+        """The load of the host between 0 and 1 (or more when overloaded)."""
+        own = self.load() / self.capacity
+        try:
+            host = os.getloadavg()[0] / self.cores
+        except OSError:
+            host = 0.0
+        return max(own, host)
+
+    def admit(self, key: int, channel_bitrate: int) -> EncoderSession:
+        """
+        Creates an encoder session if the host can still produce its frames in time.
+
+        Args:
+            key: The ID of the guild the session belongs to.
+            channel_bitrate: The bitrate of the voice channel in bits per second.
+
+        Returns:
+            The new session.
+
+        Raises:
+            SessionRejectedError: If admitting the session would exceed the CPU budget.
+        """
+        with self.lock:
+            existing = self.sessions.pop(key, None)
+            estimate = existing.frame_cost if existing else (
+                self.load() / len(self.sessions) if self.sessions else DEFAULT_FRAME_COST
+            )
+            if self.load() + estimate > self.capacity:
+                self.rejected += 1
+                raise SessionRejectedError("The bot is at capacity right now. Please try again later.")
+            session = EncoderSession(key, channel_bitrate)
+            self.sessions[key] = session
+            self._configure(session, self.pressure())
+            return session
+
+    def release(self, key: int, session: Optional[EncoderSession] = None):
+        """Removes a session. If a session is given, it is only removed while it is still the current one."""
+        with self.lock:
+            if session is None or self.sessions.get(key) is session:
+                self.sessions.pop(key, None)
+
+    def record(self, session: EncoderSession, cpu: float, wall: float):
+        """Records the cost of a frame and periodically re-evaluates encoder settings."""
+        session.record(cpu, wall)
+        now = time.monotonic()
+        if now - self.last_rebalance >= self.interval:
+            self.last_rebalance = now
+            self.rebalance()
+
+    def rebalance(self):
+        """Adapts bitrate and complexity of every session to the current load."""
+        with self.lock:
+            pressure = self.pressure()
+            for session in self.sessions.values():
+                self._configure(session, pressure)
+
+    def _configure(self, session: EncoderSession, pressure: float):
+        for threshold, complexity, max_bitrate in ENCODER_TIERS:
+            if pressure < threshold:
+                break
+        session.configure(min(max_bitrate, session.channel_bitrate // 1000), complexity)
+
+    def report(self) -> str:
+        """Formats the load of the host and the cost of every session."""
+        lines = [
+            f"Load {self.load() * 1000:.2f} of {self.capacity * 1000:.2f} ms per frame "
+            f"({self.cores} cores), pressure {self.pressure():.2f}, {self.rejected} sessions rejected"
+        ]
+        for session in self.sessions.values():
+            lines.append(
+                f"{session.key}: {session.frame_cost * 1000:.2f} ms/frame, "
+                f"{session.cpu_time:.1f} s CPU, {session.deadline_misses} of {session.frames} frames late, "
+                f"{session.bitrate} kbps, complexity {session.complexity}"
+            )
+        return '\n'.join(lines)
@@ -15,4 +15,29 @@ class MusicError(BotError):
 
 class DatabaseError(BotError):
     """Error class for database-related issues."""
-    pass
\ No newline at end of file
+    pass
+
+
+class TrackNotFoundError(MusicError):
+    """Error class for searches that returned no results."""
+    pass
+
+
+class ResolverUnavailableError(MusicError):
+    """Error class for music backends that are degraded or overloaded."""
+    pass
+
+
+class SessionRejectedError(MusicError):
+    """Error class for voice sessions the host has no capacity for."""
+    pass
+
+
+class StreamStalledError(MusicError):
+    """Error class for FFmpeg streams that stopped producing output."""
+    pass
+
+
+class AudioNodeError(MusicError):
+    """Error class for audio nodes that are unreachable or failed a request."""
+    pass
@@ -0,0 +1,249 @@
+import asyncio
+import os
+import resource
+import subprocess
+import time
+import weakref
+from collections import deque
+from typing import Optional, Set
+
+from utils.errors import StreamStalledError
+
+
+class FFmpegProcess:
+    """An FFmpeg child process owned by a supervisor, together with the tail of its log."""
+
+    def __init__(self, process: asyncio.subprocess.Process, label: str, log_lines: int):
+        """
+        Initializes the process wrapper.
+
+        Args:
+            process: The running FFmpeg process.
+            label: A short description used in logs and reports.
+            log_lines: How many lines of stderr are kept.
+        """
+        self.process = process
+        self.label = label
+        self.log = deque(maxlen=log_lines)
+        self.started = time.monotonic()
+        self.stopping = False
+        self.abandoned = False
+        self.drainer: Optional[asyncio.Task] = None
+        self.finalizer: Optional[weakref.finalize] = None
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    @property
+    def stdout(self) -> Optional[asyncio.StreamReader]:
+        return self.process.stdout
+
+    @property
+    def returncode(self) -> Optional[int]:
+        return self.process.returncode
+
+    def tail(self, lines: int = 5) -> str:
+        """Returns the last lines FFmpeg wrote to stderr."""
+        return '\n'.join(list(self.log)[-lines:])
+
+
+class FFmpegSupervisor:
+    """
+    Owns every FFmpeg child process of the bot.
+
+    Each process gets its stderr drained into a bounded ring buffer, so a
+    chatty stream can never fill the pipe and block FFmpeg. Processes are
+    started with a lower priority and a memory limit, reads from their output
+    time out when a stream stalls, and teardown escalates from terminate to
+    kill after a grace period. A process whose owner is garbage collected
+    without stopping it is killed as well.
+    """
+
+    def __init__(self, grace: float = 2.0, stall_timeout: float = 5.0, log_lines: int = 50,
+                 memory_limit: Optional[int] = 1024 * 1024 * 1024, niceness: int = 0):
+        """
+        Initializes the supervisor.
+
+        Args:
+            grace: Seconds a process has to exit after being terminated before it is killed.
+            stall_timeout: Seconds without output after which a stream counts as stalled.
+            log_lines: How many lines of stderr are kept per process.
+            memory_limit: The address space limit of each process in bytes, or None for no limit.
+            niceness: How much to lower the priority of playback processes.
+        """
+        self.grace = grace
+        self.stall_timeout = stall_timeout
+        self.log_lines = log_lines
+        self.memory_limit = memory_limit
+        self.niceness = niceness
+        self.processes: Set[FFmpegProcess] = set()
+        self.stats = {'spawned': 0, 'exited': 0, 'failed': 0, 'killed': 0, 'reaped': 0, 'stalls': 0, 'restarts': 0}
+
+    @property
+    def live(self) -> int:
+        """The number of FFmpeg processes that are still running."""
+        return sum(1 for process in self.processes if process.returncode is None)
+
+    async def spawn(self, *args: str, owner=None, stdout=subprocess.PIPE, niceness: Optional[int] = None,
+                    label: str = 'ffmpeg') -> FFmpegProcess:
+        """
+        Starts an FFmpeg process.
+
+        Args:
+            args: The arguments passed to FFmpeg.
+            owner: An object whose garbage collection kills the process if it was not stopped.
+            stdout: Where the process writes its output.
+            niceness: How much to lower the process' priority. Defaults to the supervisor's setting.
+            label: A short description used in logs and reports.
+
+        Returns:
+            The running process.
+        """
+        niceness = self.niceness if niceness is None else niceness
+        process = await asyncio.create_subprocess_exec(
+            'ffmpeg', '-nostdin', '-hide_banner', *args,
+            stdin=subprocess.DEVNULL,
+            stdout=stdout,
+            stderr=subprocess.PIPE
+        )
+        self._limit(process.pid, niceness)
+        ffmpeg = FFmpegProcess(process, label, self.log_lines)
+        ffmpeg.drainer = asyncio.ensure_future(self._drain(ffmpeg))
+        self.processes.add(ffmpeg)
+        self.stats['spawned'] += 1
+        if owner is not None:
+            ffmpeg.finalizer = weakref.finalize(owner, self._reap, ffmpeg)
+        return ffmpeg
+
+    def _limit(self, pid: int, niceness: int):
+        """
+        Applies priority and resource limits to a started process.
+
+        This is done from the parent rather than with preexec_fn, which is not
+        safe once the bot runs threads (the audio threads, the executor).
+        FFmpeg runs unrestricted for the moment until the limits are applied,
+        which is too short to matter for either of them.
+        """
+        try:
+            if niceness:
+                os.setpriority(os.PRIO_PROCESS, pid, os.getpriority(os.PRIO_PROCESS, 0) + niceness)
+            if self.memory_limit is not None and hasattr(resource, 'prlimit'):
+                resource.prlimit(pid, resource.RLIMIT_AS, (self.memory_limit, self.memory_limit))
+        except ProcessLookupError:
+            pass  # Exited already; its exit code is collected as usual.
+
+    async def _drain(self, ffmpeg: FFmpegProcess):
+        """Reads stderr until FFmpeg closes it, keeping only the most recent lines."""
+        stream = ffmpeg.process.stderr
+        while True:
+            try:
+                line = await stream.readline()
+            except ValueError:
+                # A line longer than the stream's buffer; drop it.
+                continue
+            if not line:
+                break
+            ffmpeg.log.append(line.decode(errors='replace').rstrip())
+        if ffmpeg.stopping:
+            self._abandon_output(ffmpeg)
+        returncode = await ffmpeg.process.wait()
+        self.processes.discard(ffmpeg)
+        if ffmpeg.finalizer is not None:
+            ffmpeg.finalizer.detach()
+        self.stats['exited'] += 1
+        # FFmpeg exits with 255 when it is terminated, so only unrequested exits count as failures.
+        if returncode != 0 and not ffmpeg.stopping:
+            self.stats['failed'] += 1
+            print(f"FFmpeg ({ffmpeg.label}) exited with code {returncode}:\n{ffmpeg.tail()}")
+
+    def _abandon_output(self, ffmpeg: FFmpegProcess):
+        """Discards unread output, since asyncio only reports the exit once every pipe is closed."""
+        if ffmpeg.stdout is not None and not ffmpeg.abandoned:
+            ffmpeg.abandoned = True
+            asyncio.ensure_future(_discard(ffmpeg.stdout))
+
+    async def read(self, ffmpeg: FFmpegProcess, size: int) -> bytes:
+        """
+        Reads exactly size bytes of output, or less once the output has ended.
+
+        Raises:
+            StreamStalledError: If no complete read was possible within the stall timeout.
+        """
+        try:
+            return await asyncio.wait_for(ffmpeg.stdout.readexactly(size), self.stall_timeout)
+        except asyncio.IncompleteReadError as e:
+            return e.partial
+        except asyncio.TimeoutError:
+            self.stats['stalls'] += 1
+            raise StreamStalledError(f"FFmpeg ({ffmpeg.label}) produced no output for {self.stall_timeout:g} seconds.")
+
+    async def wait(self, ffmpeg: FFmpegProcess, timeout: Optional[float] = None) -> Optional[int]:
+        """
+        Waits until a process has exited and its log has been drained.
+
+        Returns:
+            The exit code, or None if the process is still running after the timeout.
+        """
+        try:
+            await asyncio.wait_for(asyncio.shield(ffmpeg.drainer), timeout)
+        except asyncio.TimeoutError:
+            return None
+        return ffmpeg.returncode
+
+    async def stop(self, ffmpeg: FFmpegProcess):
+        """Terminates a process, killing it if it has not exited after the grace period."""
+        ffmpeg.stopping = True
+        self._abandon_output(ffmpeg)
+        if ffmpeg.returncode is None:
+            try:
+                ffmpeg.process.terminate()
+            except ProcessLookupError:
+                pass
+            try:
+                await asyncio.wait_for(ffmpeg.process.wait(), self.grace)
+            except asyncio.TimeoutError:
+                self.stats['killed'] += 1
+                try:
+                    ffmpeg.process.kill()
+                except ProcessLookupError:
+                    pass
+                await ffmpeg.process.wait()
+        await self.wait(ffmpeg)
+
+    def _reap(self, ffmpeg: FFmpegProcess):
+        """Kills a process whose owner was garbage collected without stopping it."""
+        if ffmpeg.returncode is None:
+            ffmpeg.stopping = True
+            self.stats['reaped'] += 1
+            try:
+                ffmpeg.process.kill()
+            except ProcessLookupError:
+                pass
+
+    async def close(self):
+        """Stops every process."""
+        await asyncio.gather(*(self.stop(ffmpeg) for ffmpeg in list(self.processes)))
+
+    def report(self) -> str:
+        """Formats the live processes and lifetime counters."""
+        lines = [
+            f"{self.live} live FFmpeg processes; {self.stats['spawned']} spawned, {self.stats['exited']} exited, "
+            f"{self.stats['failed']} failed, {self.stats['stalls']} stalls, {self.stats['restarts']} restarts, "
+            f"{self.stats['killed']} killed after grace, {self.stats['reaped']} reaped"
+        ]
+        now = time.monotonic()
+        for ffmpeg in sorted(self.processes, key=lambda ffmpeg: ffmpeg.started):
+            lines.append(f"{ffmpeg.pid}: {ffmpeg.label}, running {now - ffmpeg.started:.0f} s")
+        return '\n'.join(lines)
+
+
+async def _discard(stream: asyncio.StreamReader):
+    """Reads a stream until it ends, throwing the data away."""
+    while True:
+        try:
+            if not await stream.read(65536):
+                return
+        except RuntimeError:
+            # A reader is still waiting for output; let it finish first.
+            await asyncio.sleep(0.05)
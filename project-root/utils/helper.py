@@ -94,6 +94,26 @@ def format_time(seconds: int) -> str:
     minutes, seconds = divmod(remainder, 60)
     return f"{hours:02}:{minutes:02}:{seconds:02}"
 
+def parse_time(text: str) -> int:
+    """
+    Parses a time given as seconds, MM:SS or HH:MM:SS.
+
+    Args:
+        text: The time to parse.
+
+    Returns:
+        The time in seconds.
+
+    Raises:
+        ValueError: If the text is not a valid time.
+    """
+    seconds = 0
+    for part in text.strip().split(':'):
+        if not part.isdigit():
+            raise ValueError(f"Invalid time: {text}")
+        seconds = seconds * 60 + int(part)
+    return seconds
+
 def format_duration(seconds: int) -> str:
     """
     Formats a time duration in seconds into a human-readable string.
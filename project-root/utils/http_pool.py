@@ -0,0 +1,174 @@
+import asyncio
+import time
+from collections import defaultdict
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+from utils.metrics import LatencyTracker
+from utils.startup import startup
+
+if TYPE_CHECKING:
+    import aiohttp
+
+
+def load_aiohttp():
+    """Imports aiohttp on first use."""
+    return startup.import_module('aiohttp')
+
+
+class HTTPPool:
+    """
+    A shared aiohttp session for all provider API calls.
+
+    Connections are kept alive and reused across requests, limited per host,
+    and every request is timed per host. aiohttp speaks HTTP/1.1 without
+    pipelining, so keep-alive reuse is what saves the handshakes.
+    """
+
+    def __init__(self, limit: int = 64, limit_per_host: int = 8, keepalive_timeout: float = 30.0,
+                 timeout: float = 10.0):
+        """
+        Initializes the pool. The session is created lazily inside the running event loop.
+
+        Args:
+            limit: The maximum number of open connections.
+            limit_per_host: The maximum number of open connections to a single host.
+            keepalive_timeout: How long idle connections are kept open.
+            timeout: The default total timeout of a request in seconds.
+        """
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout
+        self._session: Optional['aiohttp.ClientSession'] = None
+        self.latency: Dict[str, LatencyTracker] = defaultdict(LatencyTracker)
+        self.stats = {'requests': 0, 'errors': 0, 'connections_created': 0, 'connections_reused': 0}
+
+    @property
+    def session(self) -> 'aiohttp.ClientSession':
+        """The shared session, created on first use."""
+        if self._session is None or self._session.closed:
+            aiohttp = load_aiohttp()
+            trace_config = aiohttp.TraceConfig()
+            trace_config.on_request_start.append(self._on_request_start)
+            trace_config.on_request_end.append(self._on_request_end)
+            trace_config.on_request_exception.append(self._on_request_exception)
+            trace_config.on_connection_create_end.append(self._on_connection_created)
+            trace_config.on_connection_reuseconn.append(self._on_connection_reused)
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout),
+                                                  trace_configs=[trace_config])
+        return self._session
+
+    async def request_json(self, method: str, url: str, **kwargs) -> Any:
+        """
+        Makes a request and decodes the JSON response.
+
+        Args:
+            method: The HTTP method.
+            url: The URL to request.
+            kwargs: Keyword arguments passed on to aiohttp.ClientSession.request.
+
+        Returns:
+            The decoded response body.
+
+        Raises:
+            aiohttp.ClientResponseError: If the server answered with an error status.
+        """
+        async with self.session.request(method, url, raise_for_status=True, **kwargs) as response:
+            return await response.json(content_type=None)
+
+    async def get_json(self, url: str, **kwargs) -> Any:
+        return await self.request_json('GET', url, **kwargs)
+
+    async def post_json(self, url: str, **kwargs) -> Any:
+        return await self.request_json('POST', url, **kwargs)
+
+    async def close(self):
+        """Closes the session and all pooled connections."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def report(self) -> str:
+        """Formats the request counters and per-host latencies."""
+        lines = [
+            f"{self.stats['requests']} requests, {self.stats['errors']} errors, "
+            f"{self.stats['connections_created']} connections opened, "
+            f"{self.stats['connections_reused']} reused"
+        ]
+        for host, tracker in sorted(self.latency.items()):
+            lines.append(
+                f"{host}: p50 {tracker.percentile(50) * 1000:.0f} ms, "
+                f"p99 {tracker.percentile(99) * 1000:.0f} ms"
+            )
+        return '\n'.join(lines)
+
+    async def _on_request_start(self, session, context, params):
+        context.start = time.perf_counter()
+
+    async def _on_request_end(self, session, context, params):
+        self.stats['requests'] += 1
+        self.latency[params.url.host].record(time.perf_counter() - context.start)
+
+    async def _on_request_exception(self, session, context, params):
+        self.stats['requests'] += 1
+        self.stats['errors'] += 1
+
+    async def _on_connection_created(self, session, context, params):
+        self.stats['connections_created'] += 1
+
+    async def _on_connection_reused(self, session, context, params):
+        self.stats['connections_reused'] += 1
+
+
+async def benchmark(requests: int = 5000, concurrency: int = 64):
+    """Measures requests/s and latency percentiles of the pool against a local stub server."""
+    import socket
+
+    from aiohttp import web
+
+    async def handle(request):
+        return web.json_response({'tracks': {'items': []}})
+
+    app = web.Application()
+    app.router.add_get('/search', handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    # Bind the socket here to learn the port the system picked.
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    site = web.SockSite(runner, sock)
+    await site.start()
+
+    pool = HTTPPool(limit_per_host=concurrency)
+    remaining = iter(range(requests))
+    # Every latency, since the pool's own trackers only keep a recent window.
+    latencies = []
+
+    async def worker():
+        for _ in remaining:
+            start = time.perf_counter()
+            await pool.get_json(f'http://127.0.0.1:{port}/search', params={'q': 'melody'})
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    await pool.close()
+    await runner.cleanup()
+    latencies.sort()
+    p50, p99 = (latencies[min(len(latencies) - 1, int(len(latencies) * percent / 100))] for percent in (50, 99))
+    print(f"{requests / elapsed:.0f} requests/s over {concurrency} concurrent workers, "
+          f"p50 {p50 * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms over all {len(latencies)} requests")
+    print(pool.report())
+
+
+if __name__ == '__main__':
+    asyncio.run(benchmark())
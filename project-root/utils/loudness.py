@@ -0,0 +1,184 @@
+import asyncio
+import os
+import re
+import subprocess
+from typing import Awaitable, Callable, Iterable, Optional, Set, Tuple
+
+from utils.database import Database
+from utils.ffmpeg_supervisor import FFmpegSupervisor
+
+TARGET_LUFS = -14.0  # Loudness that every track is normalized to
+MAX_PEAK_DBFS = -1.0  # Normalization never pushes the peak above this level
+# An analysis is given up when it runs slower than ANALYSIS_SPEED times realtime,
+# but never before ANALYSIS_MIN_TIMEOUT. Tracks of unknown length get ANALYSIS_TIMEOUT.
+ANALYSIS_SPEED = 2.0
+ANALYSIS_MIN_TIMEOUT = 30.0
+ANALYSIS_TIMEOUT = 300.0
+
+_INTEGRATED = re.compile(r'I:\s+(-?[\d.]+|-inf) LUFS')
+_PEAK = re.compile(r'Peak:\s+(-?[\d.]+|-inf) dBFS')
+
+
+def normalization_gain(integrated_lufs: float, peak_dbfs: float) -> float:
+    """
+    Calculates the linear gain that brings a track to the target loudness.
+
+    Args:
+        integrated_lufs: The integrated loudness of the track in LUFS.
+        peak_dbfs: The true peak of the track in dBFS.
+
+    Returns:
+        The gain to multiply samples by.
+    """
+    if integrated_lufs == float('-inf'):
+        return 1.0
+    gain_db = min(TARGET_LUFS - integrated_lufs, MAX_PEAK_DBFS - peak_dbfs)
+    return 10 ** (gain_db / 20)
+
+
+def analysis_timeout(duration: float) -> float:
+    """Returns how long the analysis of a track of the given length in seconds may take."""
+    if not duration:
+        return ANALYSIS_TIMEOUT
+    return max(ANALYSIS_MIN_TIMEOUT, duration / ANALYSIS_SPEED)
+
+
+async def measure_loudness(supervisor: FFmpegSupervisor, source: str, niceness: int = 10,
+                           duration: float = 0.0) -> Tuple[float, float]:
+    """
+    Measures the integrated loudness and true peak of a track with FFmpeg's ebur128 filter.
+
+    Args:
+        supervisor: The supervisor that runs the FFmpeg process.
+        source: The URL or file path of the audio source.
+        niceness: How much to lower the priority of the FFmpeg process.
+        duration: The length of the track in seconds, or 0 if unknown. It bounds how long the analysis may take.
+
+    Returns:
+        A tuple of the integrated loudness in LUFS and the true peak in dBFS.
+
+    Raises:
+        ValueError: If FFmpeg did not report a measurement.
+        asyncio.TimeoutError: If the analysis took too long. FFmpeg is stopped, killing it if necessary.
+    """
+    ffmpeg = await supervisor.spawn(
+        '-nostats',
+        '-i', source,
+        '-vn',
+        '-af', 'ebur128=peak=true:framelog=quiet',
+        '-f', 'null', '-',
+        stdout=subprocess.DEVNULL,
+        niceness=niceness,
+        label=f"loudness {source[:70]}"
+    )
+    timeout = analysis_timeout(duration)
+    try:
+        # A stalled stream would otherwise keep the analysis, and a worker slot, busy forever.
+        returncode = await supervisor.wait(ffmpeg, timeout)
+    finally:
+        # Cancelled or timed out analyses must not leave FFmpeg running.
+        await supervisor.stop(ffmpeg)
+    if returncode is None:
+        raise asyncio.TimeoutError(f"Measuring {source} took longer than {timeout:g} seconds.")
+    # The summary is printed last, so it is still in the log ring.
+    output = '\n'.join(ffmpeg.log)
+    integrated = _INTEGRATED.findall(output)
+    peak = _PEAK.findall(output)
+    if returncode != 0 or not integrated or not peak:
+        raise ValueError(f"FFmpeg could not measure {source} (exit code {returncode})")
+    return float(integrated[-1]), float(peak[-1])
+
+
+class LoudnessAnalyzer:
+    """
+    Measures the loudness of tracks once, in the background, and stores the results in the database.
+
+    Tracks whose analysis fails or times out are not stored, so they play at
+    unity gain and are analyzed again the next time they are played.
+    """
+
+    def __init__(self, database: Database, supervisor: FFmpegSupervisor, niceness: int = 10):
+        """
+        Initializes the analyzer.
+
+        Args:
+            database: The database the measurements are stored in.
+            supervisor: The supervisor that runs the FFmpeg processes.
+            niceness: How much to lower the priority of the FFmpeg processes.
+        """
+        self.database = database
+        self.supervisor = supervisor
+        self.niceness = niceness
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.pending: Set[str] = set()
+        self.worker: Optional[asyncio.Task] = None
+        self.stats = {'analyzed': 0, 'failed': 0}
+
+    def gain_for(self, song: dict) -> Optional[float]:
+        """
+        Looks up the precomputed normalization gain of a song.
+
+        Returns:
+            The linear gain, or None if the song has not been analyzed yet.
+        """
+        measurement = self.database.get_loudness(song['url'])
+        if measurement is None:
+            return None
+        return normalization_gain(*measurement)
+
+    def submit(self, song: dict):
+        """Queues a song for analysis unless it is already queued."""
+        if song['url'] in self.pending:
+            return
+        self.pending.add(song['url'])
+        self.queue.put_nowait((song['url'], song['source'], song.get('duration') or 0))
+        if self.worker is None or self.worker.done():
+            self.worker = asyncio.ensure_future(self._work())
+
+    async def _work(self):
+        """Analyzes queued songs one at a time."""
+        while not self.queue.empty():
+            url, source, duration = await self.queue.get()
+            try:
+                await self.analyze(url, source, duration)
+            except Exception as e:
+                self.stats['failed'] += 1
+                print(f"Loudness analysis of {url} failed: {e}")
+            finally:
+                self.pending.discard(url)
+
+    async def analyze(self, url: str, source: str, duration: float = 0.0) -> Tuple[float, float]:
+        """Measures a single track and stores the result."""
+        integrated, peak = await measure_loudness(self.supervisor, source, self.niceness, duration)
+        self.database.set_loudness(url, integrated, peak)
+        self.stats['analyzed'] += 1
+        return integrated, peak
+
+    async def analyze_batch(self, urls: Iterable[str], resolve: Callable[[str], Awaitable[dict]],
+                            concurrency: Optional[int] = None) -> int:
+        """
+        Analyzes many tracks in parallel, one FFmpeg process per core.
+
+        Args:
+            urls: The stable URLs of the tracks.
+            resolve: A coroutine function that resolves a URL into a song with a fresh playable source.
+            concurrency: The number of tracks analyzed at once. Defaults to the number of cores.
+
+        Returns:
+            The number of tracks that were analyzed successfully.
+        """
+        semaphore = asyncio.Semaphore(concurrency or os.cpu_count() or 1)
+
+        async def analyze_one(url: str) -> bool:
+            async with semaphore:
+                try:
+                    song = await resolve(url)
+                    await self.analyze(url, song['source'], song.get('duration') or 0)
+                    return True
+                except Exception as e:
+                    self.stats['failed'] += 1
+                    print(f"Loudness analysis of {url} failed: {e}")
+                    return False
+
+        results = await asyncio.gather(*(analyze_one(url) for url in urls))
+        return sum(results)
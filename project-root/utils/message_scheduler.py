@@ -0,0 +1,255 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Any, Dict, List, Optional
+
+import discord
+
+# Lower values are delivered first.
+PRIORITY_HIGH = 0  # Now playing and error messages
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2  # Coalescable status messages ("Added X to the queue.")
+
+MAX_MESSAGE_LENGTH = 2000
+
+
+class RateLimitBucket:
+    """A token bucket that mirrors a Discord rate-limit bucket."""
+
+    def __init__(self, capacity: int, per: float):
+        """
+        Initializes the bucket.
+
+        Args:
+            capacity: The number of requests allowed per window.
+            per: The length of the window in seconds.
+        """
+        self.capacity = capacity
+        self.rate = capacity / per
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Waits until a request can be made without hitting the rate limit."""
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def penalize(self, retry_after: float):
+        """Empties the bucket after Discord reported a rate limit anyway."""
+        self._refill()
+        self.tokens = min(self.tokens, 0) - retry_after * self.rate
+
+
+class OutgoingMessage:
+    """A message waiting to be delivered by the scheduler."""
+
+    def __init__(self, content: Optional[str], embed: Optional[discord.Embed], view: Optional[discord.ui.View],
+                 priority: int, coalesce: bool):
+        self.content = content
+        self.embed = embed
+        self.view = view
+        self.priority = priority
+        # Only plain text can be merged into another message.
+        self.coalesce = coalesce and embed is None and view is None and content is not None
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class ChannelQueue:
+    """Pending messages and rate-limit state for a single channel."""
+
+    def __init__(self, channel: discord.abc.Messageable, bucket: RateLimitBucket):
+        self.channel = channel
+        self.bucket = bucket
+        self.heap: List[Any] = []
+        self.worker: Optional[asyncio.Task] = None
+        # The last coalesced status message, edited in place while it is recent.
+        self.status_message: Optional[discord.Message] = None
+        self.status_lines: List[str] = []
+        self.status_sent_at = 0.0
+
+
+class MessageScheduler:
+    """
+    Delivers outgoing messages per channel while staying inside Discord's rate limits.
+
+    Messages are queued per channel and sent in priority order. Rapid-fire status
+    messages are merged into a single message that is edited in place, and token
+    buckets delay requests before Discord would answer with a 429.
+    """
+
+    def __init__(self, channel_rate: int = 5, channel_per: float = 5.0, global_rate: int = 50,
+                 coalesce_window: float = 5.0, linger: float = 0.3):
+        """
+        Initializes the scheduler.
+
+        Args:
+            channel_rate: The number of requests allowed per channel and window.
+            channel_per: The length of the per-channel window in seconds.
+            global_rate: The number of requests allowed per second across all channels.
+            coalesce_window: How long a status message keeps being edited instead of sending a new one.
+            linger: How long to wait for more status messages before flushing them.
+        """
+        self.channel_rate = channel_rate
+        self.channel_per = channel_per
+        self.coalesce_window = coalesce_window
+        self.linger = linger
+        self.global_bucket = RateLimitBucket(global_rate, 1.0)
+        self.queues: Dict[int, ChannelQueue] = {}
+        self.sequence = itertools.count()
+        self.stats = {'queued': 0, 'requests': 0, 'coalesced': 0, 'failed': 0}
+
+    def post(self, target: Any, content: Optional[str] = None, *, embed: Optional[discord.Embed] = None,
+             view: Optional[discord.ui.View] = None, priority: int = PRIORITY_NORMAL,
+             coalesce: bool = False) -> asyncio.Future:
+        """
+        Queues a message without waiting for it to be delivered.
+
+        Args:
+            target: A context, message or channel to send the message to.
+            content: The text of the message.
+            embed: An optional embed to attach.
+            view: An optional view to attach.
+            priority: One of the PRIORITY_* constants.
+            coalesce: Whether the message may be merged with other status messages.
+
+        Returns:
+            A future resolving to the delivered discord.Message.
+        """
+        channel = getattr(target, 'channel', target)
+        queue = self.queues.get(channel.id)
+        if queue is None:
+            queue = ChannelQueue(channel, RateLimitBucket(self.channel_rate, self.channel_per))
+            self.queues[channel.id] = queue
+
+        message = OutgoingMessage(content, embed, view, priority, coalesce)
+        if message.coalesce:
+            message.priority = max(priority, PRIORITY_LOW)
+        message.future.add_done_callback(_consume_exception)
+        heapq.heappush(queue.heap, (message.priority, next(self.sequence), message))
+        self.stats['queued'] += 1
+
+        if queue.worker is None:
+            queue.worker = asyncio.ensure_future(self._drain(queue))
+        return message.future
+
+    async def send(self, target: Any, content: Optional[str] = None, **kwargs) -> discord.Message:
+        """Queues a message and waits until it has been delivered."""
+        return await self.post(target, content, **kwargs)
+
+    async def _drain(self, queue: ChannelQueue):
+        """Delivers the pending messages of a channel until its queue is empty."""
+        try:
+            while queue.heap:
+                if queue.heap[0][2].coalesce and self.linger:
+                    # Give a burst of status messages the chance to pile up.
+                    await asyncio.sleep(self.linger)
+                await self._acquire(queue)
+                _, _, message = heapq.heappop(queue.heap)
+                try:
+                    if message.coalesce:
+                        batch = [message] + self._pop_coalescable(queue)
+                        await self._flush_status(queue, batch)
+                    else:
+                        sent = await queue.channel.send(content=message.content, embed=message.embed, view=message.view)
+                        queue.status_message = None
+                        message.future.set_result(sent)
+                except Exception as e:
+                    # Whatever went wrong, the sender hears about it and the rest of the queue is delivered.
+                    if isinstance(e, discord.HTTPException) and e.status == 429:
+                        queue.bucket.penalize(getattr(e, 'retry_after', self.channel_per))
+                    self._fail(queue, message, e)
+        finally:
+            queue.worker = None
+            # Keep the rate-limit and status message state until neither can matter any more.
+            asyncio.get_running_loop().call_later(max(self.channel_per, self.coalesce_window), self._forget, queue)
+
+    def _forget(self, queue: ChannelQueue):
+        """Drops the state of a channel that has been idle since its queue was drained."""
+        if queue.worker is None and not queue.heap and self.queues.get(queue.channel.id) is queue:
+            del self.queues[queue.channel.id]
+
+    async def _acquire(self, queue: ChannelQueue):
+        await queue.bucket.acquire()
+        await self.global_bucket.acquire()
+        self.stats['requests'] += 1
+
+    def _pop_coalescable(self, queue: ChannelQueue) -> List[OutgoingMessage]:
+        """Removes every pending status message of a channel, oldest first."""
+        batch = sorted((entry for entry in queue.heap if entry[2].coalesce), key=lambda entry: entry[1])
+        if batch:
+            queue.heap = [entry for entry in queue.heap if not entry[2].coalesce]
+            heapq.heapify(queue.heap)
+        return [entry[2] for entry in batch]
+
+    async def _flush_status(self, queue: ChannelQueue, batch: List[OutgoingMessage]):
+        """Sends a batch of status messages, editing the previous status message when possible."""
+        self.stats['coalesced'] += len(batch) - 1
+        lines = [message.content[:MAX_MESSAGE_LENGTH] for message in batch]
+        recent = time.monotonic() - queue.status_sent_at <= self.coalesce_window
+        pending = [message.future for message in batch]
+        first_request = True
+
+        if queue.status_message is not None and recent:
+            lines = queue.status_lines + lines
+            queue.status_lines = []
+        else:
+            queue.status_message = None
+            queue.status_lines = []
+
+        try:
+            while lines:
+                chunk = _take_chunk(lines)
+                if not first_request:
+                    await self._acquire(queue)
+                first_request = False
+
+                if queue.status_message is not None and not queue.status_lines:
+                    # Re-render the previous status message with the new lines appended.
+                    await queue.status_message.edit(content='\n'.join(chunk))
+                else:
+                    queue.status_message = await queue.channel.send('\n'.join(chunk))
+                queue.status_lines = chunk
+                queue.status_sent_at = time.monotonic()
+        except Exception as e:
+            queue.status_message = None
+            for future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            self.stats['failed'] += len(pending)
+            print(f"Failed to deliver status message to channel {queue.channel.id}: {e}")
+            return
+
+        for future in pending:
+            future.set_result(queue.status_message)
+
+    def _fail(self, queue: ChannelQueue, message: OutgoingMessage, error: Exception):
+        self.stats['failed'] += 1
+        print(f"Failed to deliver message to channel {queue.channel.id}: {error}")
+        if not message.future.done():
+            message.future.set_exception(error)
+
+
+def _take_chunk(lines: List[str]) -> List[str]:
+    """Pops as many lines as fit into a single Discord message."""
+    chunk = [lines.pop(0)]
+    length = len(chunk[0])
+    while lines and length + 1 + len(lines[0]) <= MAX_MESSAGE_LENGTH:
+        length += 1 + len(lines[0])
+        chunk.append(lines.pop(0))
+    return chunk
+
+
+def _consume_exception(future: asyncio.Future):
+    """Marks delivery errors as retrieved for callers that never await the message."""
+    if not future.cancelled():
+        future.exception()
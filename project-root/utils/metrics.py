@@ -0,0 +1,18 @@
+from collections import deque
+
+
+class LatencyTracker:
+    """Keeps the most recent latency samples of an operation."""
+
+    def __init__(self, window: int = 200):
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, percent: float) -> float:
+        """Returns a latency percentile in seconds, or 0 if nothing was recorded yet."""
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
@@ -0,0 +1,214 @@
+import asyncio
+import time
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from utils.audio_format import CHANNELS, FRAME_SAMPLES, FRAME_SIZE, SAMPLE_RATE
+from utils.dsp import DSPChain
+from utils.mixer_input import MixerInput
+
+
+class Mixer:
+    """
+    Mixes the PCM frames of several inputs into one stream.
+
+    Inputs are summed in floating point with their own gain, so the cost of a
+    frame grows linearly with the number of inputs. While an input that ducks
+    is playing, the other inputs are smoothly turned down. Inputs can be added
+    and removed between frames without touching the others, and the mixer keeps
+    producing silence for a moment after the last input ends so the next one can
+    be added without restarting the voice stream.
+
+    A frame is produced in two steps: collect() takes the next frame of every
+    input on the event loop, which only moves buffers around, and mix() does
+    the NumPy work. A voice client runs mix() on its audio thread, so mixing
+    and the DSP chain never hold up the event loop.
+    """
+
+    def __init__(self, dsp: Optional[DSPChain] = None, duck_gain: float = 0.3, smoothing: float = 0.3,
+                 linger: float = 2.0):
+        """
+        Initializes the mixer.
+
+        Args:
+            dsp: The DSP chain applied to the mixed output, if any.
+            duck_gain: The gain applied to the other inputs while a ducking input plays.
+            smoothing: How much of a gain change is applied per frame (0-1].
+            linger: Seconds of silence produced after the last input ends before the stream ends.
+        """
+        self.dsp = dsp
+        self.duck_gain = duck_gain
+        self.smoothing = smoothing
+        self.linger_frames = int(linger * SAMPLE_RATE / FRAME_SAMPLES)
+        self.idle_frames = 0
+        self.inputs: List[MixerInput] = []
+        self.last_cpu = 0.0
+
+        self._silence = bytes(FRAME_SIZE)
+
+        self._mix = np.empty((FRAME_SAMPLES, CHANNELS), dtype=np.float32)
+        self._scratch = np.empty((FRAME_SAMPLES, CHANNELS), dtype=np.float32)
+        self._ramp = (np.arange(1, FRAME_SAMPLES + 1, dtype=np.float32) / FRAME_SAMPLES).reshape(-1, 1)
+        self._gains = np.empty((FRAME_SAMPLES, 1), dtype=np.float32)
+        self._padded = np.zeros(FRAME_SAMPLES * CHANNELS, dtype=np.int16)
+        self._output = np.empty((FRAME_SAMPLES, CHANNELS), dtype=np.int16)
+
+    def add(self, player, gain: float = 1.0, ducks: bool = False,
+            on_end: Optional[Callable[[MixerInput], None]] = None) -> MixerInput:
+        """
+        Adds an input. It is mixed in from the next frame on.
+
+        Returns:
+            The input, which can be passed to remove().
+        """
+        mixer_input = MixerInput(player, gain, ducks, on_end)
+        self.inputs = self.inputs + [mixer_input]
+        self.idle_frames = 0
+        return mixer_input
+
+    def remove(self, mixer_input: MixerInput):
+        """Removes an input without calling its on_end callback."""
+        self.inputs = [other for other in self.inputs if other is not mixer_input]
+
+    async def read_frame(self) -> bytes:
+        """
+        Reads a frame from every input and mixes them.
+
+        Returns:
+            FRAME_SIZE bytes of s16le stereo PCM, or an empty bytes object once no
+            inputs have been left for the linger time.
+        """
+        return self.mix(await self.collect())
+
+    async def collect(self) -> Optional[List[Tuple[MixerInput, bytes, float]]]:
+        """
+        Takes the next frame of every input, removing inputs that have ended. Call from the event loop.
+
+        Returns:
+            The frames to pass to mix(), each with its input and target gain. An
+            empty list means silence while lingering, None that the stream has ended.
+        """
+        inputs = self.inputs
+        if not inputs:
+            return self._idle()
+        if len(inputs) == 1:
+            frames = [await inputs[0].player.read_frame()]
+        else:
+            frames = await asyncio.gather(*(mixer_input.player.read_frame() for mixer_input in inputs))
+
+        ducking = any(mixer_input.ducks for mixer_input, frame in zip(inputs, frames) if frame)
+        parts = []
+        for mixer_input, frame in zip(inputs, frames):
+            if not frame:
+                self.remove(mixer_input)
+                if mixer_input.on_end is not None:
+                    mixer_input.on_end(mixer_input)
+                continue
+            target = mixer_input.gain * (self.duck_gain if ducking and not mixer_input.ducks else 1.0)
+            parts.append((mixer_input, frame, target))
+
+        if not parts:
+            return self._idle()
+        self.idle_frames = 0
+        return parts
+
+    def mix(self, parts: Optional[List[Tuple[MixerInput, bytes, float]]]) -> bytes:
+        """
+        Mixes the frames returned by collect() and runs the DSP chain over them.
+
+        Only one thread may mix at a time, but it need not be the event loop's.
+
+        Returns:
+            FRAME_SIZE bytes of s16le stereo PCM, or an empty bytes object once the stream has ended.
+        """
+        if parts is None:
+            self.last_cpu = 0.0
+            return b''
+        if not parts:
+            self.last_cpu = 0.0
+            return self._silence
+        start = time.thread_time()
+        self._mix.fill(0)
+        for mixer_input, frame, target in parts:
+            self._accumulate(frame, mixer_input, target)
+        if self.dsp is not None:
+            output = self.dsp.process_mix(self._mix)
+        else:
+            np.clip(self._mix, -32768, 32767, out=self._mix)
+            np.copyto(self._output, self._mix, casting='unsafe')
+            output = self._output
+        self.last_cpu = time.thread_time() - start
+        return output.tobytes()
+
+    def _idle(self) -> Optional[list]:
+        """Asks for silence while lingering after the last input, then ends the stream."""
+        if self.idle_frames >= self.linger_frames:
+            return None
+        self.idle_frames += 1
+        return []
+
+    def _accumulate(self, frame: bytes, mixer_input: MixerInput, target: float):
+        """Adds a frame to the mix, ramping the input's gain towards the target."""
+        pcm = np.frombuffer(frame, dtype=np.int16)
+        if pcm.size != self._padded.size:
+            self._padded.fill(0)
+            self._padded[:pcm.size] = pcm[:self._padded.size]
+            pcm = self._padded
+        np.copyto(self._scratch, pcm.reshape(FRAME_SAMPLES, CHANNELS))
+
+        start = mixer_input.level
+        end = start + (target - start) * self.smoothing
+        if abs(end - target) < 1e-4:
+            end = target
+        mixer_input.level = end
+        if start == end:
+            self._scratch *= end
+        else:
+            np.multiply(self._ramp, end - start, out=self._gains)
+            self._gains += start
+            self._scratch *= self._gains
+        self._mix += self._scratch
+
+    async def stop(self):
+        """Stops and removes every input."""
+        inputs, self.inputs = self.inputs, []
+        for mixer_input in inputs:
+            stop = getattr(mixer_input.player, 'stop', None)
+            if stop is not None:
+                await stop()
+
+
+class _ConstantPlayer:
+    """A player that returns the same frame forever, used by the benchmark."""
+
+    def __init__(self, frame: bytes):
+        self.frame = frame
+
+    async def read_frame(self) -> bytes:
+        return self.frame
+
+
+async def benchmark(frames: int = 2000, max_inputs: int = 16):
+    """Measures the cost of mixing a frame for a growing number of inputs."""
+    rng = np.random.default_rng(0)
+    frame = rng.integers(-8000, 8000, FRAME_SAMPLES * CHANNELS, dtype=np.int16).tobytes()
+    assert len(frame) == FRAME_SIZE
+    count = 1
+    while count <= max_inputs:
+        mixer = Mixer(DSPChain())
+        for index in range(count):
+            mixer.add(_ConstantPlayer(frame), ducks=index == 1)
+        for _ in range(100):
+            await mixer.read_frame()
+        cpu = 0.0
+        for _ in range(frames):
+            await mixer.read_frame()
+            cpu += mixer.last_cpu
+        per_frame = cpu / frames * 1e6
+        print(f"{count:2} inputs: {per_frame:7.1f} µs per frame, {per_frame / count:6.1f} µs per input")
+        count *= 2
+
+
+if __name__ == '__main__':
+    asyncio.run(benchmark())
@@ -0,0 +1,21 @@
+from typing import Callable, Optional
+
+
+class MixerInput:
+    """A frame source playing in a mixer."""
+
+    def __init__(self, player, gain: float, ducks: bool, on_end: Optional[Callable[['MixerInput'], None]]):
+        """
+        Initializes the input.
+
+        Args:
+            player: Anything with an async read_frame() returning s16le PCM, usually a MusicPlayer.
+            gain: The linear gain of the input.
+            ducks: Whether the other inputs are turned down while this one plays.
+            on_end: Called with the input once its player has no more frames.
+        """
+        self.player = player
+        self.gain = gain
+        self.ducks = ducks
+        self.on_end = on_end
+        self.level = gain  # The gain actually applied, smoothed towards the target
@@ -1,44 +1,302 @@
 import asyncio
-import subprocess
+import concurrent.futures
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Optional
+from urllib.parse import urlparse
+
+import discord
+
+from utils.audio_format import FRAME_DURATION, FRAME_SIZE
+from utils.encoder_scheduler import EncoderScheduler, EncoderSession
+from utils.errors import StreamStalledError
+from utils.ffmpeg_supervisor import FFmpegProcess, FFmpegSupervisor
+
+if TYPE_CHECKING:
+    from utils.dsp import DSPChain  # Imports NumPy
+    from utils.mixer import Mixer
 
 class MusicPlayer:
-    """Represents a music player that handles decoding and streaming audio."""
+    """
+    Represents a music player that handles decoding and streaming audio.
 
-    def __init__(self, source: str):
+    A reader task decodes ahead of playback into a buffer of frames. Reading
+    pauses once the buffer holds high_water seconds, which lets the pipe fill
+    and FFmpeg wait instead of decoding the whole song into memory. When the
+    buffer runs dry the player returns silence and counts an underrun until
+    it has refilled to low_water seconds, so a network hiccup costs a short
+    gap rather than a stuttering stream.
+    """
+
+    def __init__(self, source: str, supervisor: FFmpegSupervisor, dsp: Optional['DSPChain'] = None,
+                 max_restarts: int = 3, high_water: float = 2.0, low_water: float = 0.5):
         """
         Initializes the MusicPlayer with the audio source.
 
         Args:
             source: The URL or file path of the audio source.
+            supervisor: The supervisor that runs the FFmpeg process.
+            dsp: The DSP chain applied to every decoded frame, if any.
+            max_restarts: How often a stalled or failed stream is reconnected before the song is given up.
+            high_water: Seconds of audio decoded ahead before reading pauses.
+            low_water: Seconds of audio buffered before playback starts or resumes after an underrun.
         """
         self.source = source
-        self.ffmpeg = None
+        self.supervisor = supervisor
+        self.dsp = dsp
+        self.max_restarts = max_restarts
+        self.high_water = max(1, round(high_water / FRAME_DURATION))
+        self.low_water = min(self.high_water, max(1, round(low_water / FRAME_DURATION)))
+        self.ffmpeg: Optional[FFmpegProcess] = None
+        self.reader: Optional[asyncio.Task] = None
+        self.buffer = deque()
+        self.space = asyncio.Event()
+        self.ended = True
+        self.buffering = True
+        self.underruns = 0
+        self.start_offset = 0.0  # Where the current FFmpeg process started decoding
+        self.decoded = 0  # Frames read from the current FFmpeg process
+        self.base = 0.0  # Where playback started or was last seeked to
+        self.frames = 0  # Frames played since then
+        self.restarts = 0
+        self.last_cpu = 0.0
+        self.silence = bytes(FRAME_SIZE)
+        # Serializes seeks so two of them never start two processes.
+        self.lock = asyncio.Lock()
+
+    @property
+    def position(self) -> float:
+        """The playback position in seconds, counted in frames actually played."""
+        return self.base + self.frames * FRAME_DURATION
 
-    async def play_song(self):
+    @property
+    def buffered(self) -> float:
+        """The seconds of audio decoded but not played yet."""
+        return len(self.buffer) * FRAME_DURATION
+
+    async def play_song(self, position: float = 0.0):
         """
-        Starts playing the audio using FFmpeg.
+        Starts playing the audio using FFmpeg, discarding anything buffered.
+
+        The player counts as buffering, not ended, while the old process is
+        stopped and the new one starts, so a restart reads as silence rather
+        than as the end of the song.
+
+        Args:
+            position: The offset in seconds to start at.
 
         Raises:
-            subprocess.CalledProcessError: If FFmpeg encounters an error.
+            OSError: If FFmpeg could not be started.
         """
-        if self.ffmpeg is not None:
-            await self.stop()
+        self.ended = False
+        self.buffering = True
+        self.base = max(0.0, position)
+        self.frames = 0
+        self.buffer.clear()
+        await self._halt()
+        self.buffer.clear()
+        try:
+            await self._spawn(self.base)
+        except Exception:
+            self.ended = True
+            raise
+        self.reader = asyncio.ensure_future(self._fill())
 
-        self.ffmpeg = await asyncio.create_subprocess_exec(
-            'ffmpeg',
+    async def _spawn(self, position: float):
+        """Starts an FFmpeg process decoding from a position, replacing the current one."""
+        if self.ffmpeg is not None:
+            ffmpeg, self.ffmpeg = self.ffmpeg, None
+            await self.supervisor.stop(ffmpeg)
+        self.start_offset = position
+        self.decoded = 0
+        # -ss before -i seeks on the input side, which skips decoding everything before the offset.
+        seek = ['-ss', f'{position:.3f}'] if position else []
+        # Let FFmpeg ride out short network drops itself before the supervisor has to step in.
+        reconnect = ['-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '5'] \
+            if urlparse(self.source).scheme in ('http', 'https') else []
+        self.ffmpeg = await self.supervisor.spawn(
+            '-loglevel', 'warning',
+            *reconnect,
+            *seek,
             '-i', self.source,
             '-vn',  # Disable video output
             '-f', 's16le',  # 16-bit signed little-endian output
             '-ar', '48000',  # Sample rate 48 kHz
             '-ac', '2',  # 2 channels (stereo)
             'pipe:1',  # Output to pipe
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
+            owner=self,
+            label=self.source[:80]
         )
 
+    async def _fill(self):
+        """Decodes frames into the buffer, waiting whenever it reaches the high water mark."""
+        try:
+            while True:
+                if len(self.buffer) >= self.high_water:
+                    self.space.clear()
+                    await self.space.wait()
+                    continue
+                frame = await self._read()
+                if not frame:
+                    break
+                self.decoded += 1
+                self.buffer.append(frame)
+        except Exception as e:
+            print(f"Reading {self.source} failed: {e}")
+        # Not reached when cancelled: whoever cancelled the reader decides whether the song ended.
+        self.ended = True
+
+    async def read_frame(self) -> bytes:
+        """
+        Takes the next 20 ms frame of PCM from the buffer and runs it through the DSP chain.
+
+        Returns:
+            FRAME_SIZE bytes of s16le stereo PCM (silence while buffering), or an
+            empty bytes object once the song has ended.
+        """
+        if self.buffering:
+            if len(self.buffer) < self.low_water and not self.ended:
+                self.last_cpu = 0.0
+                return self.silence
+            self.buffering = False
+        if not self.buffer:
+            if self.ended:
+                return b''
+            self.underruns += 1
+            self.buffering = True
+            self.last_cpu = 0.0
+            return self.silence
+
+        frame = self.buffer.popleft()
+        self.frames += 1
+        self.space.set()
+        if self.dsp is None:
+            self.last_cpu = 0.0
+            return frame.ljust(FRAME_SIZE, b'\0')
+        start = time.thread_time()
+        frame = self.dsp.process(frame)
+        self.last_cpu = time.thread_time() - start
+        return frame
+
+    async def _read(self) -> bytes:
+        """Reads a frame from FFmpeg, reconnecting to the source when the stream breaks."""
+        while self.ffmpeg is not None:
+            ffmpeg = self.ffmpeg
+            try:
+                frame = await self.supervisor.read(ffmpeg, FRAME_SIZE)
+                if frame:
+                    return frame
+                # The output ended; that is only the end of the song if FFmpeg exited cleanly.
+                returncode = await self.supervisor.wait(ffmpeg, self.supervisor.grace)
+                if returncode == 0 or ffmpeg.stopping:
+                    return b''
+                reason = f"exited with code {returncode}"
+            except StreamStalledError as e:
+                reason = str(e)
+            if self.ffmpeg is not ffmpeg:
+                # Stopped while the read was pending.
+                return b''
+            if self.restarts >= self.max_restarts:
+                print(f"Giving up on {self.source} after {self.restarts} restarts: {reason}")
+                return b''
+            self.restarts += 1
+            self.supervisor.stats['restarts'] += 1
+            # Continue after the last decoded frame; what is buffered keeps playing meanwhile.
+            position = self.start_offset + self.decoded * FRAME_DURATION
+            print(f"Restarting {self.source} at {position:.1f} s: {reason}")
+            await self._spawn(position)
+        return b''
+
+    async def seek(self, position: float):
+        """
+        Restarts decoding at another position without resolving the source again.
+
+        The buffer is flushed, so playback continues at the new position after a short prebuffer.
+
+        Args:
+            position: The new position in seconds.
+        """
+        async with self.lock:
+            await self.play_song(position)
+
     async def stop(self):
-        """Stops the FFmpeg process and cleans up."""
+        """Stops reading, drops the buffer and stops the FFmpeg process, killing it if it does not exit in time."""
+        self.buffer.clear()
+        self.ended = True
+        await self._halt()
+
+    async def _halt(self):
+        """Cancels the reader task and stops the FFmpeg process without touching the playback state."""
+        if self.reader is not None:
+            reader, self.reader = self.reader, None
+            reader.cancel()
+            await asyncio.gather(reader, return_exceptions=True)
         if self.ffmpeg is not None:
-            self.ffmpeg.terminate()
-            await self.ffmpeg.wait()
-            self.ffmpeg = None
\ No newline at end of file
+            ffmpeg, self.ffmpeg = self.ffmpeg, None
+            await self.supervisor.stop(ffmpeg)
+
+
+class PlayerSource(discord.AudioSource):
+    """
+    Feeds the output of a mixer to a voice client, encoding it with a scheduled encoder.
+
+    Only taking the inputs' next frames happens on the event loop. Mixing, the
+    DSP chain and encoding run on the voice client's audio thread, so their
+    cost never delays the bot's event loop.
+    """
+
+    def __init__(self, mixer: 'Mixer', loop: asyncio.AbstractEventLoop,
+                 scheduler: Optional[EncoderScheduler] = None, session: Optional[EncoderSession] = None):
+        """
+        Initializes the source.
+
+        Args:
+            mixer: The mixer to play. It is not stopped when the source ends.
+            loop: The event loop the mixer's inputs belong to.
+            scheduler: The scheduler the encode cost is reported to.
+            session: The encoder session to encode frames with. Without one the
+                voice client encodes the PCM itself.
+        """
+        self.mixer = mixer
+        self.loop = loop
+        self.scheduler = scheduler
+        self.session = session
+        self.silence = bytes(FRAME_SIZE)
+        # Frames requested from the event loop that were not ready in time
+        self.pending: Optional[concurrent.futures.Future] = None
+        self.late_frames = 0
+
+    def read(self) -> bytes:
+        # Called from the voice client's audio thread.
+        start_wall = time.perf_counter()
+        start_cpu = time.thread_time()
+        future = self.pending or asyncio.run_coroutine_threadsafe(self.mixer.collect(), self.loop)
+        try:
+            parts = future.result(timeout=FRAME_DURATION)
+        except concurrent.futures.TimeoutError:
+            # The event loop is busy. Keep the voice connection fed and take the frames on the next read.
+            self.pending = future
+            self.late_frames += 1
+            pcm = self.silence
+        except Exception:
+            self.pending = None
+            return b''
+        else:
+            self.pending = None
+            pcm = self.mixer.mix(parts)
+        if not pcm or self.session is None:
+            return pcm
+        packet = self.session.encode(pcm)
+        if self.scheduler is not None:
+            # Mixing ran on this thread too, so its cost is part of the thread time.
+            cpu = time.thread_time() - start_cpu
+            self.scheduler.record(self.session, cpu, time.perf_counter() - start_wall)
+        return packet
+
+    def is_opus(self) -> bool:
+        return self.session is not None
+
+    def cleanup(self):
+        if self.pending is not None:
+            self.pending.cancel()
+            self.pending = None
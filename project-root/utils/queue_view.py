@@ -0,0 +1,88 @@
+from typing import Dict
+
+import discord
+
+from utils.helper import format_duration
+from utils.song_queue import SongQueue
+
+
+class QueuePages:
+    """Renders a song queue one page at a time and caches the rendered pages."""
+
+    def __init__(self, queue: SongQueue, per_page: int = 10):
+        """
+        Initializes the pages for a queue.
+
+        Args:
+            queue: The queue to render.
+            per_page: The number of songs shown per page.
+        """
+        self.queue = queue
+        self.per_page = per_page
+        self._pages: Dict[int, str] = {}
+        self._version = queue.version
+
+    def page_count(self) -> int:
+        """Returns the number of pages, which is at least one."""
+        return max(1, -(-self.queue.qsize() // self.per_page))
+
+    def render(self, page: int) -> str:
+        """
+        Renders a single page of the queue.
+
+        Only the songs on the requested page are formatted. Rendered pages are
+        reused until the queue changes.
+
+        Args:
+            page: The zero-based page number, clamped to the valid range.
+
+        Returns:
+            The message content for the page.
+        """
+        if self._version != self.queue.version:
+            self._pages.clear()
+            self._version = self.queue.version
+
+        page = min(max(page, 0), self.page_count() - 1)
+        content = self._pages.get(page)
+        if content is None:
+            songs = self.queue.snapshot()
+            start = page * self.per_page
+            lines = [
+                f"{index}. **{song['title']}** by **{song['artist']}** ({format_duration(song['duration'])})"
+                for index, song in enumerate(songs[start:start + self.per_page], start=start + 1)
+            ]
+            header = f"**Queue:** {len(songs)} songs (page {page + 1}/{self.page_count()})"
+            content = '\n'.join([header] + lines) if lines else "The queue is empty."
+            self._pages[page] = content
+        return content
+
+
+class QueueView(discord.ui.View):
+    """Buttons for navigating the pages of the queue."""
+
+    def __init__(self, pages: QueuePages, timeout: float = 120.0):
+        super().__init__(timeout=timeout)
+        self.pages = pages
+        self.page = 0
+        # Buttons are added with plain callbacks, which take only the interaction
+        # in every discord.py-compatible library.
+        self.add_page_button('«', discord.ButtonStyle.secondary, lambda: 0)
+        self.add_page_button('‹', discord.ButtonStyle.primary, lambda: self.page - 1)
+        self.add_page_button('›', discord.ButtonStyle.primary, lambda: self.page + 1)
+        self.add_page_button('»', discord.ButtonStyle.secondary, lambda: self.pages.page_count() - 1)
+
+    def add_page_button(self, label: str, style: discord.ButtonStyle, target):
+        """Adds a button that switches to the page returned by target."""
+        button = discord.ui.Button(label=label, style=style)
+
+        async def callback(interaction: discord.Interaction):
+            await self.show(interaction, target())
+
+        button.callback = callback
+        self.add_item(button)
+
+    async def show(self, interaction: discord.Interaction, page: int):
+        """Switches the message to another page."""
+        self.page = min(max(page, 0), self.pages.page_count() - 1)
+        await interaction.response.edit_message(content=self.pages.render(self.page), view=self)
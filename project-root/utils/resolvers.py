@@ -0,0 +1,502 @@
+import asyncio
+import os
+import re
+import sys
+import time
+from typing import Dict, List, Optional
+from urllib.parse import parse_qsl, unquote, urlencode, urlparse
+
+from utils.errors import MusicError, ResolverUnavailableError, TrackNotFoundError
+from utils.http_pool import HTTPPool, load_aiohttp
+from utils.metrics import LatencyTracker
+from utils.single_flight import SingleFlight
+from utils.startup import startup
+
+AUDIO_EXTENSIONS = ('.mp3', '.ogg', '.opus', '.wav', '.flac', '.m4a', '.aac', '.webm')
+# A host name followed by a path, as in youtube.com/watch?v=...
+_SCHEMELESS_LINK = re.compile(r'^[\w-]+(\.[\w-]+)+/\S*$')
+# Query parameters that only track where a link was shared and never change the track
+TRACKING_PARAMS = ('si', 'feature', 'pp', 'ab_channel', 'utm_source', 'utm_medium', 'utm_campaign', 'utm_content', 'utm_term')
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalizes a query so that different spellings of the same request share a key.
+
+    Search text is lowercased with whitespace collapsed. Links, with or
+    without a scheme, lose their scheme, "www." and tracking parameters, and
+    youtu.be and YouTube Music links are rewritten to the regular watch URL.
+    Only the host of a link is lowercased.
+
+    Args:
+        query: The URL or search query.
+
+    Returns:
+        The normalized key.
+    """
+    query = query.strip()
+    if _SCHEMELESS_LINK.match(query):
+        # A link typed without its scheme, such as youtube.com/watch?v=... Its path
+        # and query are case-sensitive, so it must not be lowercased like search text.
+        query = f"https://{query}"
+    parsed = urlparse(query)
+    if parsed.scheme not in ('http', 'https'):
+        return ' '.join(query.lower().split())
+
+    host = parsed.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    path = parsed.path.rstrip('/')
+    params = [(key, value) for key, value in parse_qsl(parsed.query) if key not in TRACKING_PARAMS]
+    if host == 'youtu.be':
+        host, params = 'youtube.com', [('v', path.lstrip('/'))] + params
+        path = '/watch'
+    elif host in ('m.youtube.com', 'music.youtube.com'):
+        host = 'youtube.com'
+    if host == 'youtube.com' and path == '/watch':
+        # Only the video ID matters; timestamps and playlist positions do not change the track.
+        params = [(key, value) for key, value in params if key == 'v']
+    return f"{host}{path}?{urlencode(sorted(params))}" if params else f"{host}{path}"
+
+
+def is_link(query: str) -> bool:
+    """Checks whether a query is a link, with or without a scheme, rather than search text."""
+    query = query.strip()
+    parsed = urlparse(query)
+    if parsed.scheme and (parsed.netloc or parsed.scheme == 'file'):
+        return True
+    return _SCHEMELESS_LINK.match(query) is not None
+
+
+def load_youtube_dl():
+    """Imports youtube_dl on first use."""
+    first_use = 'youtube_dl' not in sys.modules
+    youtube_dl = startup.import_module('youtube_dl')
+    if first_use:
+        # Suppress noisy YouTube DL logging
+        youtube_dl.utils.bug_reports_message = lambda: ''
+    return youtube_dl
+
+
+class Resolver:
+    """Base class for a backend that turns a URL or search query into a song."""
+
+    name = 'resolver'
+
+    def matches(self, query: str) -> bool:
+        """
+        Checks whether the backend is responsible for a query.
+
+        Args:
+            query: The URL or search query.
+
+        Returns:
+            True if the query should be resolved by this backend.
+        """
+        return False
+
+    async def resolve(self, query: str) -> dict:
+        """
+        Resolves a query into a song.
+
+        Args:
+            query: The URL or search query.
+
+        Returns:
+            A dictionary with the song's playable source, its stable url, title, artist and duration.
+
+        Raises:
+            TrackNotFoundError: If the backend has no result for the query.
+        """
+        raise NotImplementedError
+
+
+class YouTubeResolver(Resolver):
+    """Resolves YouTube links and plain text searches with youtube_dl."""
+
+    name = 'youtube'
+
+    def matches(self, query: str) -> bool:
+        return 'youtube.com' in query or 'youtu.be' in query
+
+    async def resolve(self, query: str) -> dict:
+        # youtube_dl is blocking, so keep it off the event loop.
+        info = await asyncio.get_running_loop().run_in_executor(None, self._extract, query)
+        if 'entries' in info:
+            # Playlist or search results
+            if not info['entries']:
+                raise TrackNotFoundError("No results found on YouTube.")
+            info = info['entries'][0]
+        return {
+            'source': info['url'],
+            'url': info.get('webpage_url') or query,
+            'title': info['title'],
+            'artist': info['uploader'],
+            'duration': int(info['duration']),
+        }
+
+    def _extract(self, query: str) -> dict:
+        ydl_opts = {'format': 'bestaudio/best', 'default_search': 'ytsearch', 'quiet': True}
+        youtube_dl = load_youtube_dl()
+        with youtube_dl.YoutubeDL(ydl_opts) as ydl:
+            return ydl.extract_info(query, download=False)
+
+
+class SpotifyResolver(Resolver):
+    """Resolves Spotify links through the Spotify Web API."""
+
+    name = 'spotify'
+    TOKEN_URL = 'https://accounts.spotify.com/api/token'
+    API_URL = 'https://api.spotify.com/v1'
+
+    def __init__(self, http: HTTPPool, client_id: Optional[str], client_secret: Optional[str]):
+        self.http = http
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self._token: Optional[str] = None
+        self._token_expires = 0.0
+
+    def matches(self, query: str) -> bool:
+        return 'spotify.com' in query
+
+    async def _access_token(self) -> str:
+        """Returns a client credentials token, requesting a new one shortly before the old one expires."""
+        if self._token is None or time.monotonic() >= self._token_expires:
+            aiohttp = load_aiohttp()
+            data = await self.http.post_json(
+                self.TOKEN_URL,
+                data={'grant_type': 'client_credentials'},
+                auth=aiohttp.BasicAuth(self.client_id or '', self.client_secret or '')
+            )
+            self._token = data['access_token']
+            self._token_expires = time.monotonic() + data['expires_in'] - 60
+        return self._token
+
+    async def resolve(self, query: str) -> dict:
+        headers = {'Authorization': f"Bearer {await self._access_token()}"}
+        aiohttp = load_aiohttp()
+        match = re.search(r'spotify\.com/track/([A-Za-z0-9]+)', query)
+        try:
+            if match:
+                track = await self.http.get_json(f"{self.API_URL}/tracks/{match.group(1)}", headers=headers)
+            else:
+                results = await self.http.get_json(
+                    f"{self.API_URL}/search", params={'q': query, 'type': 'track', 'limit': 1}, headers=headers
+                )
+                if not results['tracks']['items']:
+                    raise TrackNotFoundError("No results found on Spotify.")
+                track = results['tracks']['items'][0]
+        except aiohttp.ClientResponseError as e:
+            if e.status in (400, 404):
+                raise TrackNotFoundError("No results found on Spotify.")
+            raise
+        return {
+            'source': track['external_urls']['spotify'],
+            'url': track['external_urls']['spotify'],
+            'title': track['name'],
+            'artist': track['artists'][0]['name'],
+            'duration': int(track['duration_ms'] / 1000),
+        }
+
+
+class SoundCloudResolver(Resolver):
+    """Resolves SoundCloud links and searches through the SoundCloud API."""
+
+    name = 'soundcloud'
+    API_URL = 'https://api.soundcloud.com'
+
+    def __init__(self, http: HTTPPool, client_id: Optional[str], client_secret: Optional[str]):
+        self.http = http
+        self.client_id = client_id
+        self.client_secret = client_secret
+
+    def matches(self, query: str) -> bool:
+        return 'soundcloud.com' in query
+
+    async def resolve(self, query: str) -> dict:
+        params = {'client_id': self.client_id or ''}
+        aiohttp = load_aiohttp()
+        try:
+            if self.matches(query):
+                params['url'] = query
+                track = await self.http.get_json(f"{self.API_URL}/resolve", params=params)
+            else:
+                params.update(q=query, limit=1)
+                results = await self.http.get_json(f"{self.API_URL}/tracks", params=params)
+                if isinstance(results, dict):
+                    results = results.get('collection', [])
+                if not results:
+                    raise TrackNotFoundError("No results found on SoundCloud.")
+                track = results[0]
+        except aiohttp.ClientResponseError as e:
+            if e.status == 404:
+                raise TrackNotFoundError("No results found on SoundCloud.")
+            raise
+        return {
+            'source': track['permalink_url'],
+            'url': track['permalink_url'],
+            'title': track['title'],
+            'artist': track['user']['username'],
+            'duration': int(track['duration'] / 1000),
+        }
+
+
+class DirectResolver(Resolver):
+    """
+    Resolves direct HTTP links to audio files without any provider API.
+
+    Local files are only played when explicitly allowed, since a member could
+    otherwise probe or play any file the bot's user can read.
+    """
+
+    name = 'direct'
+
+    def __init__(self, allow_local_files: bool = False):
+        """
+        Initializes the resolver.
+
+        Args:
+            allow_local_files: Whether file paths and file:// URLs may be played.
+        """
+        self.allow_local_files = allow_local_files
+
+    def matches(self, query: str) -> bool:
+        parsed = urlparse(query)
+        if parsed.scheme in ('http', 'https'):
+            return parsed.path.lower().endswith(AUDIO_EXTENSIONS)
+        if parsed.scheme == 'file':
+            # Claimed even when disabled, so the URL is rejected rather than searched for.
+            return True
+        return self.allow_local_files and os.path.isfile(query)
+
+    async def resolve(self, query: str) -> dict:
+        parsed = urlparse(query)
+        if parsed.scheme not in ('http', 'https'):
+            if not self.allow_local_files:
+                raise TrackNotFoundError("Playing local files is disabled.")
+            if parsed.scheme == 'file':
+                query = unquote(parsed.path)
+            if not os.path.isfile(query):
+                raise TrackNotFoundError(f"File not found: {query}")
+        title = os.path.splitext(os.path.basename(unquote(urlparse(query).path) or query))[0]
+        return {
+            'source': query,
+            'url': query,
+            'title': title or query,
+            'artist': 'Unknown',
+            'duration': 0,
+        }
+
+
+class CircuitBreaker:
+    """Stops calling a backend after repeated failures and probes it again after a cool-down."""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Initializes the circuit breaker.
+
+        Args:
+            failure_threshold: The number of consecutive failures that open the circuit.
+            reset_timeout: How long the circuit stays open before a trial call is allowed.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_running = False
+
+    def allow(self) -> bool:
+        """Returns whether a call may be made right now."""
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            # Let exactly one call through to probe the backend.
+            if self.trial_running:
+                return False
+            self.trial_running = True
+        return self.state != self.OPEN
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_running = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def record_abandoned(self):
+        """Records a call that was cancelled before it told anything about the backend."""
+        self.trial_running = False
+
+
+class Backend:
+    """A registered resolver together with its concurrency limit, timeout and health state."""
+
+    def __init__(self, resolver: Resolver, max_concurrency: int = 4, max_waiting: int = 16,
+                 timeout: float = 15.0, fallback: Optional[str] = None,
+                 breaker: Optional[CircuitBreaker] = None):
+        """
+        Initializes the backend.
+
+        Args:
+            resolver: The resolver doing the actual lookups.
+            max_concurrency: The number of lookups allowed to run at the same time.
+            max_waiting: The number of lookups allowed to wait for a free slot before failing fast.
+            timeout: How long a single lookup may take, including the wait for a slot.
+            fallback: The name of the backend to try when this one is unavailable.
+            breaker: The circuit breaker guarding the backend.
+        """
+        self.resolver = resolver
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.fallback = fallback
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyTracker()
+        self.waiting = 0
+        self.stats = {'calls': 0, 'failures': 0, 'timeouts': 0, 'rejected': 0}
+
+    @property
+    def name(self) -> str:
+        return self.resolver.name
+
+    async def resolve(self, query: str) -> dict:
+        """
+        Resolves a query while enforcing the backend's limits.
+
+        Raises:
+            ResolverUnavailableError: If the circuit is open, the backend is saturated or the lookup failed.
+            TrackNotFoundError: If the backend has no result for the query.
+        """
+        if self.waiting >= self.max_waiting or not self.breaker.allow():
+            self.stats['rejected'] += 1
+            raise ResolverUnavailableError(f"{self.name} is currently unavailable.")
+
+        self.stats['calls'] += 1
+        self.waiting += 1
+        start = time.monotonic()
+        try:
+            song = await asyncio.wait_for(self._run(query), self.timeout)
+            self.breaker.record_success()
+            return song
+        except TrackNotFoundError:
+            # The provider answered, it just had nothing for us.
+            self.breaker.record_success()
+            raise
+        except asyncio.CancelledError:
+            # Otherwise a cancelled half-open trial would keep the circuit from ever closing again.
+            self.breaker.record_abandoned()
+            raise
+        except asyncio.TimeoutError:
+            self.stats['timeouts'] += 1
+            self.breaker.record_failure()
+            raise ResolverUnavailableError(f"{self.name} did not respond in time.")
+        except Exception as e:
+            self.stats['failures'] += 1
+            self.breaker.record_failure()
+            raise ResolverUnavailableError(f"Error searching {self.name}: {e}")
+        finally:
+            self.waiting -= 1
+            self.latency.record(time.monotonic() - start)
+
+    async def _run(self, query: str) -> dict:
+        await self.semaphore.acquire()
+        lookup = asyncio.ensure_future(self.resolver.resolve(query))
+        lookup.add_done_callback(self._lookup_done)
+        # A lookup that times out keeps its slot until it has really finished. An extraction
+        # in an executor thread cannot be cancelled, so giving the slot back early would let
+        # a slow backend pile up far more than max_concurrency of them.
+        return await asyncio.shield(lookup)
+
+    def _lookup_done(self, lookup: asyncio.Future):
+        self.semaphore.release()
+        if not lookup.cancelled():
+            lookup.exception()  # Abandoned lookups must not be logged as never retrieved
+
+
+class ResolverRegistry:
+    """Routes queries to the backend responsible for them and falls back when a backend is degraded."""
+
+    def __init__(self):
+        self.backends: Dict[str, Backend] = {}
+        self.default: Optional[str] = None
+        # Concurrent requests for the same track share one lookup.
+        self.flights = SingleFlight()
+
+    def register(self, resolver: Resolver, default: bool = False, **policy) -> Backend:
+        """
+        Registers a resolver.
+
+        Args:
+            resolver: The resolver to register. Resolvers are matched in registration order.
+            default: Whether the resolver handles queries no other resolver matches.
+            policy: Keyword arguments passed on to Backend.
+
+        Returns:
+            The created backend.
+        """
+        backend = Backend(resolver, **policy)
+        self.backends[resolver.name] = backend
+        if default or self.default is None:
+            self.default = resolver.name
+        return backend
+
+    def backend_for(self, query: str) -> Backend:
+        """Returns the backend responsible for a query."""
+        for backend in self.backends.values():
+            if backend.resolver.matches(query):
+                return backend
+        if self.default is None:
+            raise MusicError("No music backends are configured.")
+        return self.backends[self.default]
+
+    async def resolve(self, query: str) -> dict:
+        """
+        Resolves a query, trying fallback backends while the responsible one is unavailable.
+
+        Only search text falls back; a link is resolved by its own backend or not at all.
+
+        Args:
+            query: The URL or search query.
+
+        Returns:
+            The resolved song. Callers each receive their own copy.
+        """
+        song = await self.flights.do(normalize_query(query), lambda: self._resolve(query))
+        return dict(song)
+
+    async def _resolve(self, query: str) -> dict:
+        backend = self.backend_for(query)
+        tried: List[str] = []
+        while True:
+            tried.append(backend.name)
+            try:
+                return await backend.resolve(query)
+            except ResolverUnavailableError:
+                # A fallback can run the same search, but a link only ever points at one provider.
+                if backend.fallback is None or backend.fallback in tried or is_link(query):
+                    raise
+                backend = self.backends[backend.fallback]
+
+    def report(self) -> str:
+        """Formats the health and latency of every backend."""
+        lines = []
+        for backend in self.backends.values():
+            lines.append(
+                f"{backend.name}: {backend.breaker.state}, "
+                f"p50 {backend.latency.percentile(50) * 1000:.0f} ms, "
+                f"p95 {backend.latency.percentile(95) * 1000:.0f} ms, "
+                f"{backend.stats['calls']} calls, {backend.stats['failures']} failures, "
+                f"{backend.stats['timeouts']} timeouts, {backend.stats['rejected']} rejected"
+            )
+        lines.append(self.flights.report())
+        return '\n'.join(lines)
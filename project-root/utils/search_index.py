@@ -0,0 +1,193 @@
+import re
+import time
+from typing import List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from utils.database import Database
+from utils.metrics import LatencyTracker
+
+_TOKEN = re.compile(r'\w+')
+_BRACKETS = re.compile(r'[(\[].*?[)\]]')
+
+
+def tokenize(text: str) -> List[str]:
+    """Splits text into lowercase word tokens."""
+    return _TOKEN.findall(text.lower())
+
+
+class SearchIndex:
+    """
+    Answers search queries for previously resolved tracks from the local database.
+
+    Every resolved track is stored in an SQLite FTS5 index over its title and
+    artist. A query is a strong match when all of its words appear in a track
+    (the last one as a prefix, since it may still be typed) and they cover most
+    of the track's title, ignoring bracketed parts such as "(Official Video)".
+    Strong matches are played without asking a provider; everything else falls
+    through to the remote search.
+
+    Tracks played from local files are only returned while local files are
+    allowed, so the index never hands out a path the resolvers would refuse.
+    """
+
+    def __init__(self, database: Database, allow_local_files: bool = False, min_coverage: float = 0.6,
+                 expiry_margin: float = 60.0):
+        """
+        Initializes the index.
+
+        Args:
+            database: The database the tracks are stored in.
+            allow_local_files: Whether tracks played from file paths and file:// URLs may be returned.
+            min_coverage: The share of a track's title words a query must contain to be a strong match.
+            expiry_margin: Seconds before a source's expiry time from which it is no longer reused.
+        """
+        self.database = database
+        self.allow_local_files = allow_local_files
+        self.min_coverage = min_coverage
+        self.expiry_margin = expiry_margin
+        self.latency = LatencyTracker()
+        self.stats = {'hits': 0, 'misses': 0, 'expired': 0}
+
+    def add(self, song: dict):
+        """Stores a resolved song so later queries can find it."""
+        self.database.add_track(song['url'], song['source'], song['title'], song['artist'], song['duration'])
+
+    def lookup(self, query: str) -> Optional[dict]:
+        """
+        Finds the track a query refers to, if it is a strong match.
+
+        Args:
+            query: The URL or search query.
+
+        Returns:
+            The stored song, or None if the index has no strong match.
+        """
+        start = time.perf_counter()
+        song = self._lookup(query)
+        self.latency.record(time.perf_counter() - start)
+        if song is None:
+            self.stats['misses'] += 1
+        else:
+            self.stats['hits'] += 1
+        return song
+
+    def _lookup(self, query: str) -> Optional[dict]:
+        query = query.strip()
+        if '://' in query or query.startswith('/'):
+            row = self.database.get_track(query)
+            return _song(row) if row and self._playable(row) else None
+
+        words = tokenize(query)
+        match = _match_expression(words)
+        if match is None:
+            return None
+        for row in self.database.search_tracks(match, limit=5):
+            if self._playable(row) and self._is_strong(words, row[2] or '', row[3] or ''):
+                return _song(row)
+        return None
+
+    def _is_strong(self, words: List[str], title: str, artist: str) -> bool:
+        """Checks whether the query words cover enough of the track's title."""
+        artist_words = set(tokenize(artist))
+        title_words = [word for word in tokenize(_BRACKETS.sub(' ', title)) if word not in artist_words]
+        if not title_words:
+            title_words = tokenize(title)
+        *complete, last = words
+        covered = {word for word in title_words if word in complete or word.startswith(last)}
+        return len(covered) / len(title_words) >= self.min_coverage
+
+    def suggest(self, text: str, limit: int = 25) -> List[dict]:
+        """
+        Suggests tracks for partially typed text, for example for autocomplete.
+
+        Args:
+            text: What the user has typed so far.
+            limit: The maximum number of suggestions.
+
+        Returns:
+            The matching songs, best matches first.
+        """
+        match = _match_expression(tokenize(text))
+        if match is None:
+            return []
+        return [_song(row) for row in self.database.search_tracks(match, limit) if self._playable(row)]
+
+    def _playable(self, row: tuple) -> bool:
+        """Checks whether a stored track may be returned, given whether local files are allowed."""
+        return self.allow_local_files or urlparse(row[1]).scheme in ('http', 'https')
+
+    def is_fresh(self, song: dict) -> bool:
+        """
+        Checks whether a stored source can still be played.
+
+        Stream URLs of some providers (YouTube's among them) carry their expiry
+        time in an "expire" query parameter. Sources without one are assumed
+        not to expire.
+        """
+        expire = parse_qs(urlparse(song['source']).query).get('expire')
+        if not expire:
+            return True
+        try:
+            fresh = float(expire[0]) - self.expiry_margin > time.time()
+        except ValueError:
+            fresh = False
+        if not fresh:
+            self.stats['expired'] += 1
+        return fresh
+
+    def report(self) -> str:
+        """Formats the hit rate and latency of local lookups."""
+        return (
+            f"search index: {self.stats['hits']} hits, {self.stats['misses']} misses, "
+            f"{self.stats['expired']} expired sources, "
+            f"p50 {self.latency.percentile(50) * 1000:.2f} ms, p99 {self.latency.percentile(99) * 1000:.2f} ms"
+        )
+
+
+def _match_expression(words: List[str]) -> Optional[str]:
+    """Builds an FTS5 query requiring every word, treating the last one as a prefix."""
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _song(row: tuple) -> dict:
+    url, source, title, artist, duration = row
+    return {'source': source, 'url': url, 'title': title, 'artist': artist, 'duration': duration}
+
+
+def benchmark(tracks: int = 20000, queries: int = 2000):
+    """Measures lookup latency on an in-memory index of generated tracks."""
+    import random
+
+    rng = random.Random(0)
+    vocabulary = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(3, 9)))
+                  for _ in range(5000)]
+    database = Database(':memory:')
+    database.connect()
+    index = SearchIndex(database)
+    titles = []
+    for number in range(tracks):
+        title = ' '.join(rng.choice(vocabulary) for _ in range(rng.randint(2, 6)))
+        artist = ' '.join(rng.choice(vocabulary) for _ in range(rng.randint(1, 2)))
+        titles.append(title)
+        index.add({'source': f'https://example.com/{number}.mp3', 'url': f'https://example.com/track/{number}',
+                   'title': f'{artist} - {title} (Official Video)', 'artist': artist, 'duration': 200})
+
+    hits = 0
+    samples = []
+    for _ in range(queries):
+        query = rng.choice(titles)
+        query = query[:max(len(query) - rng.randint(0, 3), 1)]  # Still typing the last word
+        start = time.perf_counter()
+        hits += index.lookup(query) is not None
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    print(f"{tracks} tracks: {hits} of {queries} queries matched, "
+          f"p50 {samples[len(samples) // 2] * 1000:.3f} ms, p99 {samples[int(len(samples) * 0.99)] * 1000:.3f} ms")
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,58 @@
+from typing import Callable, Optional
+
+from utils.mixer_input import MixerInput
+from utils.song_queue import SongQueue
+from utils.startup import startup
+
+
+class GuildSession:
+    """The playback state of a single guild: its queue, voice connection and mixer."""
+
+    def __init__(self, guild_id: int):
+        """
+        Initializes the session.
+
+        Args:
+            guild_id: The ID of the guild the session belongs to.
+        """
+        self.guild_id = guild_id
+        self.queue = SongQueue()
+        self.current_song: Optional[dict] = None
+        self.voice_client = None
+        # The text channel the session was started from, for announcements.
+        self.channel = None
+        self.music_player = None
+        # The mixer input of the current song; sound effects are separate inputs.
+        self.main_input: Optional[MixerInput] = None
+        # The DSP chain and mixer import NumPy, which is left until the first session needs it.
+        self.dsp = startup.import_module('utils.dsp').DSPChain()
+        self.mixer = startup.import_module('utils.mixer').Mixer(self.dsp)
+        self.player_source = None
+        self.encoder_session = None
+        # The session on an audio node when audio is offloaded, which then provides the mixer and DSP chain.
+        self.node = None
+        # Set by the cog that owns the session and rebound when the cog is reloaded.
+        self.on_stream_end: Optional[Callable[['GuildSession', object], None]] = None
+        self.on_song_end: Optional[Callable[['GuildSession', MixerInput], None]] = None
+
+    @property
+    def connected(self) -> bool:
+        """Whether the session has a live voice connection."""
+        return self.voice_client is not None and self.voice_client.is_connected()
+
+    def use_node(self, node):
+        """
+        Moves the session's audio to a session on an audio node, keeping the DSP settings made so far.
+
+        Args:
+            node: An open RemoteSession.
+        """
+        node.dsp.set_volume(self.dsp.target_volume)
+        for band, gain in self.dsp.eq_gains.items():
+            if gain:
+                node.dsp.set_eq(band, gain)
+        if not self.dsp.limiter_enabled:
+            node.dsp.limiter_enabled = False
+        self.node = node
+        self.mixer = node.mixer
+        self.dsp = node.dsp
@@ -0,0 +1,55 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into one underlying call.
+
+    The first caller for a key starts the call; everyone who asks for the same
+    key while it is running waits for it and receives the same result or
+    error. Once the call finishes, the next request for the key starts a new
+    one, so results are never cached beyond the call itself.
+    """
+
+    def __init__(self):
+        self.flights: Dict[Hashable, asyncio.Future] = {}
+        self.stats = {'calls': 0, 'executions': 0, 'collapsed': 0, 'errors': 0}
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Runs a call unless one for the same key is already in flight.
+
+        Args:
+            key: Identifies calls that are interchangeable.
+            call: A function returning the awaitable to run when no call for the key is in flight.
+
+        Returns:
+            The result of the shared call.
+        """
+        self.stats['calls'] += 1
+        flight = self.flights.get(key)
+        if flight is None:
+            self.stats['executions'] += 1
+            flight = asyncio.ensure_future(call())
+            self.flights[key] = flight
+            flight.add_done_callback(lambda done: self._land(key, done))
+        else:
+            self.stats['collapsed'] += 1
+        # A caller that gives up must not cancel the call for everyone else.
+        return await asyncio.shield(flight)
+
+    def _land(self, key: Hashable, flight: asyncio.Future):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+        if flight.cancelled():
+            return
+        if flight.exception() is not None:
+            self.stats['errors'] += 1
+
+    def report(self) -> str:
+        """Formats how many calls were collapsed into a shared one."""
+        return (
+            f"single flight: {self.stats['calls']} calls, {self.stats['executions']} executed, "
+            f"{self.stats['collapsed']} collapsed, {self.stats['errors']} failed, {len(self.flights)} in flight"
+        )
@@ -0,0 +1,41 @@
+import asyncio
+from typing import List
+
+
+class SongQueue(asyncio.Queue):
+    """An asyncio.Queue of songs that keeps track of when its contents change."""
+
+    def __init__(self, maxsize: int = 0):
+        super().__init__(maxsize)
+        self.version = 0
+        self._snapshot: List[dict] = []
+        self._snapshot_version = 0
+
+    def _put(self, item):
+        super()._put(item)
+        self.version += 1
+
+    def _get(self):
+        item = super()._get()
+        self.version += 1
+        return item
+
+    def clear(self):
+        """Removes every song from the queue."""
+        self._queue.clear()
+        self.version += 1
+
+    def snapshot(self) -> List[dict]:
+        """
+        Returns the queued songs as a list.
+
+        The list is rebuilt only when the queue changed since the last call, so
+        repeated reads of an unchanged queue are O(1).
+
+        Returns:
+            The queued songs in playback order. The list must not be modified.
+        """
+        if self._snapshot_version != self.version:
+            self._snapshot = list(self._queue)
+            self._snapshot_version = self.version
+        return self._snapshot
@@ -0,0 +1,69 @@
+import importlib
+import sys
+import time
+from contextlib import contextmanager
+from types import ModuleType
+from typing import List, Optional, Tuple
+
+
+class StartupReport:
+    """Records how long imports and initialization steps take during startup."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.ready_after: Optional[float] = None
+        self.entries: List[Tuple[str, str, float]] = []
+
+    @contextmanager
+    def timed(self, kind: str, name: str):
+        """
+        Times a block of code and records it in the report.
+
+        Args:
+            kind: The category of the step, e.g. 'import' or 'init'.
+            name: The module or component being timed.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.entries.append((kind, name, time.perf_counter() - start))
+
+    def import_module(self, name: str) -> ModuleType:
+        """
+        Imports a module on first use and records the import cost.
+
+        Args:
+            name: The dotted name of the module.
+
+        Returns:
+            The imported module.
+        """
+        module = sys.modules.get(name)
+        if module is not None:
+            return module
+        with self.timed('import', name):
+            return importlib.import_module(name)
+
+    def mark_ready(self):
+        """Records the time until the bot became ready. Only the first call counts."""
+        if self.ready_after is None:
+            self.ready_after = time.perf_counter() - self.started
+
+    def render(self) -> str:
+        """
+        Formats the report, slowest steps first.
+
+        Returns:
+            The report as a multi-line string.
+        """
+        lines = []
+        if self.ready_after is not None:
+            lines.append(f"Time to ready: {self.ready_after * 1000:.1f} ms")
+        for kind, name, seconds in sorted(self.entries, key=lambda entry: entry[2], reverse=True):
+            lines.append(f"{kind:<7} {name:<30} {seconds * 1000:8.1f} ms")
+        return '\n'.join(lines)
+
+
+# Shared by main.py and the cogs so lazy imports after startup show up in the same report.
+startup = StartupReport()